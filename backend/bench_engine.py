@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""狼人杀引擎规模基准测试
+
+用进程内存储代替 Redis 客户端（仍经过 redis_service 的序列化和线程池），
+测量不同人数板子下各阶段的引擎开销，验证随人数线性增长：
+  - night_result: 夜晚结算（守卫/狼刀/女巫毒）
+  - vote_result:  投票统计与出局
+  - wolf_prompts: 狼人行动私信扇出
+  - voting_fanout: 进入投票阶段并向所有连接广播房间状态
+
+用法: python bench_engine.py [--sizes 12,16,20,24,30] [--rounds 30]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from models.game import GamePhase, PlayerRole
+from models.game_state import RoomState, PlayerState
+from services.redis_service import redis_service
+from services.role_presets import role_preset_registry
+from services.werewolf_service import WerewolfService
+
+
+class _MemoryPipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def rpush(self, key, value):
+        self.ops.append(("rpush", key, value))
+
+    def set(self, key, value, ex=None):
+        self.ops.append(("set", key, value))
+
+    def get(self, key):
+        self.ops.append(("get", key))
+
+    def xadd(self, key, fields):
+        self.ops.append(("xadd", key, fields))
+
+    def expire(self, key, ex):
+        self.ops.append(("expire", key, ex))
+
+    def delete(self, key):
+        self.ops.append(("delete", key))
+
+    def execute(self):
+        self.store.ops += 1
+        results = []
+        for op in self.ops:
+            if op[0] == "rpush":
+                lst = self.store.lists.setdefault(op[1], [])
+                lst.append(op[2])
+                results.append(len(lst))
+            elif op[0] == "delete":
+                self.store.lists.pop(op[1], None)
+                results.append(1)
+            elif op[0] == "set":
+                self.store.values[op[1]] = op[2]
+                results.append(True)
+            elif op[0] == "get":
+                results.append(self.store.values.get(op[1]))
+            elif op[0] == "xadd":
+                stream = self.store.streams.setdefault(op[1], [])
+                stream.append((f"{len(stream) + 1}-0", op[2]))
+                results.append(stream[-1][0])
+            else:
+                results.append(True)
+        return results
+
+
+class _MemoryRedis:
+    """进程内的最小 Redis 替身（只实现 redis_service 用到的命令），统计往返次数"""
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.streams = {}
+        self.ops = 0
+
+    def ping(self):
+        return True
+
+    def set(self, key, value, ex=None):
+        self.ops += 1
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        self.ops += 1
+        return self.values.get(key)
+
+    def delete(self, key):
+        self.ops += 1
+        return int(self.values.pop(key, None) is not None or self.lists.pop(key, None) is not None)
+
+    def exists(self, key):
+        self.ops += 1
+        return int(key in self.values or key in self.lists)
+
+    def pipeline(self):
+        return _MemoryPipeline(self)
+
+    def lrange(self, key, start, end):
+        self.ops += 1
+        lst = self.lists.get(key, [])
+        n = len(lst)
+        if start < 0:
+            start = max(0, n + start)
+        end = n + end if end < 0 else min(end, n - 1)
+        return lst[start:end + 1]
+
+    def llen(self, key):
+        self.ops += 1
+        return len(self.lists.get(key, []))
+
+    def xlen(self, key):
+        self.ops += 1
+        return len(self.streams.get(key, []))
+
+    def xrange(self, key, start="-", end="+", count=None):
+        self.ops += 1
+        stream = self.streams.get(key, [])
+        if start == "-":
+            return list(stream)
+        seq = int(start.split("-")[0])
+        return [e for e in stream if int(e[0].split("-")[0]) >= seq]
+
+
+async def _no_sleep(delay, result=None):
+    """去掉主持节奏用的等待，只测引擎开销"""
+    await _real_sleep(0)
+    return result
+
+_real_sleep = asyncio.sleep
+
+
+def build_room(room_id: str, size: int, rng: random.Random) -> RoomState:
+    """按板子构建一局已分配身份的房间（全部为真人玩家，不触发AI调用）"""
+    preset = role_preset_registry.resolve(None, size)
+    roles = preset.build_roles()
+    rng.shuffle(roles)
+    players = [PlayerState(user_id=f"u{i:03d}", username=f"玩家{i + 1}", role=role) for i, role in enumerate(roles)]
+    room = RoomState(room_id=room_id, players=players, max_players=size)
+    room.night_count = 2
+    room.day_count = 1
+    return room
+
+
+def prepare_night(room: RoomState, rng: random.Random):
+    room.phase = GamePhase.NIGHT
+    good = [p for p in room.alive if p.role != PlayerRole.WOLF]
+    target = rng.choice(good).user_id
+    room.night_actions = {
+        "guard": {"target": rng.choice(good).user_id},
+        "wolf": {"votes": {w.user_id: target for w in room.wolves}, "target": target},
+        "witch": {"action": "poison", "poison_used": True, "poison_target": rng.choice(good).user_id},
+    }
+
+
+def prepare_vote(room: RoomState, rng: random.Random):
+    room.phase = GamePhase.VOTING
+    alive = room.alive
+    favourite = rng.choice(alive).user_id
+    for p in alive:
+        p.voted = True
+        p.vote_target = favourite if rng.random() < 0.6 else rng.choice(alive).user_id
+
+
+async def bench_case(service: WerewolfService, store: _MemoryRedis, size: int, rounds: int, case: str, connections: list):
+    rng = random.Random(size)
+    total = 0.0
+    ops = 0
+    for i in range(rounds):
+        room_id = f"bench_{case}_{size}_{i}"
+        room = build_room(room_id, size, rng)
+        if case == "night_result":
+            prepare_night(room, rng)
+        elif case == "vote_result":
+            prepare_vote(room, rng)
+        await redis_service.set_room_data(room_id, room.to_dict())
+        room = await service.get_room(room_id, check_timeout=False)
+
+        ops_before = store.ops
+        start = time.perf_counter()
+        if case == "night_result":
+            await service._process_night_result(room)
+        elif case == "vote_result":
+            await service._process_voting_result(room)
+        elif case == "wolf_prompts":
+            await service._process_wolf_phase(room)
+        elif case == "voting_fanout":
+            await service._start_voting_phase(room)
+        total += time.perf_counter() - start
+        ops += store.ops - ops_before
+        connections.clear()
+    return total / rounds, ops / rounds
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="狼人杀引擎规模基准测试")
+    parser.add_argument("--sizes", default="12,16,20,24,30", help="玩家人数列表，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=30, help="每种人数的测量轮数")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    store = _MemoryRedis()
+    redis_service.redis_client = store
+    asyncio.sleep = _no_sleep
+
+    service = WerewolfService()
+    connections = []
+    current_size = [0]
+
+    async def fanout(message: str, room_key: str):
+        # 模拟房间内每个连接各发送一次
+        for _ in range(current_size[0]):
+            connections.append(message)
+
+    async def send_private(room_id: str, user_id: str, message: str):
+        connections.append(message)
+
+    service.set_broadcast_callback(fanout)
+    service.set_send_private_message_callback(send_private)
+
+    cases = ["night_result", "vote_result", "wolf_prompts", "voting_fanout"]
+    results = {}
+    print("=" * 72)
+    print(f"{'阶段':<16}{'人数':>6}{'耗时/轮(ms)':>14}{'每人(us)':>12}{'存储往返/轮':>14}")
+    print("-" * 72)
+    for case in cases:
+        for size in sizes:
+            current_size[0] = size
+            await bench_case(service, store, size, 3, case, connections)  # 预热
+            seconds, ops = await bench_case(service, store, size, args.rounds, case, connections)
+            results[(case, size)] = seconds
+            print(f"{case:<16}{size:>6}{seconds * 1000:>14.3f}{seconds / size * 1e6:>12.1f}{ops:>14.1f}")
+        print("-" * 72)
+
+    # 线性检验：每人开销在最大和最小人数之间的比值
+    print("线性检验（最大人数每人开销 / 最小人数每人开销，≤1.5 视为线性）:")
+    ok = True
+    lo, hi = min(sizes), max(sizes)
+    for case in cases:
+        ratio = (results[(case, hi)] / hi) / (results[(case, lo)] / lo)
+        passed = ratio <= 1.5
+        ok = ok and passed
+        print(f"  {case:<16}{ratio:>8.2f}  {'✓ 线性' if passed else '✗ 超线性'}")
+    print("=" * 72)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.CRITICAL)
+    sys.exit(asyncio.run(main()))
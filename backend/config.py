@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +11,67 @@ class Config:
     REDIS_DB = int(os.getenv("REDIS_DB", 0))
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 1998))
+    # 数据文件热更新轮询间隔（秒），0 表示关闭
+    CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", 2))
+    # 狼人杀房间人数上限（自动配置房间）
+    WEREWOLF_MAX_PLAYERS = int(os.getenv("WEREWOLF_MAX_PLAYERS", 30))
+    # 多进程部署：工作进程ID（默认 主机名:端口，重启后保持不变以便继续持有租约）和对外地址
+    WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{PORT}"
+    WORKER_URL = os.getenv("WORKER_URL", f"http://localhost:{PORT}")
+    # 工作进程心跳间隔与存活判定时间、房间租约时长（秒）
+    WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 5))
+    WORKER_TTL = int(os.getenv("WORKER_TTL", 15))
+    ROOM_LEASE_TTL = int(os.getenv("ROOM_LEASE_TTL", 15))
+    # 房间事件流：每隔多少条事件写一次完整快照、事件流保留时间（秒）、超过多少条时裁掉最新快照之前的事件、
+    # 内存中保留上次保存状态（用于计算补丁）的房间数
+    EVENT_SNAPSHOT_INTERVAL = int(os.getenv("EVENT_SNAPSHOT_INTERVAL", 50))
+    EVENT_LOG_TTL = int(os.getenv("EVENT_LOG_TTL", 86400))
+    EVENT_LOG_MAX_LEN = int(os.getenv("EVENT_LOG_MAX_LEN", 5000))
+    EVENT_LOG_CACHE_ROOMS = int(os.getenv("EVENT_LOG_CACHE_ROOMS", 1000))
+    # WebSocket：每个房间保留的出站帧数（断线重连补发）、保留帧日志的房间数、单连接发送队列上限
+    WS_FRAME_LOG_SIZE = int(os.getenv("WS_FRAME_LOG_SIZE", 500))
+    WS_FRAME_LOG_ROOMS = int(os.getenv("WS_FRAME_LOG_ROOMS", 1000))
+    WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 1000))
+    # 出站帧合并窗口（毫秒）与单个 batch 帧最多合并的帧数（客户端 coalesce=1 时生效）
+    WS_COALESCE_MS = int(os.getenv("WS_COALESCE_MS", 15))
+    WS_COALESCE_MAX_FRAMES = int(os.getenv("WS_COALESCE_MAX_FRAMES", 200))
+    # 是否接受客户端的 permessage-deflate 压缩协商；压缩率统计每隔多少帧抽样一次
+    WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    WS_COMPRESSION_SAMPLE = int(os.getenv("WS_COMPRESSION_SAMPLE", 20))
+    # 应用层心跳间隔（秒）与连续未响应多少次后断开连接
+    WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", 20))
+    WS_PING_MISSES = int(os.getenv("WS_PING_MISSES", 3))
+    # 事件循环延迟采样间隔（秒），0 表示关闭
+    METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 0.5))
+    # 阶段时间线追踪：是否记录、导出目录（为空时只保留在内存中）、每个房间保留的跨度数、内存中保留的房间数
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+    TRACE_DIR = os.getenv("TRACE_DIR", "")
+    TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 20000))
+    TRACE_MAX_ROOMS = int(os.getenv("TRACE_MAX_ROOMS", 200))
+    # 白天AI发言调度：玩家停顿多少秒后触发、每次触发最多几名AI发言、每名AI每天发言上限、AI发言之间的间隔（秒）
+    AI_SPEECH_DEBOUNCE = float(os.getenv("AI_SPEECH_DEBOUNCE", 2.0))
+    AI_SPEECH_PER_TRIGGER = int(os.getenv("AI_SPEECH_PER_TRIGGER", 2))
+    AI_SPEECH_MAX_PER_DAY = int(os.getenv("AI_SPEECH_MAX_PER_DAY", 3))
+    AI_SPEECH_GAP_MIN = float(os.getenv("AI_SPEECH_GAP_MIN", 1.0))
+    AI_SPEECH_GAP_MAX = float(os.getenv("AI_SPEECH_GAP_MAX", 3.0))
+    # 每天白天讨论开始时开场发言的AI数量；是否在夜晚结算时预生成遗言和开场发言
+    AI_OPENING_SPEECHES = int(os.getenv("AI_OPENING_SPEECHES", 2))
+    AI_PREGENERATE = os.getenv("AI_PREGENERATE", "true").lower() == "true"
+    # AI投票方式：bot 由本地怀疑度矩阵决定（大模型只用于发言），llm 由大模型决定；夜间行动和猎人开枪始终由本地决定
+    AI_DECISION_MODE = os.getenv("AI_DECISION_MODE", "bot").lower()
+    # AI提示词中对局记录（死亡、投票、身份声明）的token预算，超出时优先丢弃较早的投票记录
+    AI_MEMORY_TOKENS = int(os.getenv("AI_MEMORY_TOKENS", 400))
+    # 狼人杀AI调用截止时间：单次调用上限（秒）、在阶段结束前预留的时间（秒）、剩余时间少于多少秒时直接使用兜底结果
+    AI_CALL_TIMEOUT = float(os.getenv("AI_CALL_TIMEOUT", 20.0))
+    AI_DEADLINE_MARGIN = float(os.getenv("AI_DEADLINE_MARGIN", 2.0))
+    AI_MIN_CALL_BUDGET = float(os.getenv("AI_MIN_CALL_BUDGET", 1.5))
+    # 大模型路由：未配置场景使用的模型；按调用场景覆盖默认路由的JSON，如 {"speech": {"model": "qwen-plus", "max_tokens": 200}}
+    AI_MODEL_DEFAULT = os.getenv("AI_MODEL_DEFAULT", "qwen-turbo")
+    AI_MODEL_ROUTES = os.getenv("AI_MODEL_ROUTES", "")
+    # 模型自适应降级：按最近多少次调用统计p95、至少多少个样本才判断、降级后多少秒再尝试主模型
+    AI_ROUTE_WINDOW = int(os.getenv("AI_ROUTE_WINDOW", 50))
+    AI_ROUTE_MIN_SAMPLES = int(os.getenv("AI_ROUTE_MIN_SAMPLES", 10))
+    AI_ROUTE_COOLDOWN = float(os.getenv("AI_ROUTE_COOLDOWN", 120.0))
 
 config = Config()
 
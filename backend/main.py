@@ -1,9 +1,9 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from typing import List, Dict
-import json
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse
+from typing import List, Dict, Optional
+import re
 import uuid
 import os
 import sys
@@ -15,8 +15,16 @@ from config import config
 from services.character_service import character_service
 from services.event_service import event_service
 from services.werewolf_service import werewolf_service
+from services.role_presets import role_preset_registry, AUTO_PRESET_ID
 from services.ai_service import AIService
 from services.redis_service import redis_service
+from services.content_loader import ContentLoader, content_watcher
+from services.room_router import room_router
+from services.connection_manager import manager, encode_frame
+from services.metrics_service import metrics, loop_monitor
+from services.tracing import tracer
+from models.game import GamePhase
+from models.worldview import Worldview
 
 # 配置日志 - 确保所有模块的日志都能输出
 # 先清除所有现有的处理器，避免重复
@@ -108,57 +116,57 @@ async def log_requests(request: Request, call_next):
             content={"detail": f"内部服务器错误: {str(e)}"}
         )
 
-# WebSocket连接管理
-class ConnectionManager:
-    def __init__(self):
-        # 存储格式: {room_id: [(websocket, user_id), ...]}
-        self.active_connections: Dict[str, List[tuple]] = {}
-    
-    async def connect(self, websocket: WebSocket, room_id: str, user_id: str = None):
-        await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append((websocket, user_id))
-    
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        if room_id in self.active_connections:
-            self.active_connections[room_id] = [
-                (ws, uid) for ws, uid in self.active_connections[room_id] if ws != websocket
-            ]
-    
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+# 房间归属路由 - 房间相关请求转发（307）到持有该房间的工作进程
+ROOM_PATH_PATTERN = re.compile(r"^/api/werewolf/room/([^/]+)")
+
+@app.middleware("http")
+async def route_to_room_owner(request: Request, call_next):
+    """房间由其他工作进程负责时重定向过去，保证同一房间的定时器和AI任务只在一个进程中运行"""
+    match = ROOM_PATH_PATTERN.match(request.url.path)
+    if match and request.method != "OPTIONS":
+        owner_url = await room_router.resolve(match.group(1))
+        if owner_url:
+            target = f"{owner_url}{request.url.path}"
+            if request.url.query:
+                target += f"?{request.url.query}"
+            return RedirectResponse(target, status_code=307)
+    return await call_next(request)
+
+# WebSocket 关闭码：房间在其他进程（客户端按 redirect 帧重连）/ 房间归属已转移（客户端重新连接）
+WS_CLOSE_REDIRECT = 4307
+WS_CLOSE_MOVED = 4308
+
+
+def bind_werewolf_callbacks():
+    """让werewolf_service能够通过本进程的WebSocket连接广播消息和发送私有消息"""
+    async def broadcast_message(message: str, room_key: str):
+        await manager.broadcast(message, room_key)
     
-    async def send_personal_message_to_user(self, room_id: str, user_id: str, message: str):
-        """向特定用户发送个人消息"""
-        room_key = f"werewolf_{room_id}"
-        if room_key in self.active_connections:
-            for websocket, ws_user_id in self.active_connections[room_key]:
-                if ws_user_id == user_id:
-                    try:
-                        await websocket.send_text(message)
-                    except Exception as e:
-                        logger.error(f"发送私有消息失败 (房间 {room_id}, 用户 {user_id}): {e}")
+    async def send_private_message(room_id: str, user_id: str, message: str):
+        await manager.send_personal_message_to_user(room_id, user_id, message)
     
-    async def broadcast(self, message: str, room_id: str):
-        if room_id in self.active_connections:
-            for websocket, _ in self.active_connections[room_id]:
-                try:
-                    await websocket.send_text(message)
-                except Exception as e:
-                    logger.error(f"广播消息失败 (房间 {room_id}): {e}")
+    werewolf_service.set_broadcast_callback(broadcast_message)
+    werewolf_service.set_send_private_message_callback(send_private_message)
 
-manager = ConnectionManager()
+async def release_werewolf_room(room_id: str):
+    """房间归属转移：停止本地驱动并断开连接，客户端重连后会被重定向到新的归属进程"""
+    await werewolf_service.release_room(room_id)
+    await manager.close_room(f"werewolf_{room_id}", code=WS_CLOSE_MOVED)
 
-async def get_room_data_with_extras(room_id: str):
-    """获取房间数据，包含额外字段（如unlocked_characters）"""
+async def get_room_data_with_extras(room_id: str, validate: bool = False):
+    """获取房间数据，包含额外字段（如unlocked_characters）
+    
+    Args:
+        validate: 是否经过 GameRoom 模型校验后导出（REST接口使用，WebSocket广播直接导出引擎状态）
+    """
     room = await werewolf_service.get_room(room_id)
     if room:
-        room_data = room.model_dump()
-        # 从Redis获取完整的房间数据，包含额外字段
-        full_room_data = await redis_service.get_room_data(room_id)
-        if full_room_data and "unlocked_characters" in full_room_data:
-            room_data["unlocked_characters"] = full_room_data["unlocked_characters"]
+        room_data = room.to_model().model_dump(mode="json") if validate else room.to_dict()
+        # 解锁信息只在游戏结束后存在，单独存储
+        if room.phase == GamePhase.GAME_OVER:
+            unlocked_characters = await redis_service.get_room_unlocked_characters(room_id)
+            if unlocked_characters:
+                room_data["unlocked_characters"] = unlocked_characters
         return room_data
     return None
 
@@ -175,6 +183,26 @@ async def startup_event():
             logger.info("✓ Redis连接正常")
         except Exception as e:
             logger.warning(f"⚠ Redis连接测试失败: {e}")
+        # 接管的房间没有经过开始游戏接口，启动时就绑定回调
+        bind_werewolf_callbacks()
+        # WebSocket 心跳：清理失联连接和空房间
+        manager.start()
+        # 事件循环延迟采样
+        loop_monitor.start()
+        # 登记工作进程，开始房间租约心跳
+        room_router.set_acquire_callback(werewolf_service.resume_room)
+        room_router.set_release_callback(release_werewolf_room)
+        try:
+            await room_router.start()
+        except Exception as e:
+            logger.warning(f"⚠ 房间路由启动失败，按单进程模式运行: {e}")
+        # 恢复重启前进行中的房间（从状态机检查点继续）
+        try:
+            resumed = await werewolf_service.resume_active_rooms()
+            if resumed:
+                logger.info(f"✓ 已恢复 {resumed} 个进行中的狼人杀房间")
+        except Exception as e:
+            logger.warning(f"⚠ 恢复进行中的房间失败: {e}")
     except Exception as e:
         logger.error(f"启动事件处理失败: {e}", exc_info=True)
 
@@ -182,6 +210,11 @@ async def startup_event():
 async def shutdown_event():
     """服务器关闭时的清理"""
     logger.info("后端服务正在关闭...")
+    # 先停止本地驱动（检查点保留），再释放租约让其他进程接管
+    await werewolf_service.stop_all_rooms()
+    await room_router.stop()
+    await manager.stop()
+    await loop_monitor.stop()
 
 # ==================== 基础API ====================
 
@@ -216,30 +249,26 @@ async def health_check():
         logger.error(f"健康检查失败: {e}", exc_info=True)
         return {"status": "unhealthy", "error": str(e)}
 
+def _load_worldview(data: Dict) -> Dict:
+    """校验世界观数据（字段类型不对时抛出异常，热更新继续使用上一版）"""
+    worldview = data["worldview"]
+    Worldview(**worldview)
+    return worldview
+
+# 世界观数据（文件变化时自动热更新）
+worldview_loader = ContentLoader(
+    os.path.join(os.path.dirname(__file__), "data", "worldview.json"),
+    _load_worldview,
+    name="worldview",
+    optional=True
+)
+content_watcher.register(worldview_loader)
+
 @app.get("/api/worldview")
 async def get_worldview():
     """获取世界观"""
-    try:
-        worldview_file = os.path.join(os.path.dirname(__file__), "data", "worldview.json")
-        with open(worldview_file, "r", encoding="utf-8") as f:
-            worldview_data = json.load(f)
-        
-        worldview = worldview_data.get("worldview", {})
-        
-        # 计算实际项数
-        item_count = 0
-        item_count += len(worldview.get("settings", []))
-        item_count += len(worldview.get("characters_overview", []))
-        item_count += len(worldview.get("gameplay_features", []))
-        item_count += len(worldview.get("gameplay_rules", []))
-        # 加上基础信息项（title, subtitle, host_ai, introduction, contact）
-        item_count += 5
-        
-        return {
-            **worldview,
-            "item_count": item_count
-        }
-    except FileNotFoundError:
+    worldview = worldview_loader.current
+    if worldview is None:
         # 如果文件不存在，返回默认数据
         return {
             "title": "猛兽派对",
@@ -248,6 +277,20 @@ async def get_worldview():
             "intro": "你将从解锁第一个角色——丧彪（猫）开始，逐步揭开这个世界的秘密。",
             "item_count": 0
         }
+    
+    # 计算实际项数
+    item_count = 0
+    item_count += len(worldview.get("settings", []))
+    item_count += len(worldview.get("characters_overview", []))
+    item_count += len(worldview.get("gameplay_features", []))
+    item_count += len(worldview.get("gameplay_rules", []))
+    # 加上基础信息项（title, subtitle, host_ai, introduction, contact）
+    item_count += 5
+    
+    return {
+        **worldview,
+        "item_count": item_count
+    }
 
 # ==================== 角色系统 ====================
 
@@ -278,14 +321,14 @@ async def unlock_character(user_id: str, character_id: str):
 # ==================== AI角色对话 ====================
 
 @app.websocket("/ws/character/{user_id}/{character_id}")
-async def character_chat(websocket: WebSocket, user_id: str, character_id: str):
-    """角色对话WebSocket"""
-    await manager.connect(websocket, f"character_{user_id}_{character_id}")
+async def character_chat(websocket: WebSocket, user_id: str, character_id: str, encoding: str = "json"):
+    """角色对话WebSocket（encoding=msgpack 时以二进制帧收发）"""
+    conn = await manager.connect(websocket, f"character_{user_id}_{character_id}", binary=encoding == "msgpack")
     
     try:
         character = character_service.get_character(character_id)
         if not character:
-            await websocket.send_text(json.dumps({"error": "角色不存在"}))
+            await websocket.send_text(encode_frame({"error": "角色不存在"}))
             return
         
         # 获取对话记忆
@@ -295,31 +338,34 @@ async def character_chat(websocket: WebSocket, user_id: str, character_id: str):
         system_prompt = AIService.build_character_prompt(character)
         
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await conn.receive()
             user_message = message_data.get("message", "")
             
             # 添加到对话历史
             memory.conversation_history.append({"role": "user", "content": user_message})
             
-            # 调用AI
-            ai_response = await AIService.generate_response(
-                messages=memory.conversation_history,
-                system_prompt=system_prompt
-            )
+            # 调用AI（等待回复期间读不到客户端的pong，暂停心跳超时判定）
+            with conn.busy():
+                ai_response = await AIService.generate_response(
+                    messages=memory.conversation_history,
+                    system_prompt=system_prompt,
+                    call_site="chat"
+                )
             
             # 保存AI回复
             memory.conversation_history.append({"role": "assistant", "content": ai_response})
             await character_service.save_character_memory(memory)
             
             # 发送回复
-            await websocket.send_text(json.dumps({
+            conn.send(encode_frame({
                 "type": "message",
                 "content": ai_response,
                 "character": character["name"]
             }))
     
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, f"character_{user_id}_{character_id}")
 
 # ==================== 大事件解谜 ====================
@@ -358,28 +404,27 @@ async def submit_answer(event_id: str, user_id: str, answer1: str, answer2: str)
         }
 
 @app.websocket("/ws/event/{user_id}/{event_id}")
-async def event_chat(websocket: WebSocket, user_id: str, event_id: str):
-    """大事件解谜WebSocket"""
-    await manager.connect(websocket, f"event_{user_id}_{event_id}")
+async def event_chat(websocket: WebSocket, user_id: str, event_id: str, encoding: str = "json"):
+    """大事件解谜WebSocket（encoding=msgpack 时以二进制帧收发）"""
+    conn = await manager.connect(websocket, f"event_{user_id}_{event_id}", binary=encoding == "msgpack")
     
     try:
         event = event_service.get_event(event_id)
         if not event:
-            await websocket.send_text(json.dumps({"error": "事件不存在"}))
+            await websocket.send_text(encode_frame({"error": "事件不存在"}))
             return
         
         # 获取事件进度
         progress = await event_service.get_user_event_progress(user_id, event_id)
         
         # 发送背景
-        await websocket.send_text(json.dumps({
+        conn.send(encode_frame({
             "type": "background",
             "content": event["background"]
         }))
         
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await conn.receive()
             user_message = message_data.get("message", "")
             
             # 构建prompt
@@ -391,11 +436,13 @@ async def event_chat(websocket: WebSocket, user_id: str, event_id: str):
             messages = progress.get("conversation_history", [])
             messages.append({"role": "user", "content": user_message})
             
-            # 调用AI
-            ai_response = await AIService.generate_response(
-                messages=messages,
-                system_prompt=prompt
-            )
+            # 调用AI（等待回复期间读不到客户端的pong，暂停心跳超时判定）
+            with conn.busy():
+                ai_response = await AIService.generate_response(
+                    messages=messages,
+                    system_prompt=prompt,
+                    call_site="mystery"
+                )
             
             messages.append({"role": "assistant", "content": ai_response})
             progress["conversation_history"] = messages
@@ -469,9 +516,11 @@ async def event_chat(websocket: WebSocket, user_id: str, event_id: str):
             if unlocked_characters:
                 response_data["unlocked_characters"] = unlocked_characters
             
-            await websocket.send_text(json.dumps(response_data))
+            conn.send(encode_frame(response_data))
     
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, f"event_{user_id}_{event_id}")
 
 # ==================== 健康检查和测试路由 ====================
@@ -496,6 +545,16 @@ async def test_post_endpoint():
     """测试 POST 端点"""
     return {"status": "ok", "message": "POST 请求正常工作"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文本格式的监控指标（本进程）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/ws/stats")
+async def websocket_stats():
+    """本进程 WebSocket 出站流量统计（原始字节、编码字节、估算压缩后字节，按房间/会话）"""
+    return manager.stats()
+
 # ==================== 狼人杀游戏 ====================
 
 @app.post("/api/werewolf/room")
@@ -534,18 +593,7 @@ async def join_werewolf_room(room_id: str, user_id: str, username: str):
 async def start_werewolf_game(room_id: str, background_tasks: BackgroundTasks):
     """开始狼人杀游戏"""
     try:
-        # 定义广播回调函数
-        async def broadcast_message(message: str, room_key: str):
-            await manager.broadcast(message, room_key)
-        
-        # 定义发送私有消息回调函数
-        async def send_private_message(room_id: str, user_id: str, message: str):
-            await manager.send_personal_message_to_user(room_id, user_id, message)
-        
-        # 设置广播回调，让werewolf_service能够广播消息
-        werewolf_service.set_broadcast_callback(broadcast_message)
-        # 设置发送私有消息回调
-        werewolf_service.set_send_private_message_callback(send_private_message)
+        bind_werewolf_callbacks()
         
         success = await werewolf_service.start_game(room_id)
         if success:
@@ -555,7 +603,7 @@ async def start_werewolf_game(room_id: str, background_tasks: BackgroundTasks):
                 # 广播房间状态更新（包含unlocked_characters字段）
                 room_data = await get_room_data_with_extras(room_id)
                 if room_data:
-                    await manager.broadcast(json.dumps({
+                    await manager.broadcast(encode_frame({
                         "type": "room_update",
                         "room": room_data
                     }), f"werewolf_{room_id}")
@@ -570,7 +618,7 @@ async def start_werewolf_game(room_id: str, background_tasks: BackgroundTasks):
                             await manager.send_personal_message_to_user(
                                 room_id,  # send_personal_message_to_user 内部会自动添加 werewolf_ 前缀
                                 player.user_id,
-                                json.dumps({
+                                encode_frame({
                                     "type": "private_message",
                                     "content": msg
                                 })
@@ -579,20 +627,19 @@ async def start_werewolf_game(room_id: str, background_tasks: BackgroundTasks):
                 # 广播所有公共消息（包括阶段弹窗消息）
                 public_messages = await redis_service.get_room_messages(room_id)
                 for msg in public_messages:
-                    await manager.broadcast(json.dumps({
+                    await manager.broadcast(encode_frame({
                         "type": "public_message",
                         "content": msg
                     }), f"werewolf_{room_id}")
             
-            # 在后台任务中启动夜晚阶段，避免阻塞API响应
+            # 在后台任务中启动阶段状态机，避免阻塞API响应
             async def start_night_phase_background():
-                """后台任务：启动夜晚阶段"""
+                """后台任务：启动房间的阶段状态机（从夜晚开始）"""
                 try:
                     import asyncio
                     # 等待一下，确保身份分配消息已发送
                     await asyncio.sleep(0.5)
-                    # 启动夜晚阶段（这会花费较长时间）
-                    await werewolf_service._start_night_phase(room_id)
+                    werewolf_service.start_phase_machine(room_id)
                 except Exception as e:
                     logger.error(f"后台启动夜晚阶段失败 (房间 {room_id}): {e}", exc_info=True)
             
@@ -611,7 +658,7 @@ async def start_werewolf_game(room_id: str, background_tasks: BackgroundTasks):
 @app.get("/api/werewolf/room/{room_id}")
 async def get_werewolf_room(room_id: str):
     """获取房间信息"""
-    room_data = await get_room_data_with_extras(room_id)
+    room_data = await get_room_data_with_extras(room_id, validate=True)
     if room_data:
         return room_data
     raise HTTPException(status_code=404, detail="房间不存在")
@@ -625,49 +672,127 @@ async def add_ai_player(room_id: str):
     raise HTTPException(status_code=400, detail="添加AI玩家失败")
 
 @app.post("/api/werewolf/room/{room_id}/auto-fill-ai")
-async def auto_fill_ai_players(room_id: str, target_count: int = 7):
-    """自动填充AI玩家到目标人数"""
+async def auto_fill_ai_players(room_id: str, target_count: Optional[int] = None):
+    """自动填充AI玩家到目标人数（不传时填满房间）"""
     added_count = await werewolf_service.auto_fill_ai_players(room_id, target_count)
     return {"success": True, "added_count": added_count}
 
+@app.get("/api/werewolf/room/{room_id}/trace")
+async def get_room_trace(room_id: str):
+    """房间阶段时间线（Chrome Trace Event 格式，可用 chrome://tracing 或 Perfetto 打开，或交给 trace_timeline.py 汇总）"""
+    trace = tracer.export(room_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="没有该房间的时间线记录")
+    return trace
+
+@app.get("/api/werewolf/presets")
+async def get_werewolf_presets():
+    """获取可选板子列表"""
+    presets = [{
+        "id": AUTO_PRESET_ID,
+        "name": "自动配置",
+        "description": "按开局人数自动平衡角色",
+        "size": None,
+        "max_players": config.WEREWOLF_MAX_PLAYERS
+    }]
+    presets.extend(p.to_dict() for p in role_preset_registry.list_presets())
+    return {"presets": presets}
+
+@app.post("/api/werewolf/room/{room_id}/preset")
+async def set_werewolf_preset(room_id: str, preset_id: str):
+    """选择房间板子"""
+    result = await werewolf_service.set_role_preset(room_id, preset_id)
+    if result.get("error"):
+        raise HTTPException(status_code=400, detail=result["error"])
+    room_data = await get_room_data_with_extras(room_id)
+    if room_data:
+        await manager.broadcast(encode_frame({
+            "type": "room_update",
+            "room": room_data
+        }), f"werewolf_{room_id}")
+    return result
+
+@app.get("/api/werewolf/room/{room_id}/messages")
+async def get_werewolf_messages(room_id: str, offset: int = 0, limit: int = 50):
+    """分页获取公共消息（offset为负数时从末尾倒数）"""
+    limit = max(1, min(limit, 200))
+    messages = await redis_service.get_room_messages(room_id, offset=offset, limit=limit)
+    total = await redis_service.count_room_messages(room_id)
+    return {"messages": messages, "offset": offset, "limit": limit, "total": total}
+
+@app.get("/api/werewolf/room/{room_id}/private/{user_id}")
+async def get_werewolf_private_messages(room_id: str, user_id: str, offset: int = 0, limit: int = 50):
+    """分页获取玩家私有消息（offset为负数时从末尾倒数）"""
+    limit = max(1, min(limit, 200))
+    messages = await redis_service.get_private_messages(room_id, user_id, offset=offset, limit=limit)
+    total = await redis_service.count_private_messages(room_id, user_id)
+    return {"messages": messages, "offset": offset, "limit": limit, "total": total}
+
 @app.websocket("/ws/werewolf/{room_id}/{user_id}")
-async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
-    """狼人杀游戏WebSocket"""
-    await manager.connect(websocket, f"werewolf_{room_id}", user_id)
+async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str,
+                        last_seq: Optional[int] = None, epoch: Optional[str] = None, coalesce: bool = False,
+                        encoding: str = "json"):
+    """狼人杀游戏WebSocket
+    
+    出站帧带房间内递增的 seq；断线重连时携带 last_seq 和 epoch，只补发缺失的帧（合并为一个 batch 帧），
+    epoch 不一致或缺口超出保留范围时回退为全量同步（房间状态 + 私有消息 + 最近10条公共消息）。
+    客户端携带 coalesce=1 时，短时间窗口内的连续出站帧合并为一个 batch 帧发送；
+    encoding=msgpack 时以 msgpack 二进制帧收发。
+    """
+    owner_url = await room_router.resolve(room_id)
+    if owner_url:
+        # 房间由其他工作进程负责：告知客户端新地址后关闭
+        await websocket.accept()
+        ws_url = re.sub(r"^http", "ws", owner_url) + websocket.url.path
+        if websocket.url.query:
+            ws_url += f"?{websocket.url.query}"
+        await websocket.send_text(encode_frame({"type": "redirect", "url": ws_url}))
+        await websocket.close(code=WS_CLOSE_REDIRECT)
+        return
+    
+    room_key = f"werewolf_{room_id}"
+    binary = encoding == "msgpack"
+    await websocket.accept()
     
     try:
-        room = await werewolf_service.get_room(room_id)
-        if not room:
-            await websocket.send_text(json.dumps({"error": "房间不存在"}))
-            return
-        
-        # 发送房间状态（包含额外字段）
-        room_data = await get_room_data_with_extras(room_id)
-        if room_data:
-            await websocket.send_text(json.dumps({
-                "type": "room_state",
-                "room": room_data
-            }))
-        
-        # 发送私有消息
-        private_messages = await redis_service.get_private_messages(room_id, user_id)
-        for msg in private_messages:
-            await websocket.send_text(json.dumps({
-                "type": "private_message",
-                "content": msg
-            }))
-        
-        # 发送公共消息
-        public_messages = await redis_service.get_room_messages(room_id)
-        for msg in public_messages[-10:]:  # 最近10条
-            await websocket.send_text(json.dumps({
-                "type": "public_message",
-                "content": msg
-            }))
+        conn = manager.resume(websocket, room_key, user_id, epoch, last_seq, coalesce, binary)
+        if conn is None:
+            # 全量同步：先记下帧日志位置，读取期间产生的帧在登记连接后补发
+            position = manager.current_seq(room_key)
+            room = await werewolf_service.get_room(room_id)
+            if not room:
+                await websocket.send_text(encode_frame({"error": "房间不存在"}))
+                return
+            
+            frames = []
+            # 房间状态（包含额外字段）
+            room_data = await get_room_data_with_extras(room_id)
+            if room_data:
+                frames.append(encode_frame({
+                    "type": "room_state",
+                    "room": room_data,
+                    **position
+                }))
+            
+            # 私有消息
+            private_messages = await redis_service.get_private_messages(room_id, user_id)
+            for msg in private_messages:
+                frames.append(encode_frame({
+                    "type": "private_message",
+                    "content": msg
+                }))
+            
+            # 公共消息（最近10条）
+            public_messages = await redis_service.get_room_messages(room_id, offset=-10)
+            for msg in public_messages:
+                frames.append(encode_frame({
+                    "type": "public_message",
+                    "content": msg
+                }))
+            conn = manager.attach(websocket, room_key, user_id, frames, position["seq"], coalesce, binary)
         
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await conn.receive()
             action_type = message_data.get("type")
             
             if action_type == "action":
@@ -676,7 +801,7 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
                 target = message_data.get("target")
                 action_data = {"target": target} if target is not None else {}
                 result = await werewolf_service.player_action(room_id, user_id, action, action_data)
-                await websocket.send_text(json.dumps(result))
+                conn.send(encode_frame(result))
             
             elif action_type == "wolf_chat":
                 # 狼人私聊消息
@@ -687,12 +812,12 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
                     room = await werewolf_service.get_room(room_id)
                     if room:
                         # 获取所有狼人玩家
-                        wolves = [p for p in room.players if p.role.value == "wolf" and p.alive]
+                        wolves = room.wolves
                         for wolf in wolves:
                             await manager.send_personal_message_to_user(
-                                f"werewolf_{room_id}",
+                                room_id,  # send_personal_message_to_user 内部会自动添加 werewolf_ 前缀
                                 wolf.user_id,
-                                json.dumps({
+                                encode_frame({
                                     "type": "wolf_chat",
                                     "content": {
                                         "content": content,
@@ -711,10 +836,10 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
                 room = await werewolf_service.get_room(room_id)
                 if room:
                     # 获取最新的消息并广播
-                    public_messages = await redis_service.get_room_messages(room_id)
+                    public_messages = await redis_service.get_room_messages(room_id, offset=-1)
                     if public_messages:
                         latest_message = public_messages[-1]
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "public_message",
                             "content": latest_message
                         }), f"werewolf_{room_id}")
@@ -722,45 +847,36 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
                     # 广播房间更新（包含额外字段）
                     room_data = await get_room_data_with_extras(room_id)
                     if room_data:
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "room_update",
                             "room": room_data
                         }), f"werewolf_{room_id}")
                     
-                    # 触发AI玩家自动回复
+                    # 触发AI玩家发言（防抖后按顺序轮流发言）
                     if room.phase == "day":
-                        async def broadcast_ai_message(room_id: str, message: Dict):
-                            """广播AI玩家的消息"""
-                            await manager.broadcast(json.dumps({
-                                "type": "public_message",
-                                "content": message
-                            }), f"werewolf_{room_id}")
-                        
-                        # 异步触发AI回复（不等待完成）
-                        import asyncio
-                        asyncio.create_task(werewolf_service._trigger_ai_responses(room, broadcast_ai_message))
+                        werewolf_service.schedule_ai_speech(room_id)
             
             elif action_type == "last_words":
                 # 玩家提交遗言
                 content = message_data.get("content", "")
                 result = await werewolf_service.player_action(room_id, user_id, "last_words", {"content": content})
-                await websocket.send_text(json.dumps(result))
+                conn.send(encode_frame(result))
                 
                 # 广播房间更新和遗言消息
                 room = await werewolf_service.get_room(room_id)
                 if room:
                     # 获取最新的消息并广播
-                    public_messages = await redis_service.get_room_messages(room_id)
+                    public_messages = await redis_service.get_room_messages(room_id, offset=-1)
                     if public_messages:
                         latest_message = public_messages[-1]
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "public_message",
                             "content": latest_message
                         }), f"werewolf_{room_id}")
                     
                     room_data = await get_room_data_with_extras(room_id)
                     if room_data:
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "room_update",
                             "room": room_data
                         }), f"werewolf_{room_id}")
@@ -769,23 +885,23 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
                 # 猎人开枪
                 target = message_data.get("target")
                 result = await werewolf_service.player_action(room_id, user_id, "hunter_shot", {"target": target})
-                await websocket.send_text(json.dumps(result))
+                conn.send(encode_frame(result))
                 
                 # 广播房间更新
                 room = await werewolf_service.get_room(room_id)
                 if room:
                     # 获取最新的消息并广播
-                    public_messages = await redis_service.get_room_messages(room_id)
+                    public_messages = await redis_service.get_room_messages(room_id, offset=-1)
                     if public_messages:
                         latest_message = public_messages[-1]
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "public_message",
                             "content": latest_message
                         }), f"werewolf_{room_id}")
                     
                     room_data = await get_room_data_with_extras(room_id)
                     if room_data:
-                        await manager.broadcast(json.dumps({
+                        await manager.broadcast(encode_frame({
                             "type": "room_update",
                             "room": room_data
                         }), f"werewolf_{room_id}")
@@ -794,13 +910,15 @@ async def werewolf_game(websocket: WebSocket, room_id: str, user_id: str):
             if action_type not in ["message", "last_words", "hunter_shot"]:
                 room_data = await get_room_data_with_extras(room_id)
                 if room_data:
-                    await manager.broadcast(json.dumps({
+                    await manager.broadcast(encode_frame({
                         "type": "room_update",
                         "room": room_data
                     }), f"werewolf_{room_id}")
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, f"werewolf_{room_id}")
+        pass
+    finally:
+        manager.disconnect(websocket, room_key)
 
 # ==================== 真心话大冒险 ====================
 
@@ -817,12 +935,12 @@ async def generate_truth_or_dare(game_result: str, player_count: int = 2):
     
     response = await AIService.generate_response(
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.9
+        call_site="truth_or_dare"
     )
     
     return {"question": response, "type": "truth_or_dare"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=config.HOST, port=config.PORT)
+    uvicorn.run(app, host=config.HOST, port=config.PORT, ws_per_message_deflate=config.WS_PER_MESSAGE_DEFLATE)
 
@@ -45,13 +45,18 @@ class Player(BaseModel):
     died_by: Optional[str] = None  # 死亡原因：'wolf', 'vote', 'poison', 'hunter'等
 
 class GameRoom(BaseModel):
+    """房间快照，只包含游戏状态
+
+    用于API边界的校验和导出；引擎内部使用 models.game_state.RoomState。
+
+    公共/私有消息日志分别保存在 room:{id}:messages 和 room:{id}:private:{uid}，
+    游戏结束时的角色解锁信息保存在 room:{id}:unlocked，按需分页读取。
+    """
     room_id: str
     players: List[Player]
     phase: GamePhase = GamePhase.WAITING
     day_count: int = 0
     night_count: int = 0
-    messages: List[Dict[str, str]]  # 公共消息
-    private_messages: Dict[str, List[Dict[str, str]]]  # 私有消息 {user_id: [messages]}
     winner: Optional[str] = None  # "wolves" or "villagers"
     # 夜晚行动记录
     night_actions: Dict[str, Dict] = {}  # 记录夜晚行动 {role: {action_type: target}}
@@ -62,6 +67,6 @@ class GameRoom(BaseModel):
     phase_start_time: Optional[float] = None  # 阶段开始时间（Unix时间戳）
     phase_duration: Optional[int] = None  # 阶段持续时间（秒）
     can_speak: bool = False  # 是否允许发言
-
-
-
+    # 板子配置
+    role_preset: Optional[str] = None  # 板子ID，None/"auto" 表示按人数自动平衡
+    max_players: int = 12  # 房间人数上限
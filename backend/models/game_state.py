@@ -0,0 +1,212 @@
+from operator import attrgetter
+from typing import Any, Dict, List, Optional
+
+from models.game import GameRoom, GamePhase, PlayerRole
+
+# 引擎内部使用的紧凑游戏状态
+#
+# GameRoom/Player（Pydantic）只在API边界做校验和导出；引擎每次从Redis读取房间时
+# 直接把JSON字典装进 __slots__ 对象，不做字段校验，也不创建额外的 __dict__。
+# 字段名与 GameRoom/Player 保持一致，to_dict() 的结果可以直接交给 GameRoom 校验。
+
+# (字段名, 默认值)，顺序与 Player 模型一致
+_PLAYER_FIELDS = (
+    ("user_id", None),
+    ("username", None),
+    ("role", None),
+    ("alive", True),
+    ("voted", False),
+    ("vote_target", None),
+    ("is_ai", False),
+    ("guarded", False),
+    ("guard_target", None),
+    ("last_guard_target", None),
+    ("checked_by_seer", False),
+    ("saved_by_witch", False),
+    ("poisoned_by_witch", False),
+    ("witch_antidote_used", False),
+    ("witch_poison_used", False),
+    ("hunter_shot_used", False),
+    ("died_by", None),
+)
+_PLAYER_FIELD_NAMES = tuple(name for name, _ in _PLAYER_FIELDS)
+
+# 参与房间索引的玩家字段，变化时让所属房间的索引失效
+_INDEXED_PLAYER_FIELDS = frozenset(("user_id", "alive", "role"))
+
+_ROLE_BY_VALUE = {role.value: role for role in PlayerRole}
+_PHASE_BY_VALUE = {phase.value: phase for phase in GamePhase}
+
+_set = object.__setattr__
+
+
+class PlayerState:
+    """玩家状态（引擎内部）"""
+    __slots__ = _PLAYER_FIELD_NAMES + ("_room",)
+
+    def __init__(self, **fields):
+        _set(self, "_room", None)
+        for name, default in _PLAYER_FIELDS:
+            _set(self, name, fields.get(name, default))
+
+    def __setattr__(self, name, value):
+        _set(self, name, value)
+        if name in _INDEXED_PLAYER_FIELDS:
+            room = self._room
+            if room is not None:
+                _set(room, "_index", None)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PlayerState":
+        """从Redis中的字典构建（不校验）"""
+        self = cls.__new__(cls)
+        _set(self, "_room", None)
+        get = data.get
+        for setter, name, default in _PLAYER_SETTERS:
+            setter(self, get(name, default))
+        role = self.role
+        if role is not None:
+            _set(self, "role", _ROLE_BY_VALUE[role])
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典"""
+        data = dict(zip(_PLAYER_FIELD_NAMES, _get_player_fields(self)))
+        if self.role is not None:
+            data["role"] = self.role.value
+        return data
+
+    def __repr__(self):
+        return f"PlayerState(user_id={self.user_id!r}, username={self.username!r}, role={self.role}, alive={self.alive})"
+
+
+# 直接使用槽位描述符读写，绕过 __setattr__ 钩子
+_PLAYER_SETTERS = tuple((PlayerState.__dict__[name].__set__, name, default) for name, default in _PLAYER_FIELDS)
+_get_player_fields = attrgetter(*_PLAYER_FIELD_NAMES)
+
+
+class PlayerIndex:
+    """房间玩家索引（只读快照，不要修改其中的列表/字典）"""
+    __slots__ = ("players", "size", "by_id", "alive", "alive_by_role")
+
+    def __init__(self, players: List[PlayerState]):
+        self.players = players
+        self.size = len(players)
+        self.by_id: Dict[str, PlayerState] = {p.user_id: p for p in players}
+        self.alive: List[PlayerState] = [p for p in players if p.alive]
+        alive_by_role: Dict[Optional[PlayerRole], List[PlayerState]] = {}
+        for p in self.alive:
+            alive_by_role.setdefault(p.role, []).append(p)
+        self.alive_by_role = alive_by_role
+
+
+# (字段名, 默认值)，顺序与 GameRoom 模型一致；players 单独处理
+_ROOM_FIELDS = (
+    ("room_id", None),
+    ("phase", GamePhase.WAITING),
+    ("day_count", 0),
+    ("night_count", 0),
+    ("winner", None),
+    ("night_actions", None),
+    ("current_night_phase", None),
+    ("eliminated_tonight", None),
+    ("saved_tonight", None),
+    ("phase_start_time", None),
+    ("phase_duration", None),
+    ("can_speak", False),
+    ("role_preset", None),
+    ("max_players", 12),
+)
+_ROOM_FIELD_NAMES = tuple(name for name, _ in _ROOM_FIELDS)
+
+
+class RoomState:
+    """房间状态（引擎内部）"""
+    __slots__ = _ROOM_FIELD_NAMES + ("players", "_index")
+
+    def __init__(self, room_id: str, players: Optional[List[PlayerState]] = None, **fields):
+        _set(self, "_index", None)
+        _set(self, "room_id", room_id)
+        _set(self, "players", players if players is not None else [])
+        for name, default in _ROOM_FIELDS[1:]:
+            _set(self, name, fields.get(name, default))
+        if self.night_actions is None:
+            _set(self, "night_actions", {})
+
+    def __setattr__(self, name, value):
+        _set(self, name, value)
+        if name == "players":
+            _set(self, "_index", None)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RoomState":
+        """从Redis中的字典构建（不校验）"""
+        self = cls.__new__(cls)
+        _set(self, "_index", None)
+        get = data.get
+        for setter, name, default in _ROOM_SETTERS:
+            setter(self, get(name, default))
+        _set(self, "phase", _PHASE_BY_VALUE[self.phase])
+        if self.night_actions is None:
+            _set(self, "night_actions", {})
+        _set(self, "players", [PlayerState.from_dict(p) for p in get("players") or ()])
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典（用于保存和广播）"""
+        data = dict(zip(_ROOM_FIELD_NAMES, _get_room_fields(self)))
+        data["players"] = [p.to_dict() for p in self.players]
+        data["phase"] = self.phase.value
+        return data
+
+    def to_model(self) -> GameRoom:
+        """转换为Pydantic模型（API边界校验/导出）"""
+        return GameRoom.model_validate(self.to_dict())
+
+    # ---------- 玩家索引 ----------
+
+    def _player_index(self) -> PlayerIndex:
+        """获取玩家索引，玩家列表或 alive/role 变化后惰性重建"""
+        index = self._index
+        if index is None or index.players is not self.players or index.size != len(self.players):
+            index = PlayerIndex(self.players)
+            for p in self.players:
+                _set(p, "_room", self)
+            _set(self, "_index", index)
+        return index
+
+    @property
+    def by_id(self) -> Dict[str, PlayerState]:
+        """{user_id: PlayerState}"""
+        return self._player_index().by_id
+
+    @property
+    def alive(self) -> List[PlayerState]:
+        """存活玩家（按座位顺序）"""
+        return self._player_index().alive
+
+    @property
+    def alive_by_role(self) -> Dict[Optional[PlayerRole], List[PlayerState]]:
+        """{角色: 存活玩家列表}"""
+        return self._player_index().alive_by_role
+
+    @property
+    def wolves(self) -> List[PlayerState]:
+        """存活狼人"""
+        return self._player_index().alive_by_role.get(PlayerRole.WOLF, [])
+
+    def get_player(self, user_id: Optional[str], alive_only: bool = False) -> Optional[PlayerState]:
+        """按ID获取玩家，alive_only=True 时只返回存活玩家"""
+        player = self._player_index().by_id.get(user_id)
+        if player is not None and alive_only and not player.alive:
+            return None
+        return player
+
+    def first_alive(self, role: PlayerRole) -> Optional[PlayerState]:
+        """获取某角色的第一个存活玩家（守卫/预言家/女巫等单人角色）"""
+        players = self._player_index().alive_by_role.get(role)
+        return players[0] if players else None
+
+
+_ROOM_SETTERS = tuple((RoomState.__dict__[name].__set__, name, default) for name, default in _ROOM_FIELDS)
+_get_room_fields = attrgetter(*_ROOM_FIELD_NAMES)
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import Any, List, Dict
+
+class Worldview(BaseModel):
+    title: str
+    subtitle: str = ""
+    host_ai: str = ""
+    introduction: str = ""
+    settings: List[Dict[str, Any]] = []
+    characters_overview: List[Dict[str, Any]] = []
+    gameplay_features: List[Dict[str, Any]] = []
+    gameplay_rules: List[Dict[str, Any]] = []
+    contact: Dict[str, Any] = {}
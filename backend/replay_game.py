@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""狼人杀对局回放工具
+
+从 Redis Stream `room:{room_id}:events` 读取房间事件，按顺序折叠还原整局过程：
+  - 打印时间线（阶段切换、身份分配、夜间行动、投票、死亡、发言）
+  - --verify: 校验从头折叠的结果与引擎读取的房间状态（房间快照 + 之后的补丁）一致
+  - --bench N: 重复折叠 N 次，测量折叠速度
+
+折叠是纯函数，同一事件流每次回放结果完全一致。
+
+用法: python replay_game.py <room_id> [--verify] [--bench 100] [--quiet]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from services.redis_service import redis_service
+from services.event_log import (
+    EVENT_SNAPSHOT, EVENT_PATCH, EVENT_MESSAGE, EVENT_PRIVATE, apply_patch, fold_events, game_event_log
+)
+
+
+def _name(state, user_id):
+    for p in state.get("players", []) if state else []:
+        if p["user_id"] == user_id:
+            return p.get("username") or user_id
+    return user_id
+
+
+def describe_event(state, fields):
+    """把一条事件描述为若干行文字（state 为应用该事件之前的状态）"""
+    kind = fields.get("kind")
+    if kind == EVENT_SNAPSHOT:
+        snap = json.loads(fields["state"])
+        return [f"快照：阶段 {snap.get('phase')}，{len(snap.get('players', []))} 名玩家"]
+    if kind in (EVENT_MESSAGE, EVENT_PRIVATE):
+        msg = json.loads(fields["message"])
+        content = str(msg.get("content", "")).replace("\n", " ")
+        if kind == EVENT_PRIVATE:
+            return [f"私信 → {_name(state, fields.get('user_id'))}：{content[:60]}"]
+        return [f"{msg.get('username') or '系统'}：{content[:80]}"]
+    if kind != EVENT_PATCH:
+        return []
+
+    patch = json.loads(fields["patch"])
+    lines = []
+    room_set = patch.get("set", {})
+    if "phase" in room_set:
+        lines.append(f"阶段 → {room_set['phase']}（第{room_set.get('day_count', state.get('day_count'))}天/"
+                     f"第{room_set.get('night_count', state.get('night_count'))}夜）")
+    if room_set.get("current_night_phase"):
+        lines.append(f"夜间子阶段 → {room_set['current_night_phase']}")
+    if room_set.get("winner"):
+        lines.append(f"游戏结束，胜利方：{room_set['winner']}")
+    for p in patch.get("add", []):
+        lines.append(f"加入：{p.get('username')}{'（AI）' if p.get('is_ai') else ''}")
+    for user_id, changed in patch.get("players", {}).items():
+        name = _name(state, user_id)
+        if "role" in changed:
+            lines.append(f"身份：{name} = {changed['role']}")
+        if changed.get("alive") is False:
+            reason = changed.get("died_by")
+            lines.append(f"死亡：{name}{f'（{reason}）' if reason else ''}")
+        if changed.get("voted") and changed.get("vote_target"):
+            lines.append(f"投票：{name} → {_name(state, changed['vote_target'])}")
+        if changed.get("guard_target"):
+            lines.append(f"守护：{name} → {_name(state, changed['guard_target'])}")
+    if "night_actions" in room_set and not lines:
+        lines.append(f"夜间行动：{json.dumps(room_set['night_actions'], ensure_ascii=False)[:80]}")
+    return lines or [f"状态更新（{fields.get('type')}）"]
+
+
+def replay(events, quiet=False):
+    """逐条回放事件，返回最终状态"""
+    state = None
+    start_ts = None
+    for _, fields in events:
+        ts = float(fields.get("ts", 0))
+        if start_ts is None:
+            start_ts = ts
+        if not quiet:
+            for line in describe_event(state, fields):
+                print(f"[+{ts - start_ts:7.1f}s] {line}")
+        kind = fields.get("kind")
+        if kind == EVENT_SNAPSHOT:
+            state = json.loads(fields["state"])
+        elif kind == EVENT_PATCH and state is not None:
+            apply_patch(state, json.loads(fields["patch"]))
+    return state
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="狼人杀对局回放工具")
+    parser.add_argument("room_id", help="房间ID")
+    parser.add_argument("--verify", action="store_true", help="校验从头折叠的结果与引擎读取的房间状态一致")
+    parser.add_argument("--bench", type=int, default=0, help="重复折叠次数，测量折叠速度")
+    parser.add_argument("--quiet", action="store_true", help="不打印时间线")
+    args = parser.parse_args()
+
+    events = await redis_service.get_room_events(args.room_id)
+    if not events:
+        print(f"房间 {args.room_id} 没有事件记录")
+        return 1
+    counts = {}
+    for _, fields in events:
+        counts[fields.get("kind")] = counts.get(fields.get("kind"), 0) + 1
+    print("=" * 60)
+    print(f"房间 {args.room_id} - 共 {len(events)} 条事件: {counts}")
+    print("=" * 60)
+
+    state = replay(events, quiet=args.quiet)
+    code = 0
+    if args.verify:
+        current = await game_event_log.load(args.room_id)
+        if current is None:
+            print("✗ 房间快照不存在，无法校验")
+            code = 1
+        elif json.dumps(state, sort_keys=True, default=str) == json.dumps(current, sort_keys=True, default=str):
+            print("✓ 折叠结果与房间当前状态一致")
+        else:
+            print("✗ 折叠结果与房间当前状态不一致")
+            code = 1
+
+    if args.bench > 0:
+        start = time.perf_counter()
+        for _ in range(args.bench):
+            fold_events(events)
+        elapsed = time.perf_counter() - start
+        per_fold = elapsed / args.bench
+        print(f"折叠 {args.bench} 次: 每次 {per_fold * 1000:.3f} ms，每条事件 {per_fold / len(events) * 1e6:.2f} us")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
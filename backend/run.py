@@ -222,6 +222,7 @@ if __name__ == "__main__":
         reload=True,
         log_level="info",
         access_log=False,  # 禁用访问日志，减少冗余输出
+        ws_per_message_deflate=config.WS_PER_MESSAGE_DEFLATE,  # WebSocket 帧压缩（由浏览器协商）
         log_config=log_config  # 使用自定义日志配置
     )
 
@@ -0,0 +1,192 @@
+import sys
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from models.game import PlayerRole
+from models.game_state import RoomState
+from services.ai_service import AIService
+from services.bot_engine import SuspicionMatrix
+from services.event_log import game_event_log
+from services.game_memory import GameMemory
+from services.redis_service import redis_service
+
+logger = logging.getLogger(__name__)
+
+# 保留的最近公共消息条数（提示词使用其中最后5条）
+CONTEXT_MESSAGES = 10
+# 首次建立上下文时读取的消息条数，用于找到最近一条真人发言
+BOOTSTRAP_MESSAGES = 50
+
+
+class RoomAIContext:
+    """单个房间的AI提示词上下文
+
+    公共消息和房间状态（阶段、天数、存活玩家）变化时增量更新，提示词的公共部分和对话历史
+    按版本缓存，同一版本下所有AI玩家共用，只拼接各自的角色部分。
+    memory 保存整局的死亡、投票和身份声明，按 AI_MEMORY_TOKENS 预算渲染进公共部分；
+    bot 是同样数据驱动的怀疑度矩阵，用于本地决定夜间行动和投票。
+    """
+    __slots__ = ("room_id", "day", "phase", "alive", "names", "ai_ids", "wolves", "messages",
+                 "last_human_speech", "memory", "bot", "_bot_key", "version", "_rendered", "_prefix", "_history")
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.day = 0
+        self.phase = ""
+        self.alive: Tuple[Tuple[str, str], ...] = ()  # (user_id, username)
+        self.names: Tuple[str, ...] = ()  # 所有玩家（含死亡）的用户名
+        self.ai_ids = set()
+        self.wolves: Tuple[Tuple[str, str], ...] = ()
+        self.messages: deque = deque(maxlen=CONTEXT_MESSAGES)  # {"username", "content"}
+        self.last_human_speech: Optional[str] = None  # 最近一条真人发言的 timestamp
+        self.memory = GameMemory()
+        self.bot: Optional[SuspicionMatrix] = None
+        self._bot_key: Tuple = ()
+        self.version = 0
+        self._rendered = -1
+        self._prefix = ""
+        self._history: List[Dict[str, str]] = []
+
+    def sync_room(self, room: RoomState):
+        """按房间当前状态更新阶段、天数和存活玩家（没有变化时不影响缓存）"""
+        alive = tuple((p.user_id, p.username) for p in room.alive)
+        if (room.day_count, room.phase.value, alive) != (self.day, self.phase, self.alive):
+            self.day = room.day_count
+            self.phase = room.phase.value
+            self.alive = alive
+            self.version += 1
+        # 座位或身份变化（开局分配身份）时重建怀疑度矩阵
+        bot_key = tuple((p.user_id, p.role == PlayerRole.WOLF) for p in room.players)
+        if bot_key != self._bot_key:
+            self.bot = SuspicionMatrix([(p.user_id, p.username, p.role == PlayerRole.WOLF) for p in room.players])
+            self._bot_key = bot_key
+        dead = [p for p in room.players if not p.alive]
+        for player in dead:
+            self.bot.observe_death(player.user_id, player.died_by)
+        if self.memory.record_deaths(dead, room.day_count, room.night_count):
+            self.version += 1
+        self.names = tuple(p.username for p in room.players)
+        self.ai_ids = {p.user_id for p in room.players if p.is_ai}
+        self.wolves = tuple((p.user_id, p.username) for p in room.wolves)
+
+    def add_message(self, message: Dict):
+        if not isinstance(message, dict):
+            return
+        username = message.get("username", "未知")
+        content = message.get("content", "")
+        self.messages.append({"username": username, "content": content})
+        user_id = message.get("user_id")
+        if message.get("type") == "speech" and user_id:
+            if user_id not in self.ai_ids:
+                self.last_human_speech = message.get("timestamp")
+            self.memory.observe_speech(username, content, self.day, self.names)
+            if self.bot:
+                self.bot.observe_speech(username, content)
+        self.version += 1
+
+    def record_votes(self, day: int, ballots: List[Tuple[str, str]]):
+        """记录一轮投票（投票者, 目标），同一天重复记录时覆盖"""
+        self.memory.record_votes(day, ballots)
+        if self.bot:
+            for voter, target in ballots:
+                self.bot.observe_vote(voter, target)
+        self.version += 1
+
+    def record_seer_result(self, seer_id: str, night: int, target: str, result: str):
+        """记录预言家的查验结果，只出现在该预言家自己的提示词中"""
+        self.memory.record_seer_result(seer_id, night, target, result)
+        if self.bot:
+            self.bot.observe_check(seer_id, target, result == "狼人")
+
+    def seer_results(self, user_id: str) -> str:
+        return self.memory.render_private(user_id)
+
+    def fork(self) -> "RoomAIContext":
+        """复制一份独立的上下文（预生成时按将来的房间状态构造提示词）"""
+        copy = RoomAIContext(self.room_id)
+        copy.ai_ids = set(self.ai_ids)
+        copy.names = self.names
+        copy.memory = self.memory.copy()
+        copy.bot = self.bot.copy() if self.bot else None
+        copy._bot_key = self._bot_key
+        copy.messages.extend(self.messages)
+        copy.last_human_speech = self.last_human_speech
+        return copy
+
+    def fingerprint(self) -> Tuple:
+        """AI发言依赖的输入：第几天、存活玩家、最近一条真人发言"""
+        return (self.day, tuple(sorted(uid for uid, _ in self.alive)), self.last_human_speech)
+
+    def _render(self):
+        if self._rendered == self.version:
+            return
+        messages = list(self.messages)
+        self._prefix = AIService.build_werewolf_context_prompt(
+            self.phase, self.day, messages, [{"username": name} for _, name in self.alive],
+            self.memory.render(config.AI_MEMORY_TOKENS))
+        self._history = [{"role": "user", "content": f"{msg['username']}说：{msg['content']}"}
+                         for msg in messages[-5:]]  # 最近5条消息作为上下文
+        self._rendered = self.version
+
+    @property
+    def prefix(self) -> str:
+        """提示词公共部分"""
+        self._render()
+        return self._prefix
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """对话历史（最近5条公共消息）"""
+        self._render()
+        return list(self._history)
+
+    def teammates(self, user_id: str) -> List[str]:
+        return [name for uid, name in self.wolves if uid != user_id]
+
+
+class AIContextRegistry:
+    """本进程负责的房间的AI上下文；公共消息写入时通过事件日志回调增量更新"""
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomAIContext] = {}
+
+    async def get(self, room: RoomState) -> RoomAIContext:
+        """取得房间上下文并按房间当前状态同步；首次使用时从Redis读取最近的消息"""
+        ctx = self._rooms.get(room.room_id)
+        if ctx is None:
+            ctx = RoomAIContext(room.room_id)
+            # 之前的死亡时间已无从得知，只记录死因
+            ctx.memory.record_deaths([p for p in room.players if not p.alive], None, None)
+            ctx.sync_room(room)
+            for message in await redis_service.get_room_messages(room.room_id, offset=-BOOTSTRAP_MESSAGES):
+                ctx.add_message(message)
+            # 读取期间可能已有其他协程建立了上下文
+            ctx = self._rooms.setdefault(room.room_id, ctx)
+        ctx.sync_room(room)
+        return ctx
+
+    def peek(self, room_id: str) -> Optional[RoomAIContext]:
+        """取得已建立的房间上下文，不按房间状态同步（预生成时传入的是按将来状态构造的房间副本）"""
+        return self._rooms.get(room_id)
+
+    def observe_message(self, room_id: str, message: Dict):
+        ctx = self._rooms.get(room_id)
+        if ctx is not None:
+            ctx.add_message(message)
+
+    def forget(self, room_id: str):
+        """房间结束、迁出或被其他进程写过：下次使用时重新建立"""
+        self._rooms.pop(room_id, None)
+
+
+# 全局AI上下文
+ai_contexts = AIContextRegistry()
+game_event_log.set_room_message_callback(ai_contexts.observe_message)
@@ -1,8 +1,13 @@
 import dashscope
 from dashscope import Generation
+import asyncio
+import json
+import re
 import sys
+import time
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 # 添加 backend 目录到 Python 路径，以便正确导入模块
 backend_dir = Path(__file__).parent.parent
@@ -10,9 +15,22 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
 from config import config
+from services.metrics_service import LLM_SECONDS, LLM_TOKENS, LLM_ERRORS, LLM_DEADLINE
+from services.tracing import tracer, CAT_AI
+from services.model_router import model_router
 
 dashscope.api_key = config.DASHSCOPE_API_KEY
 
+
+class AIDeadlineExceeded(Exception):
+    """大模型调用无法在截止时间前完成（剩余时间不足未发起，或等待超时已放弃）"""
+
+
+# 回复中的第一个JSON对象（允许外面包着 ```json 代码块或多余文字）
+_JSON_OBJECT = re.compile(r"\{.*?\}", re.S)
+# 座位号：数字，可带一个"号"
+_SEAT_NUMBER = re.compile(r"^(\d+)号?$")
+
 class AIService:
     """AI服务，使用通义千问API"""
     
@@ -20,9 +38,27 @@ class AIService:
     async def generate_response(
         messages: List[Dict[str, str]],
         system_prompt: Optional[str] = None,
-        temperature: float = 0.7
+        temperature: Optional[float] = None,
+        call_site: str = "chat",
+        timeout: Optional[float] = None,
+        json_mode: bool = False
     ) -> str:
-        """生成AI回复"""
+        """生成AI回复
+        
+        Args:
+            temperature: 不传时使用该调用场景路由配置的温度
+            call_site: 调用场景（speech/vote/last_words/mystery/chat 等），决定使用的模型和输出长度（见 model_router），
+                并用于按场景统计耗时、token和失败次数
+            timeout: 可用时间（秒）。不足 AI_MIN_CALL_BUDGET 时不发起调用，超时后放弃等待，
+                两种情况都抛出 AIDeadlineExceeded，由调用方立即使用兜底结果
+            json_mode: 要求模型只输出JSON对象（提示词中需要说明JSON格式）
+        """
+        if timeout is not None and timeout < config.AI_MIN_CALL_BUDGET:
+            LLM_DEADLINE.inc(call_site=call_site, outcome="skipped")
+            raise AIDeadlineExceeded(f"剩余 {timeout:.1f} 秒，不足以调用大模型")
+        route, model = model_router.select(call_site)
+        started_at = time.time()
+        start = time.perf_counter()
         try:
             # 构建消息列表
             api_messages = []
@@ -30,19 +66,51 @@ class AIService:
                 api_messages.append({"role": "system", "content": system_prompt})
             api_messages.extend(messages)
             
-            response = Generation.call(
-                model='qwen-turbo',
+            extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+            if route.max_tokens:
+                extra["max_tokens"] = route.max_tokens
+            
+            # SDK 是同步调用，放到线程池执行，避免阻塞事件循环；超时后不再等待其结果
+            call = asyncio.get_running_loop().run_in_executor(None, partial(
+                Generation.call,
+                model=model,
                 messages=api_messages,
-                temperature=temperature,
-                result_format='message'
-            )
+                temperature=route.temperature if temperature is None else temperature,
+                result_format='message',
+                **extra
+            ))
+            if timeout is None:
+                response = await call
+            else:
+                try:
+                    response = await asyncio.wait_for(call, timeout=timeout)
+                except asyncio.TimeoutError:
+                    # 超时按已等待的时间计入，持续超时同样会触发降级
+                    model_router.observe(call_site, model, time.perf_counter() - start)
+                    LLM_DEADLINE.inc(call_site=call_site, outcome="timeout")
+                    LLM_ERRORS.inc(call_site=call_site, reason="deadline")
+                    raise AIDeadlineExceeded(f"{timeout:.1f} 秒内未返回")
+                LLM_DEADLINE.inc(call_site=call_site, outcome="in_time")
+            model_router.observe(call_site, model, time.perf_counter() - start)
             
             if response.status_code == 200:
+                usage = getattr(response, "usage", None)
+                if usage:
+                    LLM_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, call_site=call_site, kind="input")
+                    LLM_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, call_site=call_site, kind="output")
                 return response.output.choices[0].message.content
             else:
+                LLM_ERRORS.inc(call_site=call_site, reason=f"status_{response.status_code}")
                 return f"AI服务错误: {response.message}"
+        except AIDeadlineExceeded:
+            raise
         except Exception as e:
+            LLM_ERRORS.inc(call_site=call_site, reason=type(e).__name__)
             return f"AI服务异常: {str(e)}"
+        finally:
+            elapsed = time.perf_counter() - start
+            LLM_SECONDS.observe(elapsed, call_site=call_site)
+            tracer.record(call_site, CAT_AI, started_at, elapsed, call_site=call_site, model=model)
     
     @staticmethod
     def build_character_prompt(character: Dict, custom_personality: Optional[str] = None) -> str:
@@ -136,17 +204,10 @@ class AIService:
 现在开始解谜吧！"""
     
     @staticmethod
-    def build_werewolf_ai_prompt(player_role: str, role_name: str, role_desc: str, 
-                                 game_phase: str, day_count: int, 
-                                 recent_messages: List[Dict], 
-                                 alive_players: List[Dict],
-                                 teammates: List[str] = None) -> str:
-        """构建狼人杀AI玩家的prompt"""
-        role_info = f"你的身份是：{role_name}\n{role_desc}"
-        
-        if player_role == "wolf" and teammates:
-            role_info += f"\n你的狼人队友：{', '.join(teammates)}"
-        
+    def build_werewolf_context_prompt(game_phase: str, day_count: int,
+                                      recent_messages: List[Dict],
+                                      alive_players: List[Dict], memory_text: str = "") -> str:
+        """狼人杀AI提示词的公共部分（同一房间所有AI玩家相同，放在最前面，便于服务端缓存前缀）"""
         # 构建最近消息上下文
         messages_text = ""
         for msg in recent_messages[-5:]:  # 最近5条消息
@@ -160,21 +221,40 @@ class AIService:
         
         phase_desc = {
             "day": f"第{day_count}天白天讨论阶段",
-            "voting": "投票阶段",
+            "voting": f"第{day_count}天投票阶段",
             "night": "夜晚阶段"
         }.get(game_phase, game_phase)
         
-        prompt = f"""你正在参与一场狼人杀游戏。
-
-【你的身份】
-{role_info}
+        # 对局记录（死亡、投票、身份声明），没有时省略整段
+        memory_section = f"\n【局势记录】\n{memory_text}\n" if memory_text else ""
+        
+        return f"""你正在参与一场狼人杀游戏。
 
 【游戏状态】
 当前阶段：{phase_desc}
 存活玩家：{alive_text}
-
+{memory_section}
 【最近发言】
 {messages_text if messages_text else "暂无发言"}
+"""
+    
+    @staticmethod
+    def build_werewolf_role_info(player_role: str, role_name: str, role_desc: str,
+                                 teammates: List[str] = None, seer_results: str = "") -> str:
+        """AI玩家的身份说明（狼人附带队友，预言家附带自己的查验结果）"""
+        role_info = f"你的身份是：{role_name}\n{role_desc}"
+        if player_role == "wolf" and teammates:
+            role_info += f"\n你的狼人队友：{', '.join(teammates)}"
+        if player_role == "seer" and seer_results:
+            role_info += f"\n你的查验结果：{seer_results}"
+        return role_info
+    
+    @staticmethod
+    def build_werewolf_speech_suffix(role_info: str) -> str:
+        """白天发言提示词的角色部分（接在公共部分之后）"""
+        return f"""
+【你的身份】
+{role_info}
 
 【你的任务】
 1. 根据你的身份，以符合角色的方式发言
@@ -185,8 +265,72 @@ class AIService:
 6. 发言长度控制在1-2句话，不要太长
 
 请根据当前游戏情况，发表你的看法或回应其他玩家的发言。只返回你的发言内容，不要其他说明。"""
+    
+    @staticmethod
+    def build_werewolf_vote_suffix(role_info: str, candidates: List[Tuple[str, str]], is_wolf: bool) -> str:
+        """投票提示词的角色部分（接在公共部分之后）
         
-        return prompt
+        candidates 为 (编号, 用户名)，模型只需返回编号，由 parse_werewolf_target 解析
+        """
+        wolf_rule = "\n重要：你绝对不能投票给队友，只能投票给好人。" if is_wolf else ""
+        candidates_text = "\n".join(f"{code}号：{name}" for code, name in candidates)
+        return f"""
+【你的身份】
+{role_info}{wolf_rule}
+
+【可投票玩家】
+{candidates_text}
+
+【你的任务】
+你需要投票出局一名玩家。根据你的身份：
+1. 如果是狼人，必须投票给好人，绝对不能投票给队友
+2. 如果是好人，应该投票给可疑的狼人
+3. 根据发言和逻辑推理选择目标
+
+【输出格式】
+只输出一个JSON对象，target 为上面列出的编号（数字），不要其他说明，例如：
+{{"target": {candidates[0][0] if candidates else 1}}}"""
+    
+    @staticmethod
+    def parse_werewolf_target(reply: Optional[str], seats: Dict[int, str]) -> Optional[str]:
+        """解析投票/选择目标的JSON回复，返回 user_id
+        
+        seats 为候选人的 {座位号: user_id}。target 只接受座位号（整数或"3号"写法），不接受用户名，
+        避免名叫"3"的玩家与3号座位混淆；不在候选人中或格式不符时返回 None，由调用方使用兜底决策。
+        """
+        if not reply:
+            return None
+        match = _JSON_OBJECT.search(reply)
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        target = data.get("target")
+        if isinstance(target, bool) or target is None:
+            return None
+        if isinstance(target, float) and target.is_integer():
+            target = int(target)
+        if isinstance(target, int):
+            return seats.get(target)
+        if not isinstance(target, str):
+            return None
+        match = _SEAT_NUMBER.match(target.strip())
+        return seats.get(int(match.group(1))) if match else None
+    
+    @staticmethod
+    def build_werewolf_ai_prompt(player_role: str, role_name: str, role_desc: str, 
+                                 game_phase: str, day_count: int, 
+                                 recent_messages: List[Dict], 
+                                 alive_players: List[Dict],
+                                 teammates: List[str] = None) -> str:
+        """构建狼人杀AI玩家的发言prompt（公共部分 + 角色部分）"""
+        return (AIService.build_werewolf_context_prompt(game_phase, day_count, recent_messages, alive_players)
+                + AIService.build_werewolf_speech_suffix(
+                    AIService.build_werewolf_role_info(player_role, role_name, role_desc, teammates)))
 
 
 
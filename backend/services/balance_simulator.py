@@ -0,0 +1,281 @@
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from models.game import PlayerRole
+from services.role_presets import RolePreset
+
+# 角色编码（数组里用小整数表示角色）
+VILLAGER, WOLF, SEER, WITCH, HUNTER, GUARD = range(6)
+ROLE_CODES = {
+    PlayerRole.VILLAGER: VILLAGER,
+    PlayerRole.WOLF: WOLF,
+    PlayerRole.SEER: SEER,
+    PlayerRole.WITCH: WITCH,
+    PlayerRole.HUNTER: HUNTER,
+    PlayerRole.GUARD: GUARD,
+}
+
+# 对局结果
+UNFINISHED, WOLVES_WIN, VILLAGERS_WIN = 0, 1, 2
+
+NO_TARGET = -1
+# 好人从发言中识别狼人的能力：公认可疑对象的随机得分里狼人额外加的分（0 表示完全靠猜）
+DEFAULT_CLUE = 0.3
+
+
+class BalanceResult:
+    """一个板子的模拟结果"""
+    __slots__ = ("preset_id", "size", "games", "wolves", "villagers", "unfinished", "total_days")
+
+    def __init__(self, preset_id: str, size: int):
+        self.preset_id = preset_id
+        self.size = size
+        self.games = 0
+        self.wolves = 0
+        self.villagers = 0
+        self.unfinished = 0
+        self.total_days = 0
+
+    def add(self, winner: np.ndarray, days: np.ndarray):
+        self.games += winner.size
+        self.wolves += int((winner == WOLVES_WIN).sum())
+        self.villagers += int((winner == VILLAGERS_WIN).sum())
+        self.unfinished += int((winner == UNFINISHED).sum())
+        self.total_days += int(days.sum())
+
+    @property
+    def wolf_rate(self) -> float:
+        return self.wolves / self.games if self.games else 0.0
+
+    @property
+    def villager_rate(self) -> float:
+        return self.villagers / self.games if self.games else 0.0
+
+    @property
+    def margin(self) -> float:
+        """狼人胜率的95%置信区间半宽"""
+        if not self.games:
+            return 0.0
+        p = self.wolf_rate
+        return 1.96 * (p * (1 - p) / self.games) ** 0.5
+
+    @property
+    def avg_days(self) -> float:
+        return self.total_days / self.games if self.games else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "preset": self.preset_id,
+            "size": self.size,
+            "games": self.games,
+            "wolves_win_rate": self.wolf_rate,
+            "villagers_win_rate": self.villager_rate,
+            "unfinished_rate": self.unfinished / self.games if self.games else 0.0,
+            "margin": self.margin,
+            "avg_days": self.avg_days,
+        }
+
+
+def _pick(rng: np.random.Generator, allowed: np.ndarray, prefer: Optional[np.ndarray] = None) -> np.ndarray:
+    """每局在 allowed 为真的座位中随机选一个（prefer 为真的优先），没有可选时为 NO_TARGET"""
+    scores = rng.random(allowed.shape, dtype=np.float32)
+    if prefer is not None:
+        scores += prefer
+    scores[~allowed] = -1.0
+    picked = scores.argmax(axis=1)
+    return np.where(allowed.any(axis=1), picked, NO_TARGET)
+
+
+def _one_hot(target: np.ndarray, n: int) -> np.ndarray:
+    """(B,) 的座位号 -> (B, n) 的布尔矩阵，NO_TARGET 为全假"""
+    return target[:, None] == np.arange(n)[None, :]
+
+
+def _seat(mask: np.ndarray) -> np.ndarray:
+    """每局第一个 mask 为真的座位，没有时为 NO_TARGET"""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), NO_TARGET)
+
+
+def _tally(ballots: np.ndarray, n: int) -> np.ndarray:
+    """(B, n) 的投票目标 -> (B, n) 的得票数"""
+    games = ballots.shape[0]
+    valid = ballots != NO_TARGET
+    flat = (ballots + np.arange(games)[:, None] * n)[valid]
+    return np.bincount(flat, minlength=games * n).reshape(games, n)
+
+
+class BatchSimulator:
+    """批量模拟同一板子的多局机器人对局，每局一行，整批按数组推进
+
+    结算规则与 WerewolfService 一致：
+      - 夜晚按 守卫 -> 狼人 -> 预言家 -> 女巫 行动；守卫不能连续两晚守同一人
+      - 女巫每晚只用一瓶药，首夜不能自救；被刀者同守同救仍死亡，毒药无视守卫
+      - 猎人被刀或被投票出局时开枪，被毒死不能开枪
+      - 投票平票无人出局；每次结算后按屠边规则判定胜负（神职或平民全灭狼人胜，先于狼人全灭判定）
+    机器人策略（与本地怀疑度矩阵的思路相同，但只保留公开信息）：
+      - 预言家优先验没验过的人，验出狼人后第二天公布，此后好人集中投这名狼人、猎人优先带走他、女巫优先毒他
+      - 狼人统一刀人和投票，预言家公布身份后优先刀/投预言家；守卫优先守已公布身份的预言家
+      - 没有查验结果时好人集中投公认最可疑的人（clue 越大越容易是狼人），狼人跟着投好人，躲不开时统一投一名好人
+    """
+
+    def __init__(self, preset: RolePreset, rng: np.random.Generator, clue: float = DEFAULT_CLUE):
+        self.preset = preset
+        self.rng = rng
+        self.clue = clue
+        self.roles = np.array([ROLE_CODES[r] for r in preset.build_roles()], dtype=np.int8)
+        self.n = self.roles.size
+
+    def _deal(self, games: int) -> np.ndarray:
+        """每局独立打乱座位"""
+        order = self.rng.random((games, self.n)).argsort(axis=1)
+        return self.roles[order]
+
+    def _winner(self, role: np.ndarray, alive: np.ndarray) -> np.ndarray:
+        gods = (alive & ((role == SEER) | (role == WITCH) | (role == HUNTER) | (role == GUARD))).any(axis=1)
+        villagers = (alive & (role == VILLAGER)).any(axis=1)
+        wolves = (alive & (role == WOLF)).any(axis=1)
+        return np.where(~gods | ~villagers, WOLVES_WIN, np.where(~wolves, VILLAGERS_WIN, UNFINISHED))
+
+    def play(self, games: int, max_days: int):
+        """模拟 games 局，返回每局的 (胜方, 经过的天数)"""
+        rng, n = self.rng, self.n
+        winner = np.full(games, UNFINISHED, dtype=np.int8)
+        days = np.zeros(games, dtype=np.int32)
+        g = _Games(self._deal(games))
+
+        def hunter_shoot(shooter):
+            # 被刀或被投票出局的猎人开枪（被毒不能开枪），优先带走已公布的狼人
+            shooter = np.where((shooter != NO_TARGET) & g.is_hunter[g.rows, np.maximum(shooter, 0)], shooter, NO_TARGET)
+            if (shooter != NO_TARGET).any():
+                target = _pick(rng, g.alive & (shooter != NO_TARGET)[:, None], g.public_wolf * 2.0)
+                g.alive &= ~_one_hot(target, n)
+
+        def settle():
+            """按屠边规则判定胜负，已结束的对局从批中移除"""
+            result = self._winner(g.role, g.alive)
+            ended = result != UNFINISHED
+            if ended.any():
+                winner[g.index[ended]] = result[ended]
+                g.keep(~ended)
+
+        for night in range(1, max_days + 1):
+            if not g.index.size:
+                break
+            # 预言家公布身份后，狼人优先刀/投他，守卫优先守他
+            seer_pref = (g.is_seer & g.found_wolf.any(axis=1)[:, None]) * 2.0
+
+            # 守卫：不能连续两晚守同一人
+            guard_on = g.on_duty(g.guard_seat)
+            guard_target = _pick(rng, g.alive & ~_one_hot(g.last_guard, n) & guard_on[:, None], seer_pref)
+            g.last_guard = np.where(guard_on, guard_target, g.last_guard)
+
+            # 狼人：统一刀一名好人
+            kill = _pick(rng, g.alive & ~g.is_wolf, seer_pref)
+
+            # 预言家：优先验没验过的人
+            check = _one_hot(_pick(rng, g.alive & ~g.is_seer & g.on_duty(g.seer_seat)[:, None], (~g.checked) * 2.0), n)
+            g.checked |= check
+            g.found_wolf |= check & g.is_wolf
+
+            # 女巫：有人被刀且有解药时救（首夜不能自救），否则毒已公布的狼人；每晚只用一瓶
+            witch_on = g.on_duty(g.witch_seat)
+            save = witch_on & g.antidote & (kill != NO_TARGET) & ~((night == 1) & (kill == g.witch_seat))
+            poison_target = _pick(rng, g.alive & g.public_wolf & (witch_on & g.poison & ~save)[:, None])
+            g.antidote &= ~save
+            g.poison &= poison_target == NO_TARGET
+
+            # 结算：同守同救死亡，守或救之一存活；毒药无视守卫
+            killed = np.where((kill != NO_TARGET) & ((guard_target == kill) == save), kill, NO_TARGET)
+            g.alive &= ~(_one_hot(killed, n) | _one_hot(poison_target, n))
+            days[g.index] += 1
+
+            # 预言家的查验结果在白天公布（夜里死亡时通过遗言公布）
+            g.public_wolf |= g.found_wolf
+            g.public_good |= g.checked & ~g.is_wolf
+
+            hunter_shoot(killed)
+            settle()
+            if not g.index.size:
+                break
+
+            # 白天投票：好人集中投已公布的狼人，没有时投公认最可疑的人（不投已验明的好人，clue 为发言透露的狼人线索）；
+            # 狼人跟随好人投好人，好人要投的是狼人时统一投一名好人
+            seer_pref = (g.is_seer & g.found_wolf.any(axis=1)[:, None]) * 2.0
+            suspects = g.alive & ~g.public_good
+            suspects = np.where(suspects.any(axis=1)[:, None], suspects, g.alive)
+            focus = _seat(g.alive & g.public_wolf)
+            focus = np.where(focus != NO_TARGET, focus, _pick(rng, suspects, g.is_wolf * self.clue))
+            focus_is_wolf = g.is_wolf[g.rows, np.maximum(focus, 0)]
+            wolf_vote = np.where(focus_is_wolf, _pick(rng, g.alive & ~g.is_wolf, seer_pref), focus)
+            ballots = np.where(g.is_wolf, wolf_vote[:, None], focus[:, None])
+            # 被集中投票的好人弃票
+            ballots = np.where(g.alive & (ballots != np.arange(n)[None, :]), ballots, NO_TARGET)
+            tally = _tally(ballots, n)
+            top = tally.max(axis=1)
+            unique = (tally == top[:, None]).sum(axis=1) == 1
+            out = np.where(unique & (top > 0), tally.argmax(axis=1), NO_TARGET)
+            g.alive &= ~_one_hot(out, n)
+
+            hunter_shoot(out)
+            settle()
+
+        return winner, days
+
+
+class _Games:
+    """进行中的对局（每局一行）；对局结束后整行移除，之后的每一步只处理还没结束的对局"""
+    __slots__ = ("index", "rows", "role", "is_wolf", "is_seer", "is_hunter", "alive", "antidote", "poison",
+                 "last_guard", "checked", "found_wolf", "public_wolf", "public_good",
+                 "guard_seat", "seer_seat", "witch_seat")
+
+    def __init__(self, role: np.ndarray):
+        games, n = role.shape
+        self.index = np.arange(games)  # 在整批结果中的位置
+        self.rows = np.arange(games)
+        self.role = role
+        self.is_wolf = role == WOLF
+        self.is_seer = role == SEER
+        self.is_hunter = role == HUNTER
+        self.alive = np.ones((games, n), dtype=bool)
+        self.antidote = np.ones(games, dtype=bool)
+        self.poison = np.ones(games, dtype=bool)
+        self.last_guard = np.full(games, NO_TARGET)
+        self.checked = np.zeros((games, n), dtype=bool)
+        self.found_wolf = np.zeros((games, n), dtype=bool)  # 预言家验出的狼人
+        self.public_wolf = np.zeros((games, n), dtype=bool)  # 已公布的狼人
+        self.public_good = np.zeros((games, n), dtype=bool)  # 已公布的好人
+        # 守卫/预言家/女巫按单人角色结算
+        self.guard_seat = _seat(role == GUARD)
+        self.seer_seat = _seat(self.is_seer)
+        self.witch_seat = _seat(role == WITCH)
+
+    def keep(self, mask: np.ndarray):
+        for name in self.__slots__:
+            if name != "rows":
+                setattr(self, name, getattr(self, name)[mask])
+        self.rows = np.arange(self.index.size)
+
+    def on_duty(self, seat: np.ndarray) -> np.ndarray:
+        """该角色存在且存活"""
+        return (seat != NO_TARGET) & self.alive[self.rows, np.maximum(seat, 0)]
+
+
+def simulate_preset(preset: RolePreset, games: int, batch: int = 100_000, seed: Optional[int] = None,
+                    max_days: Optional[int] = None, clue: float = DEFAULT_CLUE) -> BalanceResult:
+    """按批模拟一个板子的 games 局对局（每批内存约 batch * 人数 * 几十字节）"""
+    simulator = BatchSimulator(preset, np.random.default_rng(seed), clue)
+    result = BalanceResult(preset.preset_id, simulator.n)
+    remaining = games
+    while remaining > 0:
+        size = min(batch, remaining)
+        result.add(*simulator.play(size, max_days or simulator.n))
+        remaining -= size
+    return result
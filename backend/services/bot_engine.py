@@ -0,0 +1,192 @@
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from services.game_memory import speech_cues
+
+# 怀疑度范围：正数越大越像狼人，负数越小越可信；确知身份时取两端
+CERTAIN = 5.0
+# 投票者的怀疑度变化（按观察者对被投者的看法）
+VOTE_WEIGHT = 0.8
+# 被狼刀的玩家可信，之前投过他的玩家增加的怀疑度
+WOLF_VICTIM_VOTER_WEIGHT = 1.0
+# 发言中指认/力保其他玩家对观察者看法的影响
+SPEECH_WEIGHT = 0.4
+# 女巫对某名玩家的怀疑度超过该值时使用毒药
+POISON_THRESHOLD = 3.0
+
+
+class SuspicionMatrix:
+    """单个房间的怀疑度矩阵，供AI玩家在本地快速决定夜间行动和投票
+
+    scores[i, j] 表示玩家 i 眼中玩家 j 是狼人的程度，known[i, j] 表示 i 已确知 j 的阵营
+    （自己、狼人队友、预言家查验过的玩家）。投票、死亡、查验结果和发言按发生顺序增量更新，
+    更新和决策都是对整行/整列的向量运算，不调用大模型。同分时按座位轮换取舍，结果可复现。
+    """
+    __slots__ = ("ids", "names", "index", "wolves", "alive", "scores", "known", "votes")
+
+    def __init__(self, players: Sequence[Tuple[str, str, bool]]):
+        """players: 按座位顺序的 (user_id, username, 是否狼人)"""
+        n = len(players)
+        self.ids = [uid for uid, _, _ in players]
+        self.names = [name for _, name, _ in players]
+        self.index = {}
+        for i, (uid, name, _) in enumerate(players):
+            self.index[uid] = i
+            self.index[name] = i
+        self.wolves = np.array([is_wolf for _, _, is_wolf in players], dtype=bool)
+        self.alive = np.ones(n, dtype=bool)
+        self.scores = np.zeros((n, n))
+        self.known = np.eye(n, dtype=bool)
+        self.votes = np.zeros((n, n))  # votes[i, j]：i 投给 j 的次数
+        # 狼人互相知道身份，也就知道其余都是好人
+        self.known[self.wolves] = True
+        self.scores[self.wolves] = np.where(self.wolves, -CERTAIN, CERTAIN)
+        np.fill_diagonal(self.scores, -CERTAIN)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def copy(self) -> "SuspicionMatrix":
+        matrix = SuspicionMatrix.__new__(SuspicionMatrix)
+        matrix.ids, matrix.names, matrix.index = self.ids, self.names, self.index
+        matrix.wolves = self.wolves
+        matrix.alive = self.alive.copy()
+        matrix.scores = self.scores.copy()
+        matrix.known = self.known.copy()
+        matrix.votes = self.votes.copy()
+        return matrix
+
+    def _adjust(self, delta: np.ndarray):
+        """把增量加到尚未确知的格子上"""
+        self.scores += np.where(self.known, 0.0, delta)
+        np.clip(self.scores, -CERTAIN, CERTAIN, out=self.scores)
+
+    # ---------- 增量更新 ----------
+
+    def observe_vote(self, voter: str, target: str):
+        v, t = self.index.get(voter), self.index.get(target)
+        if v is None or t is None:
+            return
+        self.votes[v, t] += 1
+        # 投给自己信任的人 -> 更怀疑投票者；投给自己怀疑的人 -> 更信任投票者
+        delta = np.zeros_like(self.scores)
+        delta[:, v] = -VOTE_WEIGHT * np.tanh(self.scores[:, t])
+        self._adjust(delta)
+
+    def observe_death(self, user_id: str, died_by: Optional[str]):
+        j = self.index.get(user_id)
+        if j is None or not self.alive[j]:
+            return
+        self.alive[j] = False
+        if died_by == "wolf":
+            # 被狼刀的基本是好人，投过他的玩家更可疑
+            delta = np.zeros_like(self.scores)
+            delta += WOLF_VICTIM_VOTER_WEIGHT * self.votes[:, j][None, :]
+            delta[:, j] = -CERTAIN
+            self._adjust(delta)
+
+    def observe_check(self, seer_id: str, target: str, is_wolf: bool):
+        s, t = self.index.get(seer_id), self.index.get(target)
+        if s is None or t is None:
+            return
+        self.scores[s, t] = CERTAIN if is_wolf else -CERTAIN
+        self.known[s, t] = True
+
+    def observe_speech(self, speaker: str, content: str):
+        """发言中指认（+1）或力保（-1）某人：观察者越信任发言者，越认同他的判断（越怀疑则越不理会）"""
+        s = self.index.get(speaker)
+        if s is None:
+            return
+        cues = speech_cues(speaker, content, self.names)
+        if not cues:
+            return
+        trust = 0.5 - 0.5 * np.tanh(self.scores[:, s])  # 每个观察者对发言者的信任程度（0~1）
+        delta = np.zeros_like(self.scores)
+        for name, cue in cues:
+            delta[:, self.index[name]] += SPEECH_WEIGHT * cue * trust
+        delta[s] = 0.0
+        self._adjust(delta)
+
+    # ---------- 决策 ----------
+
+    def _pick(self, values: np.ndarray, candidates: Iterable[str], rotation: int = 0,
+              highest: bool = True) -> Optional[str]:
+        """在候选人中取 values 最大（或最小）者；同分时按座位轮换决定"""
+        idx = np.array([self.index[c] for c in candidates if c in self.index], dtype=int)
+        if idx.size == 0:
+            return None
+        n = self.size
+        tiebreak = ((idx + rotation) % n) * 1e-6
+        picked = values[idx] + tiebreak if highest else values[idx] - tiebreak
+        return self.ids[idx[np.argmax(picked) if highest else np.argmin(picked)]]
+
+    def _public_view(self) -> np.ndarray:
+        """存活好人眼中各玩家的平均怀疑度（狼人借此判断谁更受信任、谁已被怀疑）"""
+        observers = self.alive & ~self.wolves
+        if not observers.any():
+            return np.zeros(self.size)
+        return self.scores[observers].mean(axis=0)
+
+    def choose_vote(self, voter_id: str, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        v = self.index.get(voter_id)
+        if v is None:
+            return None
+        if self.wolves[v]:
+            # 狼人跟随好人中最被怀疑的非狼玩家，不暴露自己
+            good = [c for c in candidates if c in self.index and not self.wolves[self.index[c]]]
+            return self._pick(self._public_view(), good, rotation)
+        return self._pick(self.scores[v], candidates, rotation)
+
+    def choose_wolf_kill(self, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        """刀最受好人信任的玩家（多半是神职或已被验为好人）"""
+        good = [c for c in candidates if c in self.index and not self.wolves[self.index[c]]]
+        return self._pick(self._public_view(), good, rotation, highest=False)
+
+    def choose_seer_check(self, seer_id: str, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        """优先查验还没验过的人里最可疑的"""
+        s = self.index.get(seer_id)
+        if s is None:
+            return None
+        unknown = [c for c in candidates if c in self.index and not self.known[s, self.index[c]]]
+        return self._pick(self.scores[s], unknown or candidates, rotation)
+
+    def choose_guard(self, guard_id: str, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        """守护最受好人信任的人（也就是狼人最可能刀的人），守卫眼中可疑的人除外"""
+        g = self.index.get(guard_id)
+        if g is None:
+            return None
+        trusted = [c for c in candidates if c in self.index and self.scores[g, self.index[c]] <= 0]
+        return self._pick(self._public_view(), trusted or candidates, rotation, highest=False)
+
+    def choose_poison(self, witch_id: str, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        """怀疑度超过阈值时毒杀最可疑的人，否则不用毒"""
+        w = self.index.get(witch_id)
+        if w is None:
+            return None
+        target = self._pick(self.scores[w], candidates, rotation)
+        if target is None or self.scores[w, self.index[target]] < POISON_THRESHOLD:
+            return None
+        return target
+
+    def choose_hunter_shot(self, hunter_id: str, candidates: Sequence[str], rotation: int = 0) -> Optional[str]:
+        h = self.index.get(hunter_id)
+        if h is None:
+            return None
+        return self._pick(self.scores[h], candidates, rotation)
+
+    def suspects(self, user_id: str, top: int = 3) -> List[str]:
+        """某名玩家最怀疑的几个存活玩家（调试和日志用）"""
+        i = self.index.get(user_id)
+        if i is None:
+            return []
+        order = np.argsort(-self.scores[i])
+        return [self.names[j] for j in order if self.alive[j] and j != i][:top]
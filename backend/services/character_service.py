@@ -11,19 +11,31 @@ if str(backend_dir) not in sys.path:
 
 from models.character import Character, CharacterMemory
 from services.redis_service import redis_service
+from services.content_loader import ContentLoader, content_watcher
 
 class CharacterService:
     """角色服务"""
     
     def __init__(self):
         self.characters_file = os.path.join(os.path.dirname(__file__), "..", "data", "characters.json")
-        self._load_characters()
+        self._loader = ContentLoader(self.characters_file, self._load_characters, name="characters")
+        content_watcher.register(self._loader)
     
-    def _load_characters(self):
-        """加载角色数据"""
-        with open(self.characters_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            self.characters = {char["id"]: char for char in data["characters"]}
+    @staticmethod
+    def _load_characters(data: Dict) -> Dict[str, Dict]:
+        """校验角色数据并构建索引 {character_id: character}"""
+        characters = {}
+        for char in data["characters"]:
+            Character(**char)  # 校验字段，失败时抛出异常
+            if char["id"] in characters:
+                raise ValueError(f"角色ID重复: {char['id']}")
+            characters[char["id"]] = char
+        return characters
+    
+    @property
+    def characters(self) -> Dict[str, Dict]:
+        """当前生效的角色索引（热更新时整体替换，不要原地修改）"""
+        return self._loader.current
     
     def get_all_characters(self) -> List[Dict]:
         """获取所有角色"""
@@ -38,8 +50,9 @@ class CharacterService:
         user_data = await redis_service.get_user_data(user_id)
         unlocked_ids = user_data.get("unlocked_characters", ["cat"]) if user_data else ["cat"]
         
-        unlocked = [char for char_id, char in self.characters.items() if char_id in unlocked_ids]
-        locked = [char for char_id, char in self.characters.items() if char_id not in unlocked_ids]
+        characters = self.characters
+        unlocked = [char for char_id, char in characters.items() if char_id in unlocked_ids]
+        locked = [char for char_id, char in characters.items() if char_id not in unlocked_ids]
         
         return {
             "unlocked": unlocked,
@@ -91,7 +104,7 @@ class CharacterService:
         user_data = await redis_service.get_user_data(user_id) or {}
         unlocked_ids = user_data.get("unlocked_characters", ["cat"]) if user_data else ["cat"]
         
-        # 遍历所有角色，检查是否有需要解锁的
+        # 遍历所有角色，检查是否有需要解锁的（固定使用同一版本的索引）
         for character_id, character in self.characters.items():
             # 如果已经解锁，跳过
             if character_id in unlocked_ids:
@@ -0,0 +1,456 @@
+import asyncio
+import json
+import sys
+import time
+import uuid
+import zlib
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # 未安装时只提供 JSON 文本帧
+    msgpack = None
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from services.metrics_service import WS_FRAMES, WS_BYTES, WS_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# 连续多次心跳未响应，服务端断开连接
+WS_CLOSE_IDLE = 4408
+
+
+def encode_frame(payload: Any) -> str:
+    """统一的出站帧编码：紧凑分隔符，中文不转义（UTF-8 下每个汉字3字节，转义后6字节）"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+async def receive_frame(websocket: WebSocket) -> Dict:
+    """读取一帧客户端消息：文本帧按 JSON 解析，二进制帧按 msgpack 解析"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    WS_FRAMES.inc(direction="in")
+    if message.get("bytes") is not None:
+        WS_BYTES.inc(len(message["bytes"]), direction="in")
+        if msgpack is None:
+            raise ValueError("服务端未安装 msgpack，无法解析二进制帧")
+        return msgpack.unpackb(message["bytes"], raw=False)
+    WS_BYTES.inc(len(message["text"].encode("utf-8")), direction="in")
+    return json.loads(message["text"])
+
+
+def with_seq(message: str, seq: int) -> str:
+    """在JSON对象帧开头插入序号字段（不重新解析整帧）"""
+    if message.startswith("{"):
+        rest = message[1:].lstrip()
+        if rest.startswith("}"):
+            return f'{{"seq":{seq}}}'
+        return f'{{"seq":{seq},{message[1:]}'
+    return message
+
+
+def batch_frame(frames: List[str], **fields) -> str:
+    """把若干已序列化的帧合并为一个 batch 帧（保持顺序）"""
+    head = "".join(f'"{k}":{json.dumps(v)},' for k, v in fields.items())
+    return f'{{"type":"batch",{head}"frames":[{",".join(frames)}]}}'
+
+
+class TransferStats:
+    """出站流量统计：帧数、原始 JSON 字节数、实际编码字节数（msgpack 连接不同），
+    以及按 WS_COMPRESSION_SAMPLE 抽样估算的 permessage-deflate 压缩后字节数
+
+    压缩发生在 WebSocket 协议层，服务端拿不到压缩后的真实长度；抽样帧单独做一次原始 deflate，
+    不复用压缩上下文，估算值偏保守。
+    """
+    __slots__ = ("frames", "raw_bytes", "encoded_bytes", "deflate_frames", "deflate_bytes",
+                 "sampled_bytes", "sampled_deflated")
+
+    def __init__(self):
+        self.frames = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.deflate_frames = 0  # 已协商压缩的连接发送的帧
+        self.deflate_bytes = 0  # 上述帧的编码字节数
+        self.sampled_bytes = 0
+        self.sampled_deflated = 0
+
+    def record(self, raw: str, encoded: Any, deflate: bool):
+        raw_size = len(raw.encode("utf-8"))
+        size = len(encoded) if isinstance(encoded, bytes) else raw_size
+        self.frames += 1
+        self.raw_bytes += raw_size
+        self.encoded_bytes += size
+        WS_FRAMES.inc(direction="out")
+        WS_BYTES.inc(size, direction="out")
+        if not deflate:
+            return
+        self.deflate_frames += 1
+        self.deflate_bytes += size
+        if self.deflate_frames % config.WS_COMPRESSION_SAMPLE == 1 or config.WS_COMPRESSION_SAMPLE <= 1:
+            data = encoded if isinstance(encoded, bytes) else encoded.encode("utf-8")
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self.sampled_bytes += len(data)
+            self.sampled_deflated += len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+    def to_dict(self) -> Dict:
+        ratio = self.sampled_deflated / self.sampled_bytes if self.sampled_bytes else 1.0
+        wire = int(self.encoded_bytes - self.deflate_bytes + self.deflate_bytes * ratio)
+        return {
+            "frames": self.frames,
+            "raw_bytes": self.raw_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "deflate_frames": self.deflate_frames,
+            "estimated_wire_bytes": wire,
+            "deflate_ratio": round(ratio, 3),
+            "savings": round(1 - wire / self.raw_bytes, 3) if self.raw_bytes else 0.0,
+        }
+
+
+class FrameLog:
+    """房间出站帧日志：房间内递增序号，保留最近 WS_FRAME_LOG_SIZE 帧供断线重连补发
+
+    广播帧对所有人可见，私有帧只对目标用户可见；epoch 标识日志实例，
+    进程重启或房间迁移后日志重建，客户端携带的旧 epoch 会触发全量同步。
+    """
+    __slots__ = ("epoch", "seq", "frames")
+
+    def __init__(self, size: int):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.frames: deque = deque(maxlen=size)  # (seq, 目标用户或None, 帧)
+
+    def append(self, message: str, user_id: Optional[str] = None) -> str:
+        self.seq += 1
+        frame = with_seq(message, self.seq)
+        self.frames.append((self.seq, user_id, frame))
+        return frame
+
+    def since(self, user_id: Optional[str], last_seq: int) -> Optional[List[str]]:
+        """返回 last_seq 之后该用户可见的帧；缺口已超出保留范围时返回 None"""
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        oldest = self.frames[0][0] if self.frames else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [frame for seq, to, frame in self.frames if seq > last_seq and (to is None or to == user_id)]
+
+
+class Connection:
+    """单个WebSocket连接：出站帧进入发送队列，由独立的写任务按顺序发送
+
+    广播时只入队不等待，慢连接不会拖慢房间内其他连接；
+    队列积压超过上限时断开连接，客户端重连后按序号补发。
+    开启合并（coalesce）时，写任务取到一帧后等待 WS_COALESCE_MS 毫秒，
+    把窗口内入队的帧合并为一个 batch 帧发送，阶段切换时的一串播报只需一次写入。
+    开启 binary 时以 msgpack 二进制帧发送（帧日志里仍保存 JSON 文本，发送时转码）。
+    """
+    __slots__ = ("websocket", "room_key", "user_id", "queue", "task", "coalesce", "binary", "deflate", "stats",
+                 "missed", "handling")
+
+    def __init__(self, websocket: WebSocket, room_key: str, user_id: Optional[str], coalesce: bool = False,
+                 binary: bool = False, stats: Optional[TransferStats] = None):
+        self.websocket = websocket
+        self.room_key = room_key
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.WS_SEND_QUEUE_SIZE)
+        self.task: Optional[asyncio.Task] = None
+        self.coalesce = config.WS_COALESCE_MS / 1000 if coalesce else 0
+        self.binary = binary and msgpack is not None
+        # 客户端是否提出了 permessage-deflate（服务端开启时即协商成功）
+        offered = websocket.headers.get("sec-websocket-extensions", "")
+        self.deflate = config.WS_PER_MESSAGE_DEFLATE and "permessage-deflate" in offered
+        self.stats = stats
+        self.missed = 0  # 连续未响应的心跳次数
+        self.handling = 0  # 正在处理的请求数（期间不读取入站帧，不计心跳未响应）
+
+    @property
+    def alive(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    async def receive(self) -> Dict:
+        """读取一帧客户端消息；任何入站帧都表示连接存活，pong 只用于保活，不交给调用方"""
+        while True:
+            data = await receive_frame(self.websocket)
+            self.missed = 0
+            if not isinstance(data, dict) or data.get("type") != "pong":
+                return data
+
+    @contextmanager
+    def busy(self):
+        """处理一条请求期间（如等待大模型回复）不会调用 receive 读到 pong，暂停心跳未响应计数"""
+        self.handling += 1
+        try:
+            yield
+        finally:
+            self.handling -= 1
+            self.missed = 0
+
+    def send(self, message: str) -> bool:
+        if not self.alive:
+            # 写任务已退出（对端已断开），等待心跳清理
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"【连接管理】房间 {self.room_key} 用户 {self.user_id} 发送队列已满，断开连接")
+            self.close(code=1013)
+            return False
+
+    def close(self, code: int = 1000):
+        if self.task:
+            self.task.cancel()
+        asyncio.create_task(self._close(code))
+
+    async def _close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _writer(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if self.coalesce:
+                    await asyncio.sleep(self.coalesce)
+                    if not self.queue.empty():
+                        frames = [message]
+                        while not self.queue.empty() and len(frames) < config.WS_COALESCE_MAX_FRAMES:
+                            frames.append(self.queue.get_nowait())
+                        message = batch_frame(frames)
+                if self.binary:
+                    encoded = msgpack.packb(json.loads(message), use_bin_type=True)
+                    await self.websocket.send_bytes(encoded)
+                else:
+                    encoded = message
+                    await self.websocket.send_text(message)
+                if self.stats is not None:
+                    self.stats.record(message, encoded, self.deflate)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"发送消息失败 (房间 {self.room_key}, 用户 {self.user_id}): {e}")
+
+
+class ConnectionManager:
+    """WebSocket连接管理"""
+
+    def __init__(self):
+        # 存储格式: {room_key: [Connection, ...]}
+        self.active_connections: Dict[str, List[Connection]] = {}
+        # 各房间的出站帧日志（按最近使用淘汰）
+        self.frame_logs: "OrderedDict[str, FrameLog]" = OrderedDict()
+        # 各房间/会话的出站流量统计（按最近使用淘汰）
+        self.transfer_stats: "OrderedDict[str, TransferStats]" = OrderedDict()
+        self.evicted_total = 0
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _frame_log(self, room_key: str) -> FrameLog:
+        log = self.frame_logs.get(room_key)
+        if log is None:
+            log = self.frame_logs[room_key] = FrameLog(config.WS_FRAME_LOG_SIZE)
+            while len(self.frame_logs) > config.WS_FRAME_LOG_ROOMS:
+                self.frame_logs.popitem(last=False)
+        else:
+            self.frame_logs.move_to_end(room_key)
+        return log
+
+    def _transfer_stats(self, room_key: str) -> TransferStats:
+        stats = self.transfer_stats.get(room_key)
+        if stats is None:
+            stats = self.transfer_stats[room_key] = TransferStats()
+            while len(self.transfer_stats) > config.WS_FRAME_LOG_ROOMS:
+                self.transfer_stats.popitem(last=False)
+        else:
+            self.transfer_stats.move_to_end(room_key)
+        return stats
+
+    async def connect(self, websocket: WebSocket, room_id: str, user_id: str = None, binary: bool = False) -> Connection:
+        await websocket.accept()
+        return self.register(websocket, room_id, user_id, binary=binary)
+
+    def register(self, websocket: WebSocket, room_id: str, user_id: str = None, coalesce: bool = False,
+                 binary: bool = False) -> Connection:
+        """登记已接受的连接并启动写任务"""
+        conn = Connection(websocket, room_id, user_id, coalesce, binary, self._transfer_stats(room_id))
+        conn.start()
+        self.active_connections.setdefault(room_id, []).append(conn)
+        return conn
+
+    def disconnect(self, websocket: WebSocket, room_id: str):
+        conns = self.active_connections.get(room_id)
+        if conns is None:
+            return
+        remaining = []
+        for conn in conns:
+            if conn.websocket is websocket:
+                if conn.task:
+                    conn.task.cancel()
+            else:
+                remaining.append(conn)
+        if remaining:
+            self.active_connections[room_id] = remaining
+        else:
+            del self.active_connections[room_id]
+
+    def start(self):
+        """启动心跳任务"""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(config.WS_PING_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"【连接管理】心跳检查异常: {e}", exc_info=True)
+
+    def sweep(self) -> int:
+        """向所有连接发送心跳，断开连续 WS_PING_MISSES 次未响应或写任务已退出的连接，清理空房间，返回断开的连接数
+
+        半开连接（对端已消失但未收到关闭帧）不会触发接收循环的断开异常，只能靠心跳发现。
+        正在处理请求（conn.busy()）的连接照常发送心跳，但不计未响应次数。
+        """
+        ping = encode_frame({"type": "ping", "ts": int(time.time())})
+        evicted = 0
+        for room_key in list(self.active_connections):
+            alive = []
+            for conn in self.active_connections[room_key]:
+                if not conn.alive or conn.missed >= config.WS_PING_MISSES:
+                    conn.close(code=WS_CLOSE_IDLE)
+                    evicted += 1
+                    continue
+                if not conn.handling:
+                    conn.missed += 1
+                conn.send(ping)
+                alive.append(conn)
+            if alive:
+                self.active_connections[room_key] = alive
+            else:
+                del self.active_connections[room_key]
+        if evicted:
+            self.evicted_total += evicted
+            logger.info(f"【连接管理】心跳检查断开 {evicted} 个失联连接")
+        return evicted
+
+    def gauges(self) -> Dict:
+        """连接数指标：房间数、连接总数、各房间连接数、累计因心跳断开的连接数"""
+        per_room = {key: len(conns) for key, conns in self.active_connections.items()}
+        return {
+            "rooms": len(per_room),
+            "connections": sum(per_room.values()),
+            "per_room": per_room,
+            "evicted_total": self.evicted_total,
+        }
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        await websocket.send_text(message)
+
+    async def send_personal_message_to_user(self, room_id: str, user_id: str, message: str):
+        """向特定用户发送个人消息（记录到房间帧日志，断线期间的消息重连后补发）"""
+        room_key = f"werewolf_{room_id}"
+        frame = self._frame_log(room_key).append(message, user_id)
+        for conn in self.active_connections.get(room_key, []):
+            if conn.user_id == user_id:
+                conn.send(frame)
+
+    async def broadcast(self, message: str, room_id: str):
+        frame = self._frame_log(room_id).append(message)
+        for conn in self.active_connections.get(room_id, []):
+            conn.send(frame)
+
+    def current_seq(self, room_key: str) -> Dict:
+        """房间帧日志当前位置 {"epoch", "seq"}（全量同步时告知客户端）"""
+        log = self._frame_log(room_key)
+        return {"epoch": log.epoch, "seq": log.seq}
+
+    def resume(self, websocket: WebSocket, room_key: str, user_id: str,
+               epoch: Optional[str], last_seq: Optional[int], coalesce: bool = False,
+               binary: bool = False) -> Optional[Connection]:
+        """断线重连：补发 last_seq 之后的帧（合并为一个 batch 帧）并登记连接
+
+        补发与登记之间没有 await，保证补发帧排在之后的实时帧之前；
+        epoch 不一致或缺口超出保留范围时返回 None，由调用方走全量同步。
+        """
+        log = self.frame_logs.get(room_key)
+        if log is None or epoch != log.epoch or last_seq is None:
+            return None
+        frames = log.since(user_id, last_seq)
+        if frames is None:
+            return None
+        conn = self.register(websocket, room_key, user_id, coalesce, binary)
+        conn.send(batch_frame(frames, epoch=log.epoch, seq=log.seq))
+        return conn
+
+    def attach(self, websocket: WebSocket, room_key: str, user_id: str, frames: List[str], since_seq: int,
+               coalesce: bool = False, binary: bool = False) -> Connection:
+        """全量同步：登记连接，先发送同步帧，再补发同步数据读取期间产生的帧（since_seq 之后）"""
+        conn = self.register(websocket, room_key, user_id, coalesce, binary)
+        for frame in frames:
+            conn.send(frame)
+        gap = self._frame_log(room_key).since(user_id, since_seq)
+        for frame in gap or []:
+            conn.send(frame)
+        return conn
+
+    def connections_by_kind(self) -> Dict:
+        """按连接类型（werewolf/event/character）统计连接数，供监控指标采集"""
+        counts: Dict = {}
+        for room_key, conns in self.active_connections.items():
+            kind = (room_key.split("_", 1)[0],)
+            counts[kind] = counts.get(kind, 0) + len(conns)
+        return counts
+
+    def stats(self) -> Dict:
+        """出站流量统计：汇总 + 各房间/会话明细"""
+        rooms = {key: stats.to_dict() for key, stats in self.transfer_stats.items()}
+        total = TransferStats()
+        for stats in self.transfer_stats.values():
+            for field in TransferStats.__slots__:
+                setattr(total, field, getattr(total, field) + getattr(stats, field))
+        return {
+            "per_message_deflate": config.WS_PER_MESSAGE_DEFLATE,
+            "msgpack_available": msgpack is not None,
+            "connections": self.gauges(),
+            "total": total.to_dict(),
+            "rooms": rooms,
+        }
+
+    async def close_room(self, room_id: str, code: int = 1000):
+        """关闭房间内的所有连接"""
+        for conn in self.active_connections.pop(room_id, []):
+            if conn.task:
+                conn.task.cancel()
+            try:
+                await conn.websocket.close(code=code)
+            except Exception as e:
+                logger.warning(f"关闭连接失败 (房间 {room_id}): {e}")
+
+
+# 全局连接管理器
+manager = ConnectionManager()
+WS_CONNECTIONS.set_collect(manager.connections_by_kind)
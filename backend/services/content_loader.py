@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ContentLoader:
+    """内容加载器：读取JSON数据文件，校验后构建只读索引
+
+    索引对象构建完成后只通过一次引用赋值替换，读者拿到的始终是完整的某一版本，
+    不需要加锁；已发布的索引不允许再修改。
+    """
+
+    def __init__(self, file_path: str, build_index: Callable[[Dict], Any], name: str, optional: bool = False):
+        """
+        Args:
+            file_path: JSON数据文件路径
+            build_index: 校验数据并构建索引的函数，校验失败应抛出异常
+            name: 内容名称（用于日志）
+            optional: 文件不存在时是否允许以空索引启动
+        """
+        self.file_path = os.path.abspath(file_path)
+        self.name = name
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self._build_index = build_index
+        self._signature: Optional[Tuple[int, int]] = None
+        self._index: Any = None
+
+        try:
+            self._index, self._signature = self._load()
+            self.version = 1
+            self.loaded_at = time.time()
+        except FileNotFoundError:
+            if not optional:
+                raise
+            logger.warning(f"【内容加载】{self.name} 数据文件不存在: {self.file_path}")
+
+    @property
+    def current(self) -> Any:
+        """当前生效的索引"""
+        return self._index
+
+    def _file_signature(self) -> Tuple[int, int]:
+        """文件签名（修改时间 + 大小），用于判断文件是否变化"""
+        stat = os.stat(self.file_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self) -> Tuple[Any, Tuple[int, int]]:
+        """读取并校验数据文件，返回新索引和对应的文件签名"""
+        signature = self._file_signature()
+        with open(self.file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return self._build_index(data), signature
+
+    def reload_if_changed(self) -> bool:
+        """文件变化时重新加载，返回是否替换了索引
+
+        校验失败时保留旧版本继续服务，直到文件再次变化。
+        """
+        try:
+            signature = self._file_signature()
+        except OSError:
+            return False
+        if signature == self._signature:
+            return False
+
+        try:
+            index, signature = self._load()
+        except Exception as e:
+            # 记录签名，避免同一个错误文件被反复解析
+            self._signature = signature
+            logger.error(f"【内容热更新失败】{self.name} 数据校验未通过，继续使用版本 {self.version}: {e}")
+            return False
+
+        # 单次引用赋值完成切换
+        self._index = index
+        self._signature = signature
+        self.version += 1
+        self.loaded_at = time.time()
+        logger.info(f"【内容热更新】{self.name} 已切换到版本 {self.version}")
+        return True
+
+
+class ContentWatcher:
+    """内容文件监听器：后台线程轮询所有已注册的加载器"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._loaders: List[ContentLoader] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, loader: ContentLoader):
+        """注册加载器，首次注册时启动监听线程"""
+        with self._lock:
+            self._loaders.append(loader)
+            if self.interval > 0 and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="content-watcher", daemon=True)
+                self._thread.start()
+
+    def check_now(self) -> Dict[str, bool]:
+        """立即检查所有加载器，返回 {名称: 是否更新}"""
+        with self._lock:
+            loaders = list(self._loaders)
+        return {loader.name: loader.reload_if_changed() for loader in loaders}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check_now()
+            except Exception as e:
+                logger.error(f"【内容热更新】监听线程异常: {e}", exc_info=True)
+
+
+# 全局内容监听器
+content_watcher = ContentWatcher(config.CONTENT_RELOAD_INTERVAL)
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import sys
+import time
+import logging
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from services.redis_service import redis_service
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_SNAPSHOT = "snapshot"  # 完整房间状态
+EVENT_PATCH = "patch"  # 相对上一状态的字段变化
+EVENT_MESSAGE = "message"  # 公共消息（发言、主持人播报）
+EVENT_PRIVATE = "private_message"  # 私有消息
+
+
+# ---------- 状态差分与折叠（纯函数） ----------
+
+def _copy_value(value: Any) -> Any:
+    # 房间字段里只有 night_actions 等少数容器，其余都是标量
+    if isinstance(value, (dict, list)):
+        return json.loads(json.dumps(value, default=str))
+    return value
+
+
+def _copy_state(state: Dict) -> Dict:
+    data = {k: _copy_value(v) for k, v in state.items() if k != "players"}
+    data["players"] = [dict(p) for p in state.get("players", [])]
+    return data
+
+
+def diff_state(old: Dict, new: Dict) -> Optional[Dict]:
+    """计算两个房间状态之间的变化，没有变化时返回 None
+
+    补丁格式：
+        {"set": {房间字段: 新值},
+         "players": {user_id: {玩家字段: 新值}},
+         "add": [新玩家完整数据],
+         "order": [user_id, ...]}  # 玩家增删或顺序变化时给出
+    """
+    patch: Dict[str, Any] = {}
+    room_set = {k: v for k, v in new.items() if k != "players" and old.get(k, None) != v}
+    removed = [k for k in old if k != "players" and k not in new]
+    for k in removed:
+        room_set[k] = None
+    if room_set:
+        patch["set"] = room_set
+
+    old_players = {p["user_id"]: p for p in old.get("players", [])}
+    new_players = new.get("players", [])
+    changed: Dict[str, Dict] = {}
+    added: List[Dict] = []
+    for p in new_players:
+        prev = old_players.get(p["user_id"])
+        if prev is None:
+            added.append(p)
+            continue
+        fields = {k: v for k, v in p.items() if prev.get(k) != v}
+        if fields:
+            changed[p["user_id"]] = fields
+    if changed:
+        patch["players"] = changed
+    if added:
+        patch["add"] = added
+    order = [p["user_id"] for p in new_players]
+    if order != [p["user_id"] for p in old.get("players", [])]:
+        patch["order"] = order
+    return patch or None
+
+
+def apply_patch(state: Dict, patch: Dict) -> Dict:
+    """把补丁应用到房间状态（原地修改并返回）"""
+    for k, v in patch.get("set", {}).items():
+        state[k] = v
+    players = {p["user_id"]: p for p in state.get("players", [])}
+    for user_id, fields in patch.get("players", {}).items():
+        player = players.get(user_id)
+        if player is not None:
+            player.update(fields)
+    for p in patch.get("add", []):
+        players[p["user_id"]] = dict(p)
+    if "order" in patch:
+        state["players"] = [players[uid] for uid in patch["order"] if uid in players]
+    return state
+
+
+def describe_patch(patch: Dict) -> List[str]:
+    """补丁对应的事件类别（用于审计和回放展示）"""
+    kinds = []
+    room_set = patch.get("set", {})
+    if "phase" in room_set:
+        kinds.append(f"phase:{room_set['phase']}")
+    if room_set.get("winner"):
+        kinds.append("game_over")
+    if "night_actions" in room_set:
+        kinds.append("night_action")
+    for fields in patch.get("players", {}).values():
+        if "role" in fields and "role_assign" not in kinds:
+            kinds.append("role_assign")
+        if fields.get("alive") is False and "death" not in kinds:
+            kinds.append("death")
+        if fields.get("voted") and "vote" not in kinds:
+            kinds.append("vote")
+    if patch.get("add"):
+        kinds.append("join")
+    if "order" in patch and not patch.get("add"):
+        kinds.append("leave")
+    return kinds or ["update"]
+
+
+def fold_events(events: List[Tuple[str, Dict[str, str]]], state: Optional[Dict] = None) -> Optional[Dict]:
+    """按顺序折叠事件得到房间状态；从第一个快照事件开始有效"""
+    for _, fields in events:
+        kind = fields.get("kind")
+        if kind == EVENT_SNAPSHOT:
+            state = json.loads(fields["state"])
+        elif kind == EVENT_PATCH and state is not None:
+            apply_patch(state, json.loads(fields["patch"]))
+    return state
+
+
+class GameEventLog:
+    """房间事件日志：每次保存房间时把相对上次保存的变化追加到 Redis Stream `room:{id}:events`
+
+    - 平时只追加补丁，不再整块重写房间；每 EVENT_SNAPSHOT_INTERVAL 条事件写一次完整快照事件，
+      同时在同一个事务里写入房间快照 `room:{id}`
+    - 读取时从房间快照折叠最新快照事件之后的补丁；状态没有变化的保存直接跳过
+    - 事件数超过 EVENT_LOG_MAX_LEN 时裁掉最新快照之前的事件
+    - 补丁相对本进程上次保存的状态计算。等待中的房间没有租约，可能先后由不同进程写入：
+      读取时若最后一条状态事件不是本进程写的，说明缓存已过期，下一次保存写完整快照；
+      失去或接管房间时同样清掉本地缓存
+    - 本地缓存只保留最近保存过的 max_rooms 个房间（没开始或中途被放弃的房间不会一直占用内存），
+      被淘汰的房间下一次保存同样从完整快照开始
+    """
+
+    def __init__(self, snapshot_interval: int, ttl: int, max_len: int, max_rooms: int):
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.ttl = ttl
+        self.max_len = max_len
+        self.max_rooms = max(1, max_rooms)
+        self._last: "OrderedDict[str, Dict]" = OrderedDict()  # 每个房间最近一次保存的状态（按保存时间排列）
+        self._since_snapshot: Dict[str, int] = {}
+        self._last_event: Dict[str, str] = {}  # 每个房间本进程最近写入的状态事件ID
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.room_message_callback: Optional[Callable[[str, Dict], None]] = None
+
+    def set_room_message_callback(self, callback):
+        """设置公共消息写入后的回调 (room_id, message) -> None"""
+        self.room_message_callback = callback
+
+    def _lock(self, room_id: str) -> asyncio.Lock:
+        lock = self._locks.get(room_id)
+        if lock is None:
+            lock = self._locks[room_id] = asyncio.Lock()
+        return lock
+
+    def _remember(self, room_id: str, state: Dict, since_snapshot: int, event_id: str):
+        self._last[room_id] = _copy_state(state)
+        self._last.move_to_end(room_id)
+        self._since_snapshot[room_id] = since_snapshot
+        self._last_event[room_id] = event_id
+        excess = len(self._last) - self.max_rooms
+        for old_id in list(islice(self._last, max(0, excess))):
+            lock = self._locks.get(old_id)
+            if lock is not None and lock.locked():
+                continue  # 正在保存的房间不淘汰，避免同一房间出现两把锁
+            self.forget(old_id)
+
+    def forget(self, room_id: str):
+        """清除房间的本地缓存（失去归属、接管或游戏结束后调用）"""
+        self._last.pop(room_id, None)
+        self._since_snapshot.pop(room_id, None)
+        self._last_event.pop(room_id, None)
+        self._locks.pop(room_id, None)
+
+    def _check_tail(self, room_id: str, events: List[Tuple[str, Dict[str, str]]]):
+        """最后一条状态事件不是本进程写入的（其他进程写过房间或事件流已过期）时，丢弃缓存的状态"""
+        if room_id not in self._last:
+            return
+        tail = next((event_id for event_id, fields in reversed(events)
+                     if fields.get("kind") in (EVENT_SNAPSHOT, EVENT_PATCH)), None)
+        if tail != self._last_event.get(room_id):
+            # 只丢弃状态，不动锁：可能有保存正在进行，它完成后会重新记下自己写入的状态
+            self._last.pop(room_id, None)
+            self._since_snapshot.pop(room_id, None)
+            logger.info(f"【事件日志】房间 {room_id} - 其他进程写过房间，下一次保存写完整快照")
+
+    async def save_room(self, room_id: str, state: Dict):
+        """保存房间状态并记录事件"""
+        # 同一房间的保存按顺序进入事件流，保证折叠顺序与快照写入顺序一致
+        async with self._lock(room_id):
+            prev = self._last.get(room_id)
+            count = self._since_snapshot.get(room_id, 0)
+            ts = str(time.time())
+            snapshot = None
+            if prev is None or count >= self.snapshot_interval:
+                snapshot = json.dumps(state, ensure_ascii=False, default=str)
+                event = {"kind": EVENT_SNAPSHOT, "type": EVENT_SNAPSHOT, "ts": ts, "state": snapshot}
+            else:
+                patch = diff_state(prev, state)
+                if patch is None:
+                    return
+                event = {"kind": EVENT_PATCH, "type": ",".join(describe_patch(patch)), "ts": ts,
+                         "patch": json.dumps(patch, ensure_ascii=False, default=str)}
+            event_id = await redis_service.save_room_event(room_id, event, self.ttl, snapshot)
+            if event["kind"] == EVENT_SNAPSHOT:
+                self._remember(room_id, state, 0, event_id)
+                await self._mark_snapshot(room_id, event_id)
+            else:
+                self._remember(room_id, state, count + 1, event_id)
+
+    async def _mark_snapshot(self, room_id: str, event_id: str):
+        try:
+            trim = self.max_len > 0 and await redis_service.count_room_events(room_id) > self.max_len
+            trimmed = await redis_service.mark_room_snapshot(room_id, event_id, self.ttl, trim)
+            if trimmed:
+                logger.info(f"【事件日志】房间 {room_id} - 裁掉快照 {event_id} 之前的 {trimmed} 条事件")
+        except Exception as e:
+            logger.warning(f"【事件日志】房间 {room_id} - 记录快照失败: {e}")
+
+    async def _append_message(self, room_id: str, list_key: str, message: Dict, event: Dict[str, str]) -> int:
+        event["ts"] = str(time.time())
+        event["message"] = json.dumps(message, ensure_ascii=False, default=str)
+        return await redis_service.append_message_with_event(room_id, list_key, message, event, self.ttl)
+
+    async def add_room_message(self, room_id: str, message: Dict) -> int:
+        """追加公共消息（发言、主持人播报）并记录事件"""
+        length = await self._append_message(room_id, f"room:{room_id}:messages", message,
+                                            {"kind": EVENT_MESSAGE, "type": EVENT_MESSAGE})
+        if self.room_message_callback:
+            self.room_message_callback(room_id, message)
+        return length
+
+    async def add_private_message(self, room_id: str, user_id: str, message: Dict) -> int:
+        """追加私有消息并记录事件"""
+        return await self._append_message(room_id, f"room:{room_id}:private:{user_id}", message,
+                                          {"kind": EVENT_PRIVATE, "type": EVENT_PRIVATE, "user_id": user_id})
+
+    async def load(self, room_id: str) -> Optional[Dict]:
+        """读取房间当前状态：房间快照 + 最新快照事件之后的补丁"""
+        snapshot, events = await redis_service.load_room_events(room_id)
+        self._check_tail(room_id, events)
+        state = json.loads(snapshot) if snapshot else None
+        return fold_events(events, state)
+
+
+# 全局事件日志
+game_event_log = GameEventLog(config.EVENT_SNAPSHOT_INTERVAL, config.EVENT_LOG_TTL, config.EVENT_LOG_MAX_LEN,
+                              config.EVENT_LOG_CACHE_ROOMS)
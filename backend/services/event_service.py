@@ -11,19 +11,38 @@ if str(backend_dir) not in sys.path:
 
 from models.event import MysteryEvent, EventClue
 from services.redis_service import redis_service
+from services.content_loader import ContentLoader, content_watcher
 
 class EventService:
     """大事件服务"""
     
     def __init__(self):
         self.events_file = os.path.join(os.path.dirname(__file__), "..", "data", "events.json")
-        self._load_events()
+        self._loader = ContentLoader(self.events_file, self._load_events, name="events")
+        content_watcher.register(self._loader)
     
-    def _load_events(self):
-        """加载事件数据"""
-        with open(self.events_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            self.events = {event["id"]: event for event in data["events"]}
+    @staticmethod
+    def _load_events(data: Dict) -> Dict[str, Dict[str, Dict]]:
+        """校验事件数据并构建索引
+
+        Returns:
+            {"by_id": {event_id: event}, "by_character": {character_id: event}}
+        """
+        by_id = {}
+        by_character = {}
+        for event in data["events"]:
+            MysteryEvent(**event)  # 校验字段，失败时抛出异常
+            if event["id"] in by_id:
+                raise ValueError(f"事件ID重复: {event['id']}")
+            by_id[event["id"]] = event
+            # 同一角色有多个事件时保留第一个，与原来的线性查找一致
+            by_character.setdefault(event.get("character_id"), event)
+        return {"by_id": by_id, "by_character": by_character}
+    
+    @property
+    def events(self) -> Dict[str, Dict]:
+        """当前生效的事件索引（热更新时整体替换，不要原地修改）"""
+        return self._loader.current["by_id"]
     
     def get_event(self, event_id: str) -> Optional[Dict]:
         """获取事件"""
@@ -31,10 +50,7 @@ class EventService:
     
     def get_character_event(self, character_id: str) -> Optional[Dict]:
         """根据角色ID获取事件"""
-        for event in self.events.values():
-            if event.get("character_id") == character_id:
-                return event
-        return None
+        return self._loader.current["by_character"].get(character_id)
     
     async def get_user_events(self, user_id: str) -> List[Dict]:
         """获取用户的事件列表"""
@@ -45,6 +61,8 @@ class EventService:
         for char_id in unlocked_characters:
             event = self.get_character_event(char_id)
             if event:
+                # 复制一份再合并进度，避免修改共享的事件索引
+                event = dict(event)
                 event_data = await self.get_user_event_progress(user_id, event["id"])
                 event.update(event_data)
                 events.append(event)
@@ -0,0 +1,145 @@
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+# 死亡原因（PlayerState.died_by）的描述，以及发生在夜晚还是白天
+DEATH_REASONS = {
+    "wolf": ("被狼人杀害", True),
+    "poison": ("被女巫毒死", True),
+    "vote": ("被投票出局", False),
+    "hunter": ("被猎人带走", False),
+}
+
+# 发言中的身份声明，如"我是预言家"
+_ROLE_CLAIM = re.compile(r"我(?:是|就是|才是)真?的?(预言家|女巫|猎人|守卫|平民|村民)")
+_CHECK_WORDS = ("查验", "验了", "验人")
+_WOLF_WORDS = ("狼人", "查杀", "是狼")
+_GOOD_WORDS = ("好人", "金水")
+
+
+def speech_cues(speaker: str, content: str, player_names: Iterable[str]) -> List[Tuple[str, int]]:
+    """发言中对其他玩家的表态：[(玩家名, 1 表示指认为狼人 / -1 表示认为是好人)]"""
+    cues = []
+    for name in player_names:
+        pos = content.find(name)
+        if name == speaker or pos < 0:
+            continue
+        rest = content[pos + len(name):pos + len(name) + 8]
+        if any(word in rest for word in _WOLF_WORDS):
+            cues.append((name, 1))
+        elif any(word in rest for word in _GOOD_WORDS):
+            cues.append((name, -1))
+    return cues
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计token数：中文按每字一个token，其余按每4个字符一个token"""
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class GameMemory:
+    """单个房间的结构化对局记录：死亡、投票、身份声明和查验声明（公开），预言家的真实查验结果（私有）
+
+    随消息和房间状态增量更新，渲染时按优先级在固定的token预算内取舍：
+    查验声明和身份声明 > 死亡 > 投票（越近越优先），超出预算的旧记录不进入提示词。
+    """
+    __slots__ = ("deaths", "votes", "claims", "checks", "seer_results", "known_dead")
+
+    def __init__(self):
+        self.deaths: List[str] = []  # "第1夜 AI玩家3 被狼人杀害"
+        self.votes: List[Tuple[int, List[Tuple[str, str]]]] = []  # (第几天, [(投票者, 目标)])
+        self.claims: Dict[str, Tuple[int, str]] = {}  # 发言者 -> (第几天, 声称的身份)
+        self.checks: List[Tuple[int, str, str, str]] = []  # (第几天, 声称者, 目标, 结果)
+        self.seer_results: Dict[str, List[Tuple[int, str, str]]] = {}  # 预言家ID -> [(第几夜, 目标, 结果)]
+        self.known_dead = set()
+
+    def copy(self) -> "GameMemory":
+        memory = GameMemory()
+        memory.deaths = list(self.deaths)
+        memory.votes = list(self.votes)
+        memory.claims = dict(self.claims)
+        memory.checks = list(self.checks)
+        memory.seer_results = {k: list(v) for k, v in self.seer_results.items()}
+        memory.known_dead = set(self.known_dead)
+        return memory
+
+    def record_deaths(self, dead_players: Iterable, day: Optional[int], night: Optional[int]) -> bool:
+        """记录新出现的死亡玩家，返回是否有变化；day/night 为 None 表示不知道死亡时间（接管房间时已死亡）"""
+        changed = False
+        for player in dead_players:
+            if player.user_id in self.known_dead:
+                continue
+            self.known_dead.add(player.user_id)
+            reason, at_night = DEATH_REASONS.get(player.died_by, ("死亡", False))
+            if day is None:
+                self.deaths.append(f"{player.username} {reason}")
+            else:
+                when = f"第{night}夜" if at_night else f"第{day}天"
+                self.deaths.append(f"{when} {player.username} {reason}")
+            changed = True
+        return changed
+
+    def record_votes(self, day: int, ballots: List[Tuple[str, str]]):
+        self.votes = [v for v in self.votes if v[0] != day] + [(day, ballots)]
+
+    def record_seer_result(self, seer_id: str, night: int, target: str, result: str):
+        results = [r for r in self.seer_results.get(seer_id, []) if r[0] != night]
+        self.seer_results[seer_id] = results + [(night, target, result)]
+
+    def observe_speech(self, speaker: str, content: str, day: int, player_names: Iterable[str]) -> bool:
+        """从发言中提取身份声明和查验声明，返回是否有变化"""
+        changed = False
+        match = _ROLE_CLAIM.search(content)
+        if match:
+            role = "平民" if match.group(1) == "村民" else match.group(1)
+            if self.claims.get(speaker, (0, None))[1] != role:
+                self.claims[speaker] = (day, role)
+                changed = True
+        if any(word in content for word in _CHECK_WORDS) or self.claims.get(speaker, (0, ""))[1] == "预言家":
+            for name, cue in speech_cues(speaker, content, player_names):
+                result = "狼人" if cue > 0 else "好人"
+                if (day, speaker, name, result) not in self.checks:
+                    self.checks.append((day, speaker, name, result))
+                    changed = True
+        return changed
+
+    def render(self, budget: int) -> str:
+        """渲染公开记录，总长度不超过 budget 个token"""
+        # (优先级, 分组, 排序键, 文本)，优先级数值越小越先保留
+        items = []
+        for i, (day, speaker, target, result) in enumerate(self.checks):
+            items.append((0, 0, i, f"第{day}天 {speaker} 声称查验 {target} 是{result}"))
+        for speaker, (day, role) in self.claims.items():
+            items.append((1, 1, day, f"第{day}天 {speaker} 声称是{role}"))
+        for i, line in enumerate(self.deaths):
+            items.append((2, 2, i, line))
+        for day, ballots in self.votes:
+            text = "、".join(f"{voter}→{target}" for voter, target in ballots) or "无人投票"
+            items.append((3, 3, day, f"第{day}天投票：{text}"))
+
+        kept = []
+        used = 0
+        # 同一优先级内越新越优先
+        for item in sorted(items, key=lambda x: (x[0], -x[2])):
+            cost = estimate_tokens(item[3]) + 1
+            if used + cost > budget:
+                continue
+            kept.append(item)
+            used += cost
+        if not kept:
+            return ""
+        kept.sort(key=lambda x: (x[1], x[2]))
+        return "\n".join(item[3] for item in kept)
+
+    def render_private(self, seer_id: str) -> str:
+        results = self.seer_results.get(seer_id)
+        if not results:
+            return ""
+        return "；".join(f"第{night}夜 {target} 是{result}" for night, target, result in results)
@@ -0,0 +1,267 @@
+import asyncio
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# 毫秒级操作（Redis、单帧处理）与秒级操作（大模型调用、阶段时长）的默认分桶
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+PHASE_BUCKETS = (1.0, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+_INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        return []
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """瞬时值；设置 collect 时在每次抓取时调用，返回 {标签值元组: 数值}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.collect = collect
+
+    def set_collect(self, collect: Callable[[], Dict[LabelValues, float]]):
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        values = dict(self._values)
+        if self.collect:
+            try:
+                values.update(self.collect())
+            except Exception as e:
+                logger.warning(f"【监控指标】采集 {self.name} 失败: {e}")
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """分桶直方图（累计计数、总和、次数）"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = FAST_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {标签值: [各分桶计数..., 总和, 次数]}
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[i] += 1
+                break
+        data[-2] += value
+        data[-1] += 1
+
+    def _samples(self):
+        for key, data in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {data[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(data[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {data[-1]}"
+
+
+class MetricsRegistry:
+    """进程内指标注册表，以 Prometheus 文本格式输出
+
+    所有指标只在事件循环线程中更新（Redis 操作在线程池执行，但耗时在协程里记录），不需要加锁。
+    """
+
+    def __init__(self, namespace: str = "beast"):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(f"{self.namespace}_{name}", help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+        return self._register(Gauge(f"{self.namespace}_{name}", help_text, labelnames, collect))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = FAST_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.namespace}_{name}", help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# ---------- 各模块使用的指标 ----------
+
+REDIS_SECONDS = metrics.histogram("redis_op_seconds", "Redis操作耗时（含线程池排队）", ("command", "key_family"))
+REDIS_ERRORS = metrics.counter("redis_op_errors_total", "Redis操作失败次数", ("command", "key_family"))
+
+LLM_SECONDS = metrics.histogram("llm_request_seconds", "大模型调用耗时", ("call_site",), SLOW_BUCKETS)
+LLM_TOKENS = metrics.counter("llm_tokens_total", "大模型消耗的token数", ("call_site", "kind"))
+LLM_ERRORS = metrics.counter("llm_errors_total", "大模型调用失败次数", ("call_site", "reason"))
+LLM_DEADLINE = metrics.counter("llm_deadline_total", "带截止时间的大模型调用结果（in_time/timeout/skipped，后两者使用兜底结果）",
+                               ("call_site", "outcome"))
+LLM_PREGEN = metrics.counter("llm_pregen_total", "预生成的遗言/开场发言（started/hit/diverged/timeout/failed/unused）",
+                             ("kind", "outcome"))
+LLM_ROUTE = metrics.counter("llm_route_total", "各调用场景实际使用的模型（primary 主模型 / degraded 因p95超标降级）",
+                            ("call_site", "model", "reason"))
+LLM_P95 = metrics.gauge("llm_latency_p95_seconds", "各调用场景、模型最近调用耗时的p95（模型路由据此降级）",
+                        ("call_site", "model"))
+
+WS_FRAMES = metrics.counter("ws_frames_total", "WebSocket帧数", ("direction",))
+WS_BYTES = metrics.counter("ws_bytes_total", "WebSocket帧字节数（压缩前）", ("direction",))
+
+PHASE_SECONDS = metrics.histogram("werewolf_phase_seconds", "狼人杀状态机各状态停留时长", ("step",), PHASE_BUCKETS)
+PHASE_ACTION_SECONDS = metrics.histogram("werewolf_phase_action_seconds", "狼人杀状态机进入/离开动作耗时",
+                                         ("step", "action"), SLOW_BUCKETS)
+PHASE_TRANSITIONS = metrics.counter("werewolf_phase_transitions_total", "狼人杀状态机转移次数",
+                                    ("source", "target", "timeout"))
+ROOMS_BY_PHASE = metrics.gauge("werewolf_rooms", "本进程驱动中的狼人杀房间数（按阶段）", ("phase",))
+WS_CONNECTIONS = metrics.gauge("ws_connections", "WebSocket连接数（按连接类型）", ("kind",))
+ROOM_TASKS = metrics.counter("room_tasks_total", "房间后台任务结束次数（按结束方式，cancelled_step_ended 为状态结束时仍未完成）",
+                             ("kind", "outcome"))
+ROOM_TASKS_IN_FLIGHT = metrics.gauge("room_tasks", "进行中的房间后台任务数", ("kind",))
+ROOM_TASK_SECONDS = metrics.histogram("room_task_seconds", "房间后台任务耗时", ("kind",), SLOW_BUCKETS)
+AI_DECISIONS = metrics.counter("werewolf_ai_decisions_total", "AI玩家的行动决策（bot 本地决策 / llm 大模型 / fallback 大模型失败后本地决策）",
+                               ("action", "source"))
+AI_SPEECH = metrics.counter("werewolf_ai_speech_total", "白天AI发言调度（triggered/debounced/capped/spoken）", ("outcome",))
+
+LOOP_LAG_SECONDS = metrics.histogram("event_loop_lag_seconds", "事件循环调度延迟")
+LOOP_LAG_MAX = metrics.gauge("event_loop_lag_max_seconds", "最近一个采样周期内的最大事件循环延迟")
+
+
+# 键名中跟在这些段后面的是ID
+_ID_AFTER = {"room", "user", "private"}
+# 这些前缀之后的所有段都是ID
+_ID_PREFIXES = {"event_progress", "character_memory"}
+
+
+def key_family(key: str) -> str:
+    """把Redis键归并为键族，避免标签基数随房间/用户增长：room:ab12:private:u1 -> room:*:private:*"""
+    parts = key.split(":")
+    if parts[0] in _ID_PREFIXES:
+        return ":".join([parts[0]] + ["*"] * (len(parts) - 1))
+    return ":".join("*" if i and parts[i - 1] in _ID_AFTER else part for i, part in enumerate(parts))
+
+
+class EventLoopMonitor:
+    """周期性测量事件循环调度延迟：预期 interval 秒后醒来，实际多等的时间即为延迟"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        worst = 0.0
+        window_start = time.perf_counter()
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            worst = max(worst, lag)
+            if time.perf_counter() - window_start >= 10:
+                LOOP_LAG_MAX.set(worst)
+                worst = 0.0
+                window_start = time.perf_counter()
+
+
+# 全局事件循环监控
+loop_monitor = EventLoopMonitor(config.METRICS_LOOP_LAG_INTERVAL)
@@ -0,0 +1,132 @@
+import sys
+import json
+import time
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from services.metrics_service import LLM_ROUTE, LLM_P95
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRoute:
+    """一个调用场景使用的模型和参数；p95 超过 p95_target 秒时改用 fallback 模型"""
+    __slots__ = ("model", "max_tokens", "temperature", "fallback", "p95_target")
+
+    def __init__(self, model: str, max_tokens: Optional[int] = None, temperature: float = 0.7,
+                 fallback: Optional[str] = None, p95_target: Optional[float] = None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.fallback = fallback
+        self.p95_target = p95_target
+
+    def to_dict(self) -> Dict:
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "fallback": self.fallback,
+            "p95_target": self.p95_target,
+        }
+
+
+# 默认路由：玩家直接交互的场景（角色对话、解谜、真心话大冒险）用效果更好的模型，慢时降级；
+# 狼人杀AI玩家的批量调用（发言、投票、遗言）用快模型，并限制输出长度
+DEFAULT_ROUTES = {
+    "chat": ModelRoute("qwen-plus", 800, 0.7, fallback="qwen-turbo", p95_target=6.0),
+    "mystery": ModelRoute("qwen-plus", 800, 0.7, fallback="qwen-turbo", p95_target=8.0),
+    "truth_or_dare": ModelRoute("qwen-plus", 300, 0.9, fallback="qwen-turbo", p95_target=5.0),
+    "speech": ModelRoute("qwen-turbo", 150, 0.8),
+    "last_words": ModelRoute("qwen-turbo", 150, 0.8),
+    "vote": ModelRoute("qwen-turbo", 20, 0.5),
+}
+
+
+def _load_routes() -> Dict[str, ModelRoute]:
+    """默认路由，再用 AI_MODEL_ROUTES（JSON，按调用场景覆盖部分字段）覆盖"""
+    routes = {site: ModelRoute(**route.to_dict()) for site, route in DEFAULT_ROUTES.items()}
+    if not config.AI_MODEL_ROUTES:
+        return routes
+    try:
+        overrides = json.loads(config.AI_MODEL_ROUTES)
+        for site, fields in overrides.items():
+            base = routes.get(site, ModelRoute(config.AI_MODEL_DEFAULT)).to_dict()
+            base.update({k: v for k, v in fields.items() if k in base})
+            routes[site] = ModelRoute(**base)
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"【模型路由】AI_MODEL_ROUTES 配置无效，使用默认路由: {e}")
+    return routes
+
+
+class ModelRouter:
+    """按调用场景选择模型，并按最近的耗时自适应降级
+
+    每个 (调用场景, 模型) 保留最近 AI_ROUTE_WINDOW 次调用的耗时（超时的调用按实际等待时间计入）。
+    主模型的 p95 超过路由的 p95_target 时，该场景改用 fallback 模型 AI_ROUTE_COOLDOWN 秒，
+    之后清空主模型的样本重新尝试。
+    """
+
+    def __init__(self):
+        self.routes = _load_routes()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._degraded_until: Dict[str, float] = {}
+
+    def route(self, call_site: str) -> ModelRoute:
+        return self.routes.get(call_site) or ModelRoute(config.AI_MODEL_DEFAULT)
+
+    def select(self, call_site: str) -> Tuple[ModelRoute, str]:
+        """返回 (路由, 本次使用的模型)"""
+        route = self.route(call_site)
+        degraded_until = self._degraded_until.get(call_site)
+        if degraded_until is not None:
+            if time.monotonic() < degraded_until:
+                LLM_ROUTE.inc(call_site=call_site, model=route.fallback, reason="degraded")
+                return route, route.fallback
+            # 降级期结束，重新统计主模型
+            del self._degraded_until[call_site]
+            self._latencies.pop((call_site, route.model), None)
+            logger.info(f"【模型路由】{call_site} 降级期结束，恢复使用 {route.model}")
+        LLM_ROUTE.inc(call_site=call_site, model=route.model, reason="primary")
+        return route, route.model
+
+    def observe(self, call_site: str, model: str, seconds: float):
+        """记录一次调用耗时，主模型变慢时触发降级"""
+        key = (call_site, model)
+        window = self._latencies.get(key)
+        if window is None:
+            window = self._latencies[key] = deque(maxlen=config.AI_ROUTE_WINDOW)
+        window.append(seconds)
+
+        route = self.route(call_site)
+        if (model != route.model or not route.fallback or route.p95_target is None
+                or call_site in self._degraded_until or len(window) < config.AI_ROUTE_MIN_SAMPLES):
+            return
+        p95 = self.p95(call_site, model)
+        if p95 > route.p95_target:
+            self._degraded_until[call_site] = time.monotonic() + config.AI_ROUTE_COOLDOWN
+            logger.warning(f"【模型路由】{call_site} 使用 {model} 的p95耗时 {p95:.1f} 秒超过 {route.p95_target} 秒，"
+                           f"{config.AI_ROUTE_COOLDOWN:.0f} 秒内改用 {route.fallback}")
+
+    def p95(self, call_site: str, model: str) -> float:
+        window = self._latencies.get((call_site, model))
+        if not window:
+            return 0.0
+        ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def collect_p95(self) -> Dict[Tuple[str, str], float]:
+        return {key: self.p95(*key) for key in self._latencies}
+
+
+# 全局模型路由
+model_router = ModelRouter()
+LLM_P95.set_collect(model_router.collect_p95)
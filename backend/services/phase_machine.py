@@ -0,0 +1,310 @@
+import asyncio
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from models.game import GamePhase
+from models.game_state import RoomState
+from services.metrics_service import PHASE_SECONDS, PHASE_ACTION_SECONDS, PHASE_TRANSITIONS
+from services.tracing import tracer, CAT_PHASE, CAT_ACTION, CAT_WAIT
+
+logger = logging.getLogger(__name__)
+
+# 存在条件转移时，轮询房间状态的间隔（秒）
+GUARD_POLL_INTERVAL = 0.5
+# 进入动作默认耗时上限（秒），超出后取消并继续评估转移
+DEFAULT_ENTRY_BUDGET = 90.0
+
+
+class MachineContext:
+    """状态机运行上下文（每个房间一份）"""
+    __slots__ = ("room_id", "room", "step", "data", "entered_at", "deadline", "timed_out")
+
+    def __init__(self, room_id: str, step: str, data: Optional[Dict[str, Any]] = None):
+        self.room_id = room_id
+        self.room: Optional[RoomState] = None
+        self.step = step
+        self.data: Dict[str, Any] = data if data is not None else {}  # 跨状态传递的数据（死亡名单、待开枪猎人等）
+        self.entered_at = 0.0
+        self.deadline: Optional[float] = None  # 当前状态超时时间（time.time()）
+        self.timed_out = False
+
+
+StateAction = Callable[[MachineContext], Awaitable[None]]
+Guard = Callable[[MachineContext], bool]
+Timeout = Union[None, float, Callable[[MachineContext], Optional[float]]]
+# 检查点回调：(上下文, 进入动作是否已完成)
+Checkpoint = Callable[[MachineContext, bool], Awaitable[None]]
+
+
+class PhaseState:
+    """状态定义
+
+    Args:
+        name: 状态名
+        phase: 该状态对应的房间阶段（仅用于展示和超时兜底）
+        on_enter: 进入动作
+        on_exit: 离开动作
+        on_resume: 恢复动作，从检查点恢复且进入动作已完成时执行（如重新触发AI行动）
+        timeout: 超时秒数，或根据上下文计算超时秒数的函数；None 表示不超时
+        budget: 进入动作耗时上限（秒）
+        terminal: 是否为终止状态
+    """
+
+    def __init__(self, name: str, phase: Optional[GamePhase] = None,
+                 on_enter: Optional[StateAction] = None, on_exit: Optional[StateAction] = None,
+                 on_resume: Optional[StateAction] = None,
+                 timeout: Timeout = None, budget: float = DEFAULT_ENTRY_BUDGET, terminal: bool = False):
+        self.name = name
+        self.phase = phase
+        self.on_enter = on_enter
+        self.on_exit = on_exit
+        self.on_resume = on_resume
+        self.timeout = timeout
+        self.budget = budget
+        self.terminal = terminal
+
+    def resolve_timeout(self, ctx: MachineContext) -> Optional[float]:
+        if callable(self.timeout):
+            return self.timeout(ctx)
+        return self.timeout
+
+
+class Transition:
+    """转移定义：按声明顺序评估，第一个满足的转移生效
+
+    Args:
+        source: 源状态
+        target: 目标状态
+        guard: 守卫条件（只读判断，不做IO）；None 表示无条件
+        on_timeout: 是否只在状态超时后才允许转移
+    """
+
+    def __init__(self, source: str, target: str, guard: Optional[Guard] = None, on_timeout: bool = False):
+        self.source = source
+        self.target = target
+        self.guard = guard
+        self.on_timeout = on_timeout
+
+    def allowed(self, ctx: MachineContext) -> bool:
+        if self.on_timeout and not ctx.timed_out:
+            return False
+        return self.guard is None or self.guard(ctx)
+
+
+class PhaseMachine:
+    """表驱动的阶段状态机，并记录每个状态进入/离开动作的耗时"""
+
+    def __init__(self, states: List[PhaseState], transitions: List[Transition]):
+        self.states: Dict[str, PhaseState] = {s.name: s for s in states}
+        self.transitions: Dict[str, List[Transition]] = {name: [] for name in self.states}
+        for t in transitions:
+            if t.source not in self.states or t.target not in self.states:
+                raise ValueError(f"未知的状态转移: {t.source} -> {t.target}")
+            self.transitions[t.source].append(t)
+        for name, state in self.states.items():
+            if not state.terminal and not self.transitions[name]:
+                raise ValueError(f"非终止状态没有出口: {name}")
+        # {状态: {"count", "enter_total", "enter_max", "exit_total", "wait_total"}}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def next_step(self, ctx: MachineContext) -> Optional[str]:
+        """评估当前状态的转移，返回目标状态"""
+        for t in self.transitions[ctx.step]:
+            if t.allowed(ctx):
+                return t.target
+        return None
+
+    def needs_polling(self, step: str) -> bool:
+        """当前状态是否存在需要轮询房间状态的守卫条件"""
+        return any(t.guard is not None for t in self.transitions[step])
+
+    def record(self, step: str, key: str, seconds: float):
+        if key != "wait_total":
+            PHASE_ACTION_SECONDS.observe(seconds, step=step, action=key[:-len("_total")])
+        stat = self.stats.get(step)
+        if stat is None:
+            stat = self.stats[step] = {"count": 0, "enter_total": 0.0, "enter_max": 0.0, "exit_total": 0.0, "wait_total": 0.0}
+        stat[key] += seconds
+        if key == "enter_total":
+            stat["count"] += 1
+            if seconds > stat["enter_max"]:
+                stat["enter_max"] = seconds
+
+
+class RoomDriver:
+    """单个房间的状态机驱动循环
+
+    每个房间同时只有一个驱动任务，所有阶段转移都在这个循环里顺序执行，
+    玩家行动只修改房间状态并调用 wake() 唤醒驱动，不再直接推进阶段。
+    
+    进入每个状态前、进入动作完成后各写一次检查点（状态、跨状态数据、超时时间）。
+    进程重启后可从检查点恢复：进入动作已完成的状态沿用原超时时间继续等待（执行恢复动作），
+    未完成的状态重新执行进入动作。
+    设置 on_step 时，每进入（或恢复）一个状态，在执行动作之前调用 on_step(ctx)。
+    """
+
+    def __init__(self, machine: PhaseMachine, room_id: str, step: str,
+                 load_room: Callable[[str], Awaitable[Optional[RoomState]]],
+                 data: Optional[Dict[str, Any]] = None,
+                 checkpoint: Optional[Checkpoint] = None,
+                 resume_entered: bool = False, deadline: Optional[float] = None,
+                 on_step: Optional[Callable[[MachineContext], Any]] = None):
+        self.machine = machine
+        self.ctx = MachineContext(room_id, step, data)
+        self.ctx.deadline = deadline
+        self._load_room = load_room
+        self._checkpoint = checkpoint
+        self._on_step = on_step
+        self._resume_entered = resume_entered
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def step(self) -> str:
+        return self.ctx.step
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def alive(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def wake(self):
+        """房间状态发生变化，立即重新评估转移"""
+        self._wakeup.set()
+
+    async def _refresh(self) -> bool:
+        self.ctx.room = await self._load_room(self.ctx.room_id)
+        return self.ctx.room is not None
+
+    async def _run_action(self, action: StateAction, budget: Optional[float], label: str):
+        ctx = self.ctx
+        try:
+            with tracer.span(f"{ctx.step} {label}", CAT_ACTION, step=ctx.step):
+                if budget:
+                    await asyncio.wait_for(action(ctx), timeout=budget)
+                else:
+                    await action(ctx)
+        except asyncio.TimeoutError:
+            logger.error(f"【状态机】房间 {ctx.room_id} - 状态 {ctx.step} 的{label}超过 {budget} 秒，已取消")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"【状态机】房间 {ctx.room_id} - 状态 {ctx.step} 的{label}异常: {e}", exc_info=True)
+
+    async def _save_checkpoint(self, entered: bool):
+        if self._checkpoint is None:
+            return
+        try:
+            await self._checkpoint(self.ctx, entered)
+        except Exception as e:
+            logger.warning(f"【状态机】房间 {self.ctx.room_id} - 写入检查点失败（状态 {self.ctx.step}）: {e}")
+
+    async def _wait_for_transition(self, state: PhaseState) -> Optional[str]:
+        """等待直到某个转移满足条件"""
+        ctx = self.ctx
+        polling = self.machine.needs_polling(ctx.step)
+        # 有条件转移时在等玩家（或AI）行动，否则只是等计时结束
+        with tracer.span(f"{ctx.step} 等待", CAT_WAIT, step=ctx.step, waiting_on="players" if polling else "timer"):
+            return await self._wait_loop(polling)
+
+    async def _wait_loop(self, polling: bool) -> Optional[str]:
+        machine = self.machine
+        ctx = self.ctx
+        while True:
+            ctx.timed_out = ctx.deadline is not None and time.time() >= ctx.deadline
+            target = machine.next_step(ctx)
+            if target is not None:
+                return target
+
+            if ctx.deadline is None and not polling:
+                # 只有超时转移却没有超时时间，不会再有出口
+                logger.error(f"【状态机】房间 {ctx.room_id} - 状态 {ctx.step} 没有可用的转移")
+                return None
+            wait = GUARD_POLL_INTERVAL if polling else None
+            if ctx.deadline is not None:
+                remaining = max(0.0, ctx.deadline - time.time())
+                wait = remaining if wait is None else min(wait, remaining)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            if not await self._refresh():
+                return None
+
+    async def run(self):
+        machine = self.machine
+        ctx = self.ctx
+        logger.info(f"【状态机】房间 {ctx.room_id} - 驱动启动，初始状态: {ctx.step}")
+        # 驱动及其创建的子任务（AI行动等）中的追踪跨度都归属该房间
+        tracer.bind_room(ctx.room_id)
+        try:
+            while True:
+                state = machine.states[ctx.step]
+                if not await self._refresh():
+                    logger.warning(f"【状态机】房间 {ctx.room_id} 不存在，驱动退出")
+                    return
+
+                ctx.timed_out = False
+                if self._on_step:
+                    self._on_step(ctx)
+                if self._resume_entered:
+                    # 从检查点恢复：进入动作已执行过，沿用检查点中的超时时间
+                    self._resume_entered = False
+                    ctx.entered_at = time.time()
+                    logger.info(f"【状态机】房间 {ctx.room_id} - 从检查点恢复状态 {ctx.step}")
+                    if state.on_resume:
+                        await self._run_action(state.on_resume, state.budget, "恢复动作")
+                        if not await self._refresh():
+                            return
+                else:
+                    ctx.entered_at = time.time()
+                    await self._save_checkpoint(False)
+                    if state.on_enter:
+                        start = time.perf_counter()
+                        await self._run_action(state.on_enter, state.budget, "进入动作")
+                        machine.record(ctx.step, "enter_total", time.perf_counter() - start)
+                    if state.terminal:
+                        logger.info(f"【状态机】房间 {ctx.room_id} - 到达终止状态 {ctx.step}")
+                        return
+
+                    # 进入动作可能修改了房间（阶段时间等），超时按最新状态计算
+                    if not await self._refresh():
+                        return
+                    timeout = state.resolve_timeout(ctx)
+                    ctx.deadline = time.time() + timeout if timeout is not None else None
+                    await self._save_checkpoint(True)
+
+                wait_start = time.perf_counter()
+                target = await self._wait_for_transition(state)
+                machine.record(ctx.step, "wait_total", time.perf_counter() - wait_start)
+                if target is None:
+                    return
+
+                if state.on_exit:
+                    start = time.perf_counter()
+                    await self._run_action(state.on_exit, state.budget, "离开动作")
+                    machine.record(ctx.step, "exit_total", time.perf_counter() - start)
+
+                logger.info(f"【状态机】房间 {ctx.room_id} - {ctx.step} -> {target}{'（超时）' if ctx.timed_out else ''}")
+                PHASE_SECONDS.observe(time.time() - ctx.entered_at, step=ctx.step)
+                tracer.record(ctx.step, CAT_PHASE, ctx.entered_at, time.time() - ctx.entered_at,
+                              step=ctx.step, day=ctx.room.day_count if ctx.room else None,
+                              night=ctx.room.night_count if ctx.room else None, timed_out=ctx.timed_out, target=target)
+                PHASE_TRANSITIONS.inc(source=ctx.step, target=target, timeout=str(ctx.timed_out).lower())
+                ctx.step = target
+        except asyncio.CancelledError:
+            logger.info(f"【状态机】房间 {ctx.room_id} - 驱动已取消（状态 {ctx.step}）")
+            raise
+        except Exception as e:
+            logger.error(f"【状态机】房间 {ctx.room_id} - 驱动异常（状态 {ctx.step}）: {e}", exc_info=True)
@@ -2,8 +2,9 @@ import redis
 import json
 import asyncio
 import sys
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
@@ -13,6 +14,7 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
 from config import config
+from services.metrics_service import REDIS_SECONDS, REDIS_ERRORS, key_family
 
 # 检查 asyncio.to_thread 是否可用（Python 3.9+）
 HAS_TO_THREAD = hasattr(asyncio, 'to_thread')
@@ -93,10 +95,10 @@ class RedisService:
             # 直接使用 run_in_executor，在所有平台上都稳定
             try:
                 # 添加超时保护，避免无限等待
-                result = await asyncio.wait_for(
+                result = await self._timed("set", key, asyncio.wait_for(
                     loop.run_in_executor(_executor, set_func),
                     timeout=5.0  # 5秒超时
-                )
+                ))
             except asyncio.TimeoutError:
                 raise Exception("Redis操作超时") from None
             except Exception as executor_error:
@@ -125,7 +127,7 @@ class RedisService:
                 loop = asyncio.get_running_loop()
             except RuntimeError:
                 loop = asyncio.get_event_loop()
-            value = await loop.run_in_executor(_executor, self._get_sync, key)
+            value = await self._timed("get", key, loop.run_in_executor(_executor, self._get_sync, key))
             
             if value:
                 try:
@@ -144,7 +146,7 @@ class RedisService:
                 loop = asyncio.get_running_loop()
             except RuntimeError:
                 loop = asyncio.get_event_loop()
-            await loop.run_in_executor(_executor, self._delete_sync, key)
+            await self._timed("delete", key, loop.run_in_executor(_executor, self._delete_sync, key))
         except Exception as e:
             print(f"[Redis错误] delete操作失败 (key={key}): {e}", flush=True)
     
@@ -155,7 +157,7 @@ class RedisService:
                 loop = asyncio.get_running_loop()
             except RuntimeError:
                 loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(_executor, self._exists_sync, key)
+            result = await self._timed("exists", key, loop.run_in_executor(_executor, self._exists_sync, key))
             return result
         except Exception as e:
             print(f"[Redis错误] exists操作失败 (key={key}): {e}", flush=True)
@@ -176,30 +178,328 @@ class RedisService:
         await self.set(f"room:{room_id}", data)  # 暂时不使用过期时间
     
     async def get_room_data(self, room_id: str) -> Optional[Dict]:
-        """获取房间数据"""
+        """获取房间快照（最近一次快照事件时的状态；当前状态需折叠之后的补丁，见 GameEventLog.load）"""
         return await self.get(f"room:{room_id}")
     
-    async def add_room_message(self, room_id: str, message: Dict):
+    async def set_room_machine_state(self, room_id: str, state: Dict):
+        """保存房间阶段状态机检查点（与事件流同样保留 EVENT_LOG_TTL，未正常结束的房间不会一直留下检查点）"""
+        await self.set(f"room:{room_id}:machine", state, ex=config.EVENT_LOG_TTL)
+    
+    async def get_room_machine_state(self, room_id: str) -> Optional[Dict]:
+        """获取房间阶段状态机检查点"""
+        return await self.get(f"room:{room_id}:machine")
+    
+    async def delete_room_machine_state(self, room_id: str):
+        """删除房间阶段状态机检查点"""
+        await self.delete(f"room:{room_id}:machine")
+    
+    async def set_room_unlocked_characters(self, room_id: str, unlocked: Dict[str, List[Dict]]):
+        """保存游戏结束时各玩家解锁的角色 {user_id: [characters]}"""
+        await self.set(f"room:{room_id}:unlocked", unlocked, ex=3600)
+    
+    async def get_room_unlocked_characters(self, room_id: str) -> Optional[Dict[str, List[Dict]]]:
+        """获取游戏结束时各玩家解锁的角色"""
+        return await self.get(f"room:{room_id}:unlocked")
+    
+    # ---------- 消息日志（Redis List，追加写、分页读） ----------
+    
+    def _append_list_sync(self, key: str, value: str, ex: int):
+        """同步追加列表元素并刷新过期时间 - 内部方法，返回追加后的长度"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.rpush(key, value)
+            pipe.expire(key, ex)
+            return pipe.execute()[0]
+        except redis.ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            # 旧版本把整个消息列表存成一个JSON字符串，迁移成List后重试
+            old_value = self.redis_client.get(key)
+            old_messages = json.loads(old_value) if old_value else []
+            pipe = self.redis_client.pipeline()
+            pipe.delete(key)
+            for msg in old_messages:
+                pipe.rpush(key, json.dumps(msg, ensure_ascii=False, default=str))
+            pipe.rpush(key, value)
+            pipe.expire(key, ex)
+            return pipe.execute()[-2]
+    
+    def _range_list_sync(self, key: str, start: int, end: int) -> List[str]:
+        """同步读取列表区间 - 内部方法"""
+        return self.redis_client.lrange(key, start, end)
+    
+    def _len_list_sync(self, key: str) -> int:
+        """同步获取列表长度 - 内部方法"""
+        return self.redis_client.llen(key)
+    
+    async def _timed(self, command: str, key: str, awaitable):
+        """等待一次 Redis 操作并按命令和键族记录耗时（含线程池排队时间）与失败次数"""
+        family = key_family(key) if key else ""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            REDIS_ERRORS.inc(command=command, key_family=family)
+            raise
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, command=command, key_family=family)
+    
+    async def _run_sync(self, func, *args, key: Optional[str] = None):
+        """在线程池中执行同步操作
+        
+        指标中的命令名取自函数名（_append_list_sync -> append_list），键默认取第一个参数
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = asyncio.get_event_loop()
+        command = getattr(func, "__name__", "call").strip("_")
+        if command.endswith("_sync"):
+            command = command[:-5]
+        if key is None and args and isinstance(args[0], str):
+            key = args[0]
+        return await self._timed(command, key, loop.run_in_executor(_executor, partial(func, *args)))
+    
+    async def _append_message(self, key: str, message: Dict) -> int:
+        """追加一条消息，返回追加后的消息总数"""
+        value = json.dumps(message, ensure_ascii=False, default=str)
+        try:
+            return await self._run_sync(self._append_list_sync, key, value, 3600)
+        except Exception as e:
+            error_msg = f"Redis追加消息失败 (key={key}): {e}"
+            print(f"[Redis错误] {error_msg}", flush=True)
+            raise Exception(error_msg) from e
+    
+    async def _get_messages_page(self, key: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """分页读取消息
+        
+        Args:
+            offset: 起始位置，负数表示从末尾倒数（-10 即最近10条）
+            limit: 最多返回条数，None 表示读到末尾
+        """
+        if limit is not None and limit <= 0:
+            return []
+        if limit is None:
+            end = -1
+        elif offset < 0:
+            end = min(offset + limit - 1, -1)
+        else:
+            end = offset + limit - 1
+        try:
+            values = await self._run_sync(self._range_list_sync, key, offset, end)
+        except Exception as e:
+            print(f"[Redis错误] 读取消息失败 (key={key}): {e}", flush=True)
+            return []
+        messages = []
+        for value in values:
+            try:
+                messages.append(json.loads(value))
+            except (TypeError, ValueError):
+                continue
+        return messages
+    
+    async def _count_messages(self, key: str) -> int:
+        """获取消息总数"""
+        try:
+            return await self._run_sync(self._len_list_sync, key)
+        except Exception as e:
+            print(f"[Redis错误] 获取消息数量失败 (key={key}): {e}", flush=True)
+            return 0
+    
+    async def add_room_message(self, room_id: str, message: Dict) -> int:
         """添加房间消息"""
-        key = f"room:{room_id}:messages"
-        messages = await self.get(key) or []
-        messages.append(message)
-        await self.set(key, messages, ex=3600)
+        return await self._append_message(f"room:{room_id}:messages", message)
+    
+    async def get_room_messages(self, room_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """获取房间消息（默认全部；offset/limit 用于分页）"""
+        return await self._get_messages_page(f"room:{room_id}:messages", offset, limit)
     
-    async def get_room_messages(self, room_id: str) -> List[Dict]:
-        """获取房间消息"""
-        return await self.get(f"room:{room_id}:messages") or []
+    async def count_room_messages(self, room_id: str) -> int:
+        """获取房间消息总数"""
+        return await self._count_messages(f"room:{room_id}:messages")
     
-    async def add_private_message(self, room_id: str, user_id: str, message: Dict):
+    async def add_private_message(self, room_id: str, user_id: str, message: Dict) -> int:
         """添加私有消息"""
-        key = f"room:{room_id}:private:{user_id}"
-        messages = await self.get(key) or []
-        messages.append(message)
-        await self.set(key, messages, ex=3600)
-    
-    async def get_private_messages(self, room_id: str, user_id: str) -> List[Dict]:
-        """获取私有消息"""
-        return await self.get(f"room:{room_id}:private:{user_id}") or []
+        return await self._append_message(f"room:{room_id}:private:{user_id}", message)
+    
+    async def get_private_messages(self, room_id: str, user_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """获取私有消息（默认全部；offset/limit 用于分页）"""
+        return await self._get_messages_page(f"room:{room_id}:private:{user_id}", offset, limit)
+    
+    async def count_private_messages(self, room_id: str, user_id: str) -> int:
+        """获取私有消息总数"""
+        return await self._count_messages(f"room:{room_id}:private:{user_id}")
+
+    # ---------- 房间事件流（Redis Stream，追加写；快照事件与房间快照同一事务写入） ----------
+    
+    def _save_room_event_sync(self, room_id: str, event: Dict[str, str], ttl: int, snapshot: Optional[str]) -> str:
+        """同步追加房间事件，快照事件同时写入房间快照 - 内部方法，返回事件ID"""
+        stream_key = f"room:{room_id}:events"
+        pipe = self.redis_client.pipeline()
+        pipe.xadd(stream_key, event)
+        pipe.expire(stream_key, ttl)
+        if snapshot is not None:
+            pipe.set(f"room:{room_id}", snapshot)
+        return pipe.execute()[0]
+    
+    def _load_room_events_sync(self, room_id: str) -> Tuple[Optional[str], List]:
+        """同步读取房间快照和最新快照事件之后的事件 - 内部方法"""
+        stream_key = f"room:{room_id}:events"
+        pipe = self.redis_client.pipeline()
+        pipe.get(f"room:{room_id}")
+        pipe.get(f"room:{room_id}:events:snapshot")
+        snapshot, snapshot_id = pipe.execute()
+        # 从快照事件本身开始读：快照指针落后于房间快照时，折叠到该快照事件会先回到对应状态
+        events = self.redis_client.xrange(stream_key, snapshot_id or "-", "+")
+        if not events and snapshot_id:
+            # 快照指针指向的事件已被裁掉或过期，从头读取
+            events = self.redis_client.xrange(stream_key, "-", "+")
+        return snapshot, events
+    
+    def _append_message_with_event_sync(self, room_id: str, list_key: str, value: str, event: Dict[str, str], ttl: int) -> int:
+        """同步追加消息并追加事件 - 内部方法，返回消息总数"""
+        stream_key = f"room:{room_id}:events"
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.rpush(list_key, value)
+            pipe.expire(list_key, 3600)
+            pipe.xadd(stream_key, event)
+            pipe.expire(stream_key, ttl)
+            return pipe.execute()[0]
+        except redis.ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            # 旧格式的消息列表先迁移，再单独追加事件
+            count = self._append_list_sync(list_key, value, 3600)
+            self.redis_client.xadd(stream_key, event)
+            return count
+    
+    def _mark_snapshot_sync(self, room_id: str, event_id: str, ttl: int, trim: bool) -> int:
+        """同步记录最新快照事件，必要时裁掉快照之前的事件 - 内部方法，返回裁掉的事件数"""
+        pipe = self.redis_client.pipeline()
+        pipe.set(f"room:{room_id}:events:snapshot", event_id, ex=ttl)
+        if trim:
+            pipe.xtrim(f"room:{room_id}:events", minid=event_id)
+        return pipe.execute()[-1] if trim else 0
+    
+    async def save_room_event(self, room_id: str, event: Dict[str, str], ttl: int, snapshot: Optional[str] = None) -> str:
+        """追加一条房间事件；snapshot 为完整状态的JSON时同时写入房间快照 room:{id}（一次往返）"""
+        return await self._run_sync(self._save_room_event_sync, room_id, event, ttl, snapshot,
+                                   key=f"room:{room_id}:events")
+    
+    async def load_room_events(self, room_id: str) -> Tuple[Optional[str], List]:
+        """读取房间快照JSON和从最新快照事件开始的事件 [(事件ID, 字段), ...]"""
+        return await self._run_sync(self._load_room_events_sync, room_id, key=f"room:{room_id}:events")
+    
+    async def append_message_with_event(self, room_id: str, list_key: str, message: Dict, event: Dict[str, str], ttl: int) -> int:
+        """追加消息并追加一条事件（一次往返）"""
+        value = json.dumps(message, ensure_ascii=False, default=str)
+        return await self._run_sync(self._append_message_with_event_sync, room_id, list_key, value, event, ttl,
+                                   key=list_key)
+    
+    async def mark_room_snapshot(self, room_id: str, event_id: str, ttl: int, trim: bool = False) -> int:
+        """记录最新快照事件ID；trim 为 True 时裁掉之前的事件"""
+        return await self._run_sync(self._mark_snapshot_sync, room_id, event_id, ttl, trim,
+                                   key=f"room:{room_id}:events:snapshot")
+    
+    async def get_room_events(self, room_id: str, start: str = "-", end: str = "+", count: Optional[int] = None) -> List:
+        """读取房间事件 [(事件ID, 字段), ...]"""
+        return await self._run_sync(self.redis_client.xrange, f"room:{room_id}:events", start, end, count)
+    
+    async def count_room_events(self, room_id: str) -> int:
+        """房间事件数"""
+        return await self._run_sync(self.redis_client.xlen, f"room:{room_id}:events")
+    
+    # ---------- 房间归属（工作进程注册、房间租约、进行中房间） ----------
+    
+    def _acquire_lease_sync(self, key: str, owner: str, ttl: int) -> bool:
+        """同步获取租约 - 内部方法；已由自己持有时续期"""
+        if self.redis_client.set(key, owner, nx=True, ex=ttl):
+            return True
+        return self._renew_lease_sync(key, owner, ttl)
+    
+    def _renew_lease_sync(self, key: str, owner: str, ttl: int) -> bool:
+        """同步续期租约 - 内部方法；租约不属于自己时返回False"""
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != owner:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.set(key, owner, ex=ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+    
+    def _release_lease_sync(self, key: str, owner: str) -> bool:
+        """同步释放租约 - 内部方法；只释放自己持有的租约"""
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != owner:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+    
+    async def acquire_room_lease(self, room_id: str, owner: str, ttl: int) -> bool:
+        """获取房间租约（SET NX EX）"""
+        return await self._run_sync(self._acquire_lease_sync, f"room:{room_id}:owner", owner, ttl)
+    
+    async def renew_room_lease(self, room_id: str, owner: str, ttl: int) -> bool:
+        """续期房间租约"""
+        return await self._run_sync(self._renew_lease_sync, f"room:{room_id}:owner", owner, ttl)
+    
+    async def release_room_lease(self, room_id: str, owner: str) -> bool:
+        """释放房间租约"""
+        return await self._run_sync(self._release_lease_sync, f"room:{room_id}:owner", owner)
+    
+    async def get_room_lease_owner(self, room_id: str) -> Optional[str]:
+        """获取房间租约持有者（工作进程ID）"""
+        return await self._run_sync(self._get_sync, f"room:{room_id}:owner")
+    
+    async def register_worker(self, worker_id: str, info: Dict):
+        """登记/刷新工作进程心跳"""
+        value = json.dumps(info, ensure_ascii=False)
+        await self._run_sync(self.redis_client.hset, "workers", worker_id, value)
+    
+    async def get_workers(self) -> Dict[str, Dict]:
+        """获取所有已登记的工作进程 {worker_id: info}"""
+        values = await self._run_sync(self.redis_client.hgetall, "workers")
+        workers = {}
+        for worker_id, value in values.items():
+            try:
+                workers[worker_id] = json.loads(value)
+            except (TypeError, ValueError):
+                continue
+        return workers
+    
+    async def remove_workers(self, *worker_ids: str):
+        """注销工作进程"""
+        if worker_ids:
+            await self._run_sync(self.redis_client.hdel, "workers", *worker_ids)
+    
+    async def add_active_room(self, room_id: str):
+        """登记进行中的房间（工作进程宕机后由新的归属进程接管）"""
+        await self._run_sync(self.redis_client.sadd, "werewolf:active_rooms", room_id)
+    
+    async def remove_active_room(self, room_id: str):
+        """移除进行中的房间"""
+        await self._run_sync(self.redis_client.srem, "werewolf:active_rooms", room_id)
+    
+    async def is_active_room(self, room_id: str) -> bool:
+        """房间是否已开始且尚未结束"""
+        return bool(await self._run_sync(self.redis_client.sismember, "werewolf:active_rooms", room_id))
+    
+    async def get_active_rooms(self) -> List[str]:
+        """获取所有进行中的房间"""
+        return list(await self._run_sync(self.redis_client.smembers, "werewolf:active_rooms"))
 
 # 全局Redis服务实例
 redis_service = RedisService()
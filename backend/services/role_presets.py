@@ -0,0 +1,133 @@
+import sys
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from models.game import PlayerRole
+
+logger = logging.getLogger(__name__)
+
+# 自动配置：按开局人数自动平衡
+AUTO_PRESET_ID = "auto"
+MIN_PLAYERS = 4
+
+# 神职分配顺序；超过4个神职时只追加猎人（守卫/预言家/女巫按单人角色结算）
+_GOD_ROLES = [PlayerRole.SEER, PlayerRole.WITCH, PlayerRole.HUNTER, PlayerRole.GUARD]
+
+
+class RolePreset:
+    """板子配置：各角色人数"""
+
+    def __init__(self, preset_id: str, name: str, counts: Dict[PlayerRole, int], description: str = ""):
+        self.preset_id = preset_id
+        self.name = name
+        self.counts = {role: n for role, n in counts.items() if n > 0}
+        self.description = description
+
+    @property
+    def size(self) -> int:
+        return sum(self.counts.values())
+
+    def build_roles(self) -> List[PlayerRole]:
+        """展开为角色列表（未打乱）"""
+        roles = []
+        for role in (PlayerRole.WOLF, *_GOD_ROLES, PlayerRole.VILLAGER):
+            roles.extend([role] * self.counts.get(role, 0))
+        return roles
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.preset_id,
+            "name": self.name,
+            "description": self.description,
+            "size": self.size,
+            "roles": {role.value: n for role, n in self.counts.items()},
+        }
+
+
+def auto_balance(player_count: int) -> RolePreset:
+    """按人数自动平衡角色
+
+    12人及以下沿用原有比例（狼、神各约1/3，其余平民）；
+    12人以上狼人约占30%，每多6人追加一名猎人，其余为平民，保证屠边规则下神民两边都有足够人数。
+    """
+    n = player_count
+    counts: Dict[PlayerRole, int] = {}
+    if n <= 12:
+        num_wolves = max(1, n // 3)
+        num_gods = min(max(1, n // 3), len(_GOD_ROLES), n - num_wolves)
+        counts[PlayerRole.WOLF] = num_wolves
+        for role in _GOD_ROLES[:num_gods]:
+            counts[role] = 1
+        counts[PlayerRole.VILLAGER] = n - num_wolves - num_gods
+    else:
+        num_wolves = round(n * 0.3)
+        extra_hunters = (n - 12 + 5) // 6
+        counts[PlayerRole.WOLF] = num_wolves
+        for role in _GOD_ROLES:
+            counts[role] = 1
+        counts[PlayerRole.HUNTER] += extra_hunters
+        counts[PlayerRole.VILLAGER] = n - num_wolves - len(_GOD_ROLES) - extra_hunters
+    return RolePreset(f"{AUTO_PRESET_ID}_{n}", f"{n}人自动配置", counts)
+
+
+class RolePresetRegistry:
+    """板子注册表"""
+
+    def __init__(self):
+        self._presets: Dict[str, RolePreset] = {}
+
+    def register(self, preset: RolePreset):
+        if preset.preset_id == AUTO_PRESET_ID:
+            raise ValueError(f"板子ID {AUTO_PRESET_ID} 为保留ID")
+        if preset.size < MIN_PLAYERS:
+            raise ValueError(f"板子 {preset.preset_id} 人数不足 {MIN_PLAYERS} 人")
+        if preset.counts.get(PlayerRole.WOLF, 0) < 1:
+            raise ValueError(f"板子 {preset.preset_id} 至少需要1名狼人")
+        self._presets[preset.preset_id] = preset
+
+    def get(self, preset_id: str) -> Optional[RolePreset]:
+        return self._presets.get(preset_id)
+
+    def list_presets(self) -> List[RolePreset]:
+        return sorted(self._presets.values(), key=lambda p: p.size)
+
+    def resolve(self, preset_id: Optional[str], player_count: int) -> Optional[RolePreset]:
+        """获取开局使用的板子
+
+        指定板子时人数必须与板子一致，否则返回 None；
+        未指定或为 auto 时按人数自动平衡。
+        """
+        if preset_id and preset_id != AUTO_PRESET_ID:
+            preset = self._presets.get(preset_id)
+            if preset is None or preset.size != player_count:
+                return None
+            return preset
+        return auto_balance(player_count)
+
+
+role_preset_registry = RolePresetRegistry()
+
+# 12人标准板：4狼+4神+4民
+role_preset_registry.register(RolePreset("standard_12", "12人标准局", {
+    PlayerRole.WOLF: 4,
+    PlayerRole.SEER: 1,
+    PlayerRole.WITCH: 1,
+    PlayerRole.HUNTER: 1,
+    PlayerRole.GUARD: 1,
+    PlayerRole.VILLAGER: 4,
+}, "4狼 + 预言家/女巫/猎人/守卫 + 4平民"))
+
+# 嘉年华大板子
+for _size in (16, 20, 24, 30):
+    if _size <= config.WEREWOLF_MAX_PLAYERS:
+        _preset = auto_balance(_size)
+        role_preset_registry.register(RolePreset(
+            f"carnival_{_size}", f"{_size}人嘉年华", _preset.counts,
+            f"{_preset.counts[PlayerRole.WOLF]}狼 + {_size - _preset.counts[PlayerRole.WOLF] - _preset.counts[PlayerRole.VILLAGER]}神 + {_preset.counts[PlayerRole.VILLAGER]}平民"))
@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import hashlib
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from services.redis_service import redis_service
+
+logger = logging.getLogger(__name__)
+
+# 每个工作进程在哈希环上的虚拟节点数
+VIRTUAL_NODES = 64
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环：工作进程增减时只有少量房间改变归属"""
+
+    def __init__(self, nodes: List[str], replicas: int = VIRTUAL_NODES):
+        self.nodes = sorted(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._keys = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[idx]
+
+
+class RoomRouter:
+    """房间归属：一致性哈希决定房间应由哪个工作进程负责，Redis 租约保证同一时刻只有一个进程持有房间
+
+    - 持有租约的进程运行该房间的阶段状态机、AI任务和WebSocket连接，其余进程把请求重定向过去
+    - 只有已开始的房间（werewolf:active_rooms）持有租约；等待中或不存在的房间按哈希环就地处理，不持有租约
+    - 租约优先于哈希结果（粘性），新进程加入时不会抢走正在进行的房间
+    - 工作进程宕机后租约过期，哈希环上的新归属进程接管进行中的房间
+    - 未启动时（单进程/脚本）视为本进程持有所有房间
+    """
+
+    def __init__(self, worker_id: str, worker_url: str):
+        self.worker_id = worker_id
+        self.worker_url = worker_url.rstrip("/")
+        self._workers: Dict[str, str] = {}  # 存活的工作进程 {worker_id: url}
+        self._ring = HashRing([])
+        self._owned: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.acquire_callback: Optional[Callable[[str], Awaitable[None]]] = None
+        self.release_callback: Optional[Callable[[str], Awaitable[None]]] = None
+
+    def set_acquire_callback(self, callback):
+        """设置接管房间回调（工作进程宕机后接管进行中的房间）"""
+        self.acquire_callback = callback
+
+    def set_release_callback(self, callback):
+        """设置失去房间回调（租约续期失败时停止本地任务）"""
+        self.release_callback = callback
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def is_local(self, room_id: str) -> bool:
+        """房间是否由本进程负责"""
+        return not self.running or room_id in self._owned
+
+    async def start(self):
+        await self._heartbeat()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"【房间路由】工作进程 {self.worker_id} 已登记 ({self.worker_url})，当前存活进程: {sorted(self._workers)}")
+
+    async def stop(self):
+        """停止心跳并释放持有的所有租约，让其他进程立即接管"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for room_id in list(self._owned):
+            try:
+                await redis_service.release_room_lease(room_id, self.worker_id)
+            except Exception as e:
+                logger.warning(f"【房间路由】释放房间 {room_id} 租约失败: {e}")
+        self._owned.clear()
+        try:
+            await redis_service.remove_workers(self.worker_id)
+        except Exception as e:
+            logger.warning(f"【房间路由】注销工作进程失败: {e}")
+
+    async def resolve(self, room_id: str) -> Optional[str]:
+        """确定房间归属：本进程负责时返回 None（已开始的房间必要时获取租约），否则返回归属进程的地址"""
+        if not self.running:
+            return None
+        try:
+            holder = await redis_service.get_room_lease_owner(room_id)
+            if holder == self.worker_id:
+                self._owned.add(room_id)
+                return None
+            if holder and holder in self._workers:
+                return self._workers[holder]
+            # 租约空闲或持有者已失联：按哈希环决定
+            target = self._ring.get(room_id) or self.worker_id
+            if target != self.worker_id:
+                return self._workers[target]
+            # 房间不存在或还没开始：不需要续期和接管，也就不获取租约
+            if not await redis_service.is_active_room(room_id):
+                return None
+            if await redis_service.acquire_room_lease(room_id, self.worker_id, config.ROOM_LEASE_TTL):
+                self._owned.add(room_id)
+                return None
+            # 并发下被其他进程抢先，或失联进程的租约尚未过期（此时就地处理但不持有房间，不会启动本地任务）
+            holder = await redis_service.get_room_lease_owner(room_id)
+            return self._workers.get(holder) if holder != self.worker_id else None
+        except Exception as e:
+            # Redis 不可用时就地处理，保证可用性
+            logger.warning(f"【房间路由】解析房间 {room_id} 归属失败，由本进程处理: {e}")
+            return None
+
+    async def claim(self, room_id: str) -> bool:
+        """房间开始游戏时获取租约（开始请求已按哈希环路由到本进程），返回是否持有房间"""
+        if not self.running:
+            return True
+        try:
+            if await redis_service.acquire_room_lease(room_id, self.worker_id, config.ROOM_LEASE_TTL):
+                self._owned.add(room_id)
+                return True
+            logger.warning(f"【房间路由】房间 {room_id} 的租约已被其他进程持有")
+        except Exception as e:
+            logger.warning(f"【房间路由】获取房间 {room_id} 租约失败: {e}")
+        return False
+
+    async def release(self, room_id: str):
+        """主动释放房间（游戏结束后不再续期）"""
+        if room_id not in self._owned:
+            return
+        self._owned.discard(room_id)
+        try:
+            await redis_service.release_room_lease(room_id, self.worker_id)
+        except Exception as e:
+            logger.warning(f"【房间路由】释放房间 {room_id} 租约失败: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(config.WORKER_HEARTBEAT_INTERVAL)
+            try:
+                await self._heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"【房间路由】心跳异常: {e}", exc_info=True)
+
+    async def _heartbeat(self):
+        await redis_service.register_worker(self.worker_id, {"url": self.worker_url, "ts": time.time()})
+        await self._refresh_workers()
+        await self._renew_leases()
+        await self._adopt_orphans()
+
+    async def _refresh_workers(self):
+        now = time.time()
+        workers = await redis_service.get_workers()
+        alive = {wid: info.get("url") for wid, info in workers.items() if now - info.get("ts", 0) <= config.WORKER_TTL}
+        alive[self.worker_id] = self.worker_url
+        stale = [wid for wid in workers if wid not in alive]
+        if stale:
+            await redis_service.remove_workers(*stale)
+            logger.warning(f"【房间路由】工作进程失联: {stale}")
+        if set(alive) != set(self._workers):
+            self._ring = HashRing(list(alive))
+            logger.info(f"【房间路由】存活进程变化: {sorted(alive)}")
+        self._workers = alive
+
+    async def _renew_leases(self):
+        for room_id in list(self._owned):
+            if await redis_service.renew_room_lease(room_id, self.worker_id, config.ROOM_LEASE_TTL):
+                continue
+            self._owned.discard(room_id)
+            logger.warning(f"【房间路由】房间 {room_id} 租约已失效，停止本地任务")
+            if self.release_callback:
+                try:
+                    await self.release_callback(room_id)
+                except Exception as e:
+                    logger.error(f"【房间路由】停止房间 {room_id} 本地任务失败: {e}", exc_info=True)
+
+    async def _adopt_orphans(self):
+        """接管租约已过期、哈希到本进程的进行中房间"""
+        for room_id in await redis_service.get_active_rooms():
+            if room_id in self._owned or self._ring.get(room_id) != self.worker_id:
+                continue
+            holder = await redis_service.get_room_lease_owner(room_id)
+            if holder and holder != self.worker_id:
+                continue
+            if not await redis_service.acquire_room_lease(room_id, self.worker_id, config.ROOM_LEASE_TTL):
+                continue
+            self._owned.add(room_id)
+            logger.info(f"【房间路由】接管房间 {room_id}")
+            if self.acquire_callback:
+                try:
+                    await self.acquire_callback(room_id)
+                except Exception as e:
+                    logger.error(f"【房间路由】接管房间 {room_id} 失败: {e}", exc_info=True)
+
+
+# 全局房间路由
+room_router = RoomRouter(config.WORKER_ID, config.WORKER_URL)
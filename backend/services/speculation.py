@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import logging
+from pathlib import Path
+from typing import Any, Coroutine, Dict, Hashable, Optional, Tuple
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from services.metrics_service import LLM_PREGEN
+from services.task_registry import task_registry, SCOPE_ROOM
+
+logger = logging.getLogger(__name__)
+
+# (类型, 玩家ID, 第几天)
+SpecKey = Tuple[str, str, int]
+
+
+class Speculation:
+    """一次预生成：后台任务和发起时的输入指纹"""
+    __slots__ = ("task", "fingerprint")
+
+    def __init__(self, task: asyncio.Task, fingerprint: Hashable):
+        self.task = task
+        self.fingerprint = fingerprint
+
+
+class SpeculationCache:
+    """推测式预生成缓存（遗言、白天开场发言）
+
+    输入一确定（夜晚死亡名单已定）就在后台发起大模型调用，结果按 房间/类型/玩家/天 缓存。
+    使用时比较输入指纹（存活玩家、最近的真人发言等），不一致说明状态已变化，丢弃结果改为现场生成。
+    预生成任务由任务注册表持有，跨状态保留，房间结束时取消。
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Dict[SpecKey, Speculation]] = {}
+
+    def start(self, room_id: str, kind: str, user_id: str, day: int, fingerprint: Hashable, coro: Coroutine):
+        """发起预生成；同一房间更早天数的结果不会再被使用，一并丢弃"""
+        entries = self._rooms.setdefault(room_id, {})
+        for key in [k for k in entries if k[2] < day or k == (kind, user_id, day)]:
+            self._drop(entries.pop(key), key[0], "unused")
+        task = task_registry.spawn(room_id, coro, f"pregen_{kind}", scope=SCOPE_ROOM)
+        entries[(kind, user_id, day)] = Speculation(task, fingerprint)
+        LLM_PREGEN.inc(kind=kind, outcome="started")
+
+    def _drop(self, entry: Speculation, kind: str, outcome: str):
+        if not entry.task.done():
+            entry.task.cancel()
+        LLM_PREGEN.inc(kind=kind, outcome=outcome)
+
+    async def take(self, room_id: str, kind: str, user_id: str, day: int, fingerprint: Hashable,
+                   wait: float) -> Optional[Any]:
+        """取出预生成结果：没有、指纹不一致、失败或 wait 秒内仍未完成时返回 None"""
+        entries = self._rooms.get(room_id)
+        entry = entries.pop((kind, user_id, day), None) if entries else None
+        if entry is None:
+            return None
+        if entry.fingerprint != fingerprint:
+            logger.info(f"【预生成】房间 {room_id} - {user_id} 的{kind}输入已变化，丢弃预生成结果")
+            self._drop(entry, kind, "diverged")
+            return None
+        if not entry.task.done():
+            await asyncio.wait({entry.task}, timeout=max(0.0, wait))
+            if not entry.task.done():
+                self._drop(entry, kind, "timeout")
+                return None
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            LLM_PREGEN.inc(kind=kind, outcome="failed")
+            return None
+        LLM_PREGEN.inc(kind=kind, outcome="hit")
+        return entry.task.result()
+
+    def discard_room(self, room_id: str):
+        """房间结束或迁出：丢弃未使用的预生成结果"""
+        for key, entry in self._rooms.pop(room_id, {}).items():
+            self._drop(entry, key[0], "unused")
+
+
+# 全局预生成缓存
+speculation = SpeculationCache()
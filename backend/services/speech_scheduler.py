@@ -0,0 +1,165 @@
+import asyncio
+import random
+import sys
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+from models.game import GamePhase
+from models.game_state import RoomState
+from services.metrics_service import AI_SPEECH
+from services.tracing import tracer
+from services.task_registry import task_registry
+
+logger = logging.getLogger(__name__)
+
+
+class RoomSpeechState:
+    """单个房间的发言调度状态"""
+    __slots__ = ("day", "spoken", "queue", "in_flight", "last_speaker", "timer", "worker")
+
+    def __init__(self):
+        self.day = -1
+        self.spoken: Dict[str, int] = {}  # 当天每个AI已发言次数
+        self.queue: List[str] = []  # 待发言的AI（按顺序）
+        self.in_flight: Set[str] = set()  # 正在生成发言的AI
+        self.last_speaker: Optional[str] = None
+        self.timer: Optional[asyncio.Task] = None  # 防抖计时
+        self.worker: Optional[asyncio.Task] = None  # 顺序发言任务
+
+
+class SpeechScheduler:
+    """白天AI发言调度：按房间防抖触发，维护有序发言队列，逐个发言
+
+    - 玩家连续发言只在停顿 AI_SPEECH_DEBOUNCE 秒后触发一轮，每轮最多 AI_SPEECH_PER_TRIGGER 名AI发言
+    - 发言顺序：当天发言少的优先，其次按座位从上一位发言者之后轮转
+    - 每名AI每天最多发言 AI_SPEECH_MAX_PER_DAY 次；正在生成或已在队列中的AI不会重复排队
+    - 同一房间同时只有一名AI在生成发言，发言之间间隔 AI_SPEECH_GAP_MIN~MAX 秒
+    - 白天讨论开始时可由 open_day 指定几名AI直接开场（计入当天发言次数）
+    这样大模型调用次数随游戏天数增长，而不是随聊天条数增长。
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomSpeechState] = {}
+        self.load_room_callback: Optional[Callable[[str], Awaitable[Optional[RoomState]]]] = None
+        self.speak_callback: Optional[Callable[[str, str], Awaitable[bool]]] = None
+
+    def set_load_room_callback(self, callback):
+        """设置读取房间回调 (room_id) -> RoomState"""
+        self.load_room_callback = callback
+
+    def set_speak_callback(self, callback):
+        """设置AI发言回调 (room_id, user_id) -> 是否已发言"""
+        self.speak_callback = callback
+
+    def _state(self, room_id: str) -> RoomSpeechState:
+        state = self._rooms.get(room_id)
+        if state is None:
+            state = self._rooms[room_id] = RoomSpeechState()
+        return state
+
+    def trigger(self, room_id: str):
+        """有玩家发言：重新开始防抖计时，停顿后安排一轮AI发言"""
+        state = self._state(room_id)
+        if state.timer and not state.timer.done():
+            state.timer.cancel()
+            AI_SPEECH.inc(outcome="debounced")
+        state.timer = task_registry.spawn(room_id, self._fire_later(room_id, state), "ai_speech_debounce")
+
+    async def _fire_later(self, room_id: str, state: RoomSpeechState):
+        await asyncio.sleep(config.AI_SPEECH_DEBOUNCE)
+        try:
+            await self._schedule_round(room_id, state)
+        except Exception as e:
+            logger.error(f"【AI发言调度】房间 {room_id} - 安排发言失败: {e}", exc_info=True)
+
+    @staticmethod
+    def _sync_day(state: RoomSpeechState, room: RoomState):
+        if state.day != room.day_count:
+            # 新的一天，重置发言计数
+            state.day = room.day_count
+            state.spoken.clear()
+            state.queue.clear()
+
+    async def open_day(self, room_id: str, user_ids: List[str]):
+        """白天讨论开始：指定的AI立即按顺序开场发言（不经过防抖）"""
+        state = self._state(room_id)
+        room = await self.load_room_callback(room_id)
+        if room is None or room.phase != GamePhase.DAY:
+            return
+        self._sync_day(state, room)
+        picked = [uid for uid in user_ids if uid not in state.queue and uid not in state.in_flight]
+        if not picked:
+            return
+        state.queue.extend(picked)
+        logger.info(f"【AI发言调度】房间 {room_id} 第{room.day_count}天 - 开场发言: {picked}")
+        self._ensure_worker(room_id, state)
+
+    def _ensure_worker(self, room_id: str, state: RoomSpeechState):
+        if state.worker is None or state.worker.done():
+            state.worker = task_registry.spawn(room_id, self._run_queue(room_id, state), "ai_speech")
+
+    async def _schedule_round(self, room_id: str, state: RoomSpeechState):
+        room = await self.load_room_callback(room_id)
+        if room is None or room.phase != GamePhase.DAY:
+            return
+        self._sync_day(state, room)
+
+        seats = [p.user_id for p in room.players]
+        start = seats.index(state.last_speaker) + 1 if state.last_speaker in seats else 0
+        seat_order = {uid: (i - start) % len(seats) for i, uid in enumerate(seats)}
+        candidates = []
+        for p in room.alive:
+            if not p.is_ai or p.user_id in state.in_flight or p.user_id in state.queue:
+                continue
+            if state.spoken.get(p.user_id, 0) >= config.AI_SPEECH_MAX_PER_DAY:
+                AI_SPEECH.inc(outcome="capped")
+                continue
+            candidates.append(p.user_id)
+        candidates.sort(key=lambda uid: (state.spoken.get(uid, 0), seat_order[uid]))
+        picked = candidates[:max(0, config.AI_SPEECH_PER_TRIGGER - len(state.queue))]
+        if not picked:
+            return
+        state.queue.extend(picked)
+        AI_SPEECH.inc(outcome="triggered")
+        logger.info(f"【AI发言调度】房间 {room_id} 第{room.day_count}天 - 安排发言: {picked}（队列 {len(state.queue)}）")
+        self._ensure_worker(room_id, state)
+
+    async def _run_queue(self, room_id: str, state: RoomSpeechState):
+        """按队列顺序逐个发言"""
+        while state.queue:
+            user_id = state.queue.pop(0)
+            await tracer.sleep(random.uniform(config.AI_SPEECH_GAP_MIN, config.AI_SPEECH_GAP_MAX), "ai_stagger", room_id)
+            room = await self.load_room_callback(room_id)
+            if room is None or room.phase != GamePhase.DAY or room.day_count != state.day:
+                # 白天已结束，丢弃剩余队列
+                state.queue.clear()
+                return
+            player = room.get_player(user_id)
+            if player is None or not player.alive:
+                continue
+            # 先计数再生成：生成失败也算一次，避免同一AI反复重试
+            state.spoken[user_id] = state.spoken.get(user_id, 0) + 1
+            state.in_flight.add(user_id)
+            try:
+                if await self.speak_callback(room_id, user_id):
+                    state.last_speaker = user_id
+                    AI_SPEECH.inc(outcome="spoken")
+            except Exception as e:
+                logger.warning(f"【AI发言调度】房间 {room_id} - AI {user_id} 发言失败: {e}")
+            finally:
+                state.in_flight.discard(user_id)
+
+    def cancel(self, room_id: str):
+        """房间结束或迁出：丢弃发言状态（计时和发言任务由任务注册表随房间取消）"""
+        self._rooms.pop(room_id, None)
+
+
+# 全局AI发言调度器
+speech_scheduler = SpeechScheduler()
@@ -0,0 +1,147 @@
+import asyncio
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Coroutine, Dict, Optional
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from services.metrics_service import ROOM_TASKS, ROOM_TASKS_IN_FLIGHT, ROOM_TASK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 任务作用域：随状态机状态结束而取消，或存活到房间结束
+SCOPE_STEP = "step"
+SCOPE_ROOM = "room"
+
+# 任务结束方式（监控指标 outcome 标签）
+OUTCOME_COMPLETED = "completed"
+OUTCOME_FAILED = "failed"
+OUTCOME_LATE = "cancelled_step_ended"  # 所属状态已结束仍未完成，结果已无用
+OUTCOME_ORPHANED = "cancelled_room_closed"  # 房间结束或迁出时仍在运行
+OUTCOME_CANCELLED = "cancelled"
+
+
+class TaskEntry:
+    """一个登记中的后台任务"""
+    __slots__ = ("kind", "step", "scope", "started", "cancel_reason")
+
+    def __init__(self, kind: str, step: Optional[str], scope: str):
+        self.kind = kind
+        self.step = step
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.cancel_reason: Optional[str] = None
+
+
+class RoomTasks:
+    """单个房间的当前状态和进行中的任务"""
+    __slots__ = ("step", "tasks")
+
+    def __init__(self):
+        self.step: Optional[str] = None
+        self.tasks: Dict[asyncio.Task, TaskEntry] = {}
+
+
+class TaskRegistry:
+    """按房间管理后台任务（AI发言、投票、跟票等）
+
+    - 登记的任务由注册表持有引用，不会在运行中被垃圾回收；未处理的异常会记录日志
+    - 任务默认归属创建时房间所处的状态机状态，状态切换时取消（结果已无用，不再浪费大模型调用）
+    - 房间结束、迁出或进程关闭时取消该房间的所有任务
+    - 任务结束方式和耗时计入监控指标
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomTasks] = {}
+
+    def _room(self, room_id: str) -> RoomTasks:
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = RoomTasks()
+        return room
+
+    def spawn(self, room_id: str, coro: Coroutine, kind: str, scope: str = SCOPE_STEP) -> asyncio.Task:
+        """在房间下启动后台任务"""
+        room = self._room(room_id)
+        entry = TaskEntry(kind, room.step, scope)
+        task = asyncio.create_task(coro)
+        room.tasks[task] = entry
+        task.add_done_callback(lambda t: self._finished(room_id, t, entry))
+        return task
+
+    def _finished(self, room_id: str, task: asyncio.Task, entry: TaskEntry):
+        room = self._rooms.get(room_id)
+        if room is not None:
+            room.tasks.pop(task, None)
+            if not room.tasks and room.step is None:
+                del self._rooms[room_id]
+        if task.cancelled():
+            outcome = entry.cancel_reason or OUTCOME_CANCELLED
+        elif task.exception() is not None:
+            outcome = OUTCOME_FAILED
+            logger.error(f"【后台任务】房间 {room_id} - {entry.kind} 异常: {task.exception()}",
+                         exc_info=task.exception())
+        else:
+            outcome = OUTCOME_COMPLETED
+        ROOM_TASKS.inc(kind=entry.kind, outcome=outcome)
+        ROOM_TASK_SECONDS.observe(time.perf_counter() - entry.started, kind=entry.kind)
+
+    def _cancel(self, room_id: str, entries, reason: str) -> int:
+        cancelled = 0
+        kinds: Dict[str, int] = {}
+        for task, entry in entries:
+            if task.done():
+                continue
+            entry.cancel_reason = reason
+            task.cancel()
+            cancelled += 1
+            kinds[entry.kind] = kinds.get(entry.kind, 0) + 1
+        if cancelled:
+            logger.info(f"【后台任务】房间 {room_id} - 取消 {cancelled} 个未完成任务（{reason}）: {kinds}")
+        return cancelled
+
+    def enter_step(self, room_id: str, step: str) -> int:
+        """房间进入状态机的新状态：取消属于其他状态的任务，返回取消数"""
+        room = self._room(room_id)
+        if room.step == step:
+            return 0
+        room.step = step
+        stale = [(task, entry) for task, entry in room.tasks.items()
+                 if entry.scope == SCOPE_STEP and entry.step != step]
+        return self._cancel(room_id, stale, OUTCOME_LATE)
+
+    def cancel_room(self, room_id: str) -> int:
+        """房间结束或迁出：取消房间的所有任务"""
+        room = self._rooms.pop(room_id, None)
+        if room is None:
+            return 0
+        return self._cancel(room_id, list(room.tasks.items()), OUTCOME_ORPHANED)
+
+    async def cancel_all(self):
+        """进程关闭：取消所有任务并等待结束"""
+        tasks = []
+        for room_id in list(self._rooms):
+            room = self._rooms[room_id]
+            tasks.extend(room.tasks)
+            self.cancel_room(room_id)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def in_flight(self) -> Dict:
+        """进行中的任务数（按类型），供监控指标采集"""
+        counts: Dict = {}
+        for room in self._rooms.values():
+            for entry in room.tasks.values():
+                key = (entry.kind,)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+# 全局房间后台任务注册表
+task_registry = TaskRegistry()
+ROOM_TASKS_IN_FLIGHT.set_collect(task_registry.in_flight)
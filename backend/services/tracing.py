@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# 添加 backend 目录到 Python 路径，以便正确导入模块
+backend_dir = Path(__file__).parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# 跨度类别：状态机状态、进入/离开动作、等待转移（玩家行动或计时）、节奏等待、大模型调用
+CAT_PHASE = "phase"
+CAT_ACTION = "action"
+CAT_WAIT = "wait"
+CAT_SLEEP = "sleep"
+CAT_AI = "ai"
+
+# 导出时每个类别占一条轨道，避免并发跨度在同一轨道上交叉
+_LANES = {CAT_PHASE: 1, CAT_WAIT: 2, CAT_ACTION: 3, CAT_SLEEP: 4, CAT_AI: 5}
+_LANE_NAMES = {1: "状态", 2: "等待转移", 3: "进入/离开动作", 4: "节奏等待", 5: "大模型"}
+
+# 当前协程所属的房间（房间驱动任务里设置，驱动中创建的子任务自动继承）
+_current_room: ContextVar[Optional[str]] = ContextVar("trace_room", default=None)
+
+
+class Span:
+    """一个已结束的跨度（时间为 Unix 秒）"""
+    __slots__ = ("name", "cat", "start", "duration", "args")
+
+    def __init__(self, name: str, cat: str, start: float, duration: float, args: Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.duration = duration
+        self.args = args
+
+
+class RoomTrace:
+    """单个房间的跨度缓冲（超过上限时丢弃最早的跨度）"""
+    __slots__ = ("room_id", "spans", "dropped", "finished")
+
+    def __init__(self, room_id: str, max_spans: int):
+        self.room_id = room_id
+        self.spans: deque = deque(maxlen=max_spans)
+        self.dropped = 0
+        self.finished = False
+
+    def add(self, span: Span):
+        if len(self.spans) == self.spans.maxlen:
+            self.dropped += 1
+        self.spans.append(span)
+
+
+class Tracer:
+    """按房间记录阶段时间线跨度，导出为 Chrome Trace Event 格式（chrome://tracing、Perfetto 可直接打开）
+
+    - 跨度归属当前上下文的房间（见 bind_room），也可显式传入 room_id；都没有时不记录
+    - 内存中保留最近 max_rooms 个房间；配置了导出目录时，游戏结束或房间迁出时写入 room_{id}.json
+    """
+
+    def __init__(self, enabled: bool, export_dir: str, max_spans: int, max_rooms: int):
+        self.enabled = enabled
+        self.export_dir = export_dir
+        self.max_spans = max_spans
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, RoomTrace]" = OrderedDict()
+
+    def bind_room(self, room_id: str):
+        """把当前协程（及其之后创建的子任务）绑定到房间"""
+        return _current_room.set(room_id)
+
+    def _room(self, room_id: str) -> RoomTrace:
+        trace = self._rooms.get(room_id)
+        if trace is None:
+            trace = self._rooms[room_id] = RoomTrace(room_id, self.max_spans)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+        return trace
+
+    def record(self, name: str, cat: str, start: float, duration: float,
+               room_id: Optional[str] = None, **args):
+        room_id = room_id or _current_room.get()
+        if not self.enabled or room_id is None:
+            return
+        self._room(room_id).add(Span(name, cat, start, duration, args))
+
+    @contextmanager
+    def span(self, name: str, cat: str, room_id: Optional[str] = None, **args):
+        """记录一段代码的耗时；yield 的字典可在执行过程中补充参数"""
+        if not self.enabled:
+            yield args
+            return
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.record(name, cat, start, time.time() - start, room_id, **args)
+
+    async def sleep(self, seconds: float, reason: str, room_id: Optional[str] = None):
+        """节奏等待（让玩家看到提示、模拟思考等），记录为 sleep 跨度"""
+        with self.span(reason, CAT_SLEEP, room_id, seconds=seconds):
+            await asyncio.sleep(seconds)
+
+    def export(self, room_id: str) -> Optional[Dict]:
+        """导出房间的 Chrome Trace Event 格式数据"""
+        trace = self._rooms.get(room_id)
+        if trace is None:
+            return None
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": f"房间 {room_id}"}}]
+        for tid, lane in _LANE_NAMES.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+        for span in trace.spans:
+            events.append({
+                "name": span.name,
+                "cat": span.cat,
+                "ph": "X",
+                "ts": int(span.start * 1e6),
+                "dur": int(span.duration * 1e6),
+                "pid": 1,
+                "tid": _LANES.get(span.cat, 0),
+                "args": span.args,
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"room_id": room_id, "worker": config.WORKER_ID, "dropped_spans": trace.dropped},
+        }
+
+    def finish(self, room_id: str) -> Optional[str]:
+        """房间结束（或迁出本进程）：配置了导出目录时写入文件，返回文件路径"""
+        trace = self._rooms.get(room_id)
+        if trace is None or trace.finished:
+            return None
+        trace.finished = True
+        if not self.export_dir:
+            return None
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            path = os.path.join(self.export_dir, f"room_{room_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.export(room_id), f, ensure_ascii=False)
+            logger.info(f"【阶段追踪】房间 {room_id} - 时间线已导出: {path}（{len(trace.spans)} 个跨度）")
+            return path
+        except Exception as e:
+            logger.warning(f"【阶段追踪】房间 {room_id} - 导出时间线失败: {e}")
+            return None
+
+
+# 全局追踪器
+tracer = Tracer(config.TRACE_ENABLED, config.TRACE_DIR, config.TRACE_MAX_SPANS, config.TRACE_MAX_ROOMS)
@@ -5,17 +5,30 @@ import sys
 import os
 import logging
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 # 添加 backend 目录到 Python 路径，以便正确导入模块
 backend_dir = Path(__file__).parent.parent
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
-from models.game import GameRoom, Player, GamePhase, PlayerRole
+from models.game import GamePhase, PlayerRole
+from models.game_state import RoomState, PlayerState
+from config import config
 from services.redis_service import redis_service
-from services.ai_service import AIService
+from services.ai_service import AIService, AIDeadlineExceeded
 from services.character_service import character_service
+from services.role_presets import role_preset_registry, AUTO_PRESET_ID, MIN_PLAYERS
+from services.phase_machine import PhaseMachine, PhaseState, Transition, RoomDriver, MachineContext
+from services.room_router import room_router
+from services.event_log import game_event_log
+from services.connection_manager import encode_frame
+from services.metrics_service import ROOMS_BY_PHASE, AI_DECISIONS
+from services.tracing import tracer
+from services.speech_scheduler import speech_scheduler
+from services.task_registry import task_registry
+from services.speculation import speculation
+from services.ai_context import ai_contexts, RoomAIContext
 
 # 配置日志 - 只使用根 logger，避免重复输出
 logger = logging.getLogger(__name__)
@@ -29,7 +42,11 @@ class WerewolfService:
     def __init__(self):
         self.broadcast_callback = None
         self.send_private_message_callback = None
-        self.processing_night_result = set()  # 正在处理夜晚结算的房间ID集合，防止重复调用
+        self._drivers: Dict[str, RoomDriver] = {}  # 每个房间的阶段状态机驱动
+        self._resume_timers: Dict[str, object] = {}  # 接管房间后等待当前阶段到期的任务
+        self.phase_machine = self._build_phase_machine()
+        speech_scheduler.set_load_room_callback(lambda rid: self.get_room(rid, check_timeout=False))
+        speech_scheduler.set_speak_callback(self._ai_speak)
     
     def set_broadcast_callback(self, callback):
         """设置广播回调函数"""
@@ -39,16 +56,6 @@ class WerewolfService:
         """设置发送私有消息回调函数"""
         self.send_private_message_callback = callback
     
-    # 12人标准配置：4狼+4神+4民
-    ROLES = [
-        PlayerRole.WOLF, PlayerRole.WOLF, PlayerRole.WOLF, PlayerRole.WOLF,  # 4狼人
-        PlayerRole.SEER,  # 1预言家
-        PlayerRole.WITCH,  # 1女巫
-        PlayerRole.HUNTER,  # 1猎人
-        PlayerRole.GUARD,  # 1守卫
-        PlayerRole.VILLAGER, PlayerRole.VILLAGER, PlayerRole.VILLAGER, PlayerRole.VILLAGER  # 4平民
-    ]
-    
     # 各阶段时间限制（秒）
     PHASE_DURATIONS = {
         GamePhase.WAITING: None,  # 等待阶段无时间限制
@@ -71,6 +78,18 @@ class WerewolfService:
         GamePhase.GAME_OVER: False
     }
     
+    # 夜晚各角色子阶段的等待时间（秒）
+    NIGHT_ROLE_TIMEOUT = 30
+    
+    # 超时兜底恢复驱动时，房间阶段对应的状态机状态
+    PHASE_RESUME_STEPS = {
+        GamePhase.IDENTITY_ASSIGN: "night",
+        GamePhase.NIGHT: "night_settle",
+        GamePhase.DAY: "voting",
+        GamePhase.VOTING: "vote_result",
+        GamePhase.ELIMINATION: "settle",
+    }
+    
     async def create_room(self, room_id: Optional[str] = None) -> str:
         """创建房间"""
         try:
@@ -81,51 +100,14 @@ class WerewolfService:
             
             logger.info(f"【创建房间】生成房间ID: {room_id}")
             
-            # 创建房间对象，确保所有字段都有默认值
-            room = GameRoom(
-                room_id=room_id,
-                players=[],
-                phase=GamePhase.WAITING,
-                day_count=0,
-                night_count=0,
-                messages=[],
-                private_messages={},
-                winner=None,
-                night_actions={},
-                current_night_phase=None,
-                eliminated_tonight=None,
-                saved_tonight=None,
-                phase_start_time=None,
-                phase_duration=None,
-                can_speak=False
-            )
-            
-            logger.info(f"【创建房间】房间对象创建成功，准备序列化")
-            
-            # 使用 mode='json' 确保所有值都是 JSON 可序列化的
-            # 如果失败，尝试使用默认模式并手动处理
-            try:
-                logger.info(f"【创建房间】尝试使用 mode='json' 序列化")
-                room_data = room.model_dump(mode='json')
-                logger.info(f"【创建房间】房间数据序列化成功 (mode='json')")
-            except Exception as e:
-                logger.warning(f"【创建房间】mode='json' 序列化失败，尝试默认模式: {e}")
-                try:
-                    # 使用默认模式，然后手动处理可能的问题字段
-                    room_data = room.model_dump()
-                    # 确保所有值都是 JSON 可序列化的
-                    import json as json_lib
-                    # 测试是否可以序列化
-                    json_lib.dumps(room_data, ensure_ascii=False, default=str)
-                    logger.info(f"【创建房间】房间数据序列化成功 (默认模式)")
-                except Exception as e2:
-                    logger.error(f"【创建房间错误】序列化失败: {e2}", exc_info=True)
-                    raise Exception(f"房间数据序列化失败: {str(e2)}") from e2
+            # 创建房间状态（字段均使用默认值）
+            room = RoomState(room_id=room_id)
+            room_data = room.to_dict()
             
             # 保存到Redis
             try:
                 logger.info(f"【创建房间】准备保存到Redis，房间ID: {room_id}")
-                await redis_service.set_room_data(room_id, room_data)
+                await game_event_log.save_room(room_id, room_data)
                 logger.info(f"【创建房间】Redis保存成功")
             except Exception as e:
                 error_type = type(e).__name__
@@ -145,30 +127,30 @@ class WerewolfService:
         try:
             logger.info(f"【加入房间】开始 - 房间 {room_id}, 玩家 {username} (ID: {user_id})")
             
-            room_data = await redis_service.get_room_data(room_id)
+            room_data = await game_event_log.load(room_id)
             if not room_data:
                 logger.warning(f"【加入房间失败】房间 {room_id} 不存在")
                 return False
             
             logger.info(f"【加入房间】从Redis获取房间数据成功")
             
-            room = GameRoom(**room_data)
+            room = RoomState.from_dict(room_data)
             
             logger.info(f"【加入房间】房间对象创建成功，当前玩家数: {len(room.players)}")
             
             # 检查是否已加入
-            if any(p.user_id == user_id for p in room.players):
+            if user_id in room.by_id:
                 logger.info(f"【玩家已存在】房间 {room_id} - 玩家 {username} (ID: {user_id}) 已在房间中")
                 return True
             
-            # 检查房间是否已满（最多12人）
-            if len(room.players) >= 12:
-                logger.warning(f"【加入房间失败】房间 {room_id} 已满（当前 {len(room.players)}/12 人）")
+            # 检查房间是否已满
+            if len(room.players) >= room.max_players:
+                logger.warning(f"【加入房间失败】房间 {room_id} 已满（当前 {len(room.players)}/{room.max_players} 人）")
                 return False
             
             logger.info(f"【加入房间】创建玩家对象")
             
-            player = Player(user_id=user_id, username=username, is_ai=False)
+            player = PlayerState(user_id=user_id, username=username, is_ai=False)
             room.players.append(player)
             
             # 更新所有非AI玩家且username为"玩家"的名称，根据他们在房间中的位置设置为"玩家1"、"玩家2"等
@@ -179,13 +161,13 @@ class WerewolfService:
             
             logger.info(f"【加入房间】保存房间数据到Redis")
             
-            await redis_service.set_room_data(room_id, room.model_dump())
+            await game_event_log.save_room(room_id, room.to_dict())
             
             # 打印玩家加入日志
             logger.info(f"\n{'='*60}")
             logger.info(f"【玩家加入游戏】房间 {room_id}")
             logger.info(f"  玩家: {username} (ID: {user_id})")
-            logger.info(f"  当前房间人数: {len(room.players)}/12")
+            logger.info(f"  当前房间人数: {len(room.players)}/{room.max_players}")
             logger.info(f"{'='*60}")
             
             return True
@@ -195,14 +177,14 @@ class WerewolfService:
     
     async def add_ai_player(self, room_id: str) -> bool:
         """添加AI玩家"""
-        room_data = await redis_service.get_room_data(room_id)
+        room_data = await game_event_log.load(room_id)
         if not room_data:
             return False
         
-        room = GameRoom(**room_data)
+        room = RoomState.from_dict(room_data)
         
-        # 检查房间是否已满（最多12人）
-        if len(room.players) >= 12:
+        # 检查房间是否已满
+        if len(room.players) >= room.max_players:
             return False
         
         # 检查游戏是否已开始
@@ -216,37 +198,41 @@ class WerewolfService:
         
         # 创建AI玩家，使用四位数字格式的ID
         ai_user_id = f"ai_{player_number:04d}"
-        ai_player = Player(user_id=ai_user_id, username=ai_name, is_ai=True)
+        ai_player = PlayerState(user_id=ai_user_id, username=ai_name, is_ai=True)
         room.players.append(ai_player)
         
-        await redis_service.set_room_data(room_id, room.model_dump())
+        await game_event_log.save_room(room_id, room.to_dict())
         
         # 打印AI玩家加入日志
-        logger.info(f"【AI玩家加入】房间 {room_id} - {ai_name} (ID: {ai_user_id})，当前房间人数: {len(room.players)}/12")
+        logger.info(f"【AI玩家加入】房间 {room_id} - {ai_name} (ID: {ai_user_id})，当前房间人数: {len(room.players)}/{room.max_players}")
         
         # 广播房间更新
         await self._ai_announce(room_id, f"{ai_name} 加入了游戏")
         
         return True
     
-    async def auto_fill_ai_players(self, room_id: str, target_count: int = 7) -> int:
-        """自动填充AI玩家到目标人数"""
-        room_data = await redis_service.get_room_data(room_id)
+    async def auto_fill_ai_players(self, room_id: str, target_count: Optional[int] = None) -> int:
+        """自动填充AI玩家到目标人数（默认填满房间）"""
+        room_data = await game_event_log.load(room_id)
         if not room_data:
             return 0
         
-        room = GameRoom(**room_data)
+        room = RoomState.from_dict(room_data)
         
         # 检查游戏是否已开始
         if room.phase != GamePhase.WAITING:
             return 0
         
+        if target_count is None:
+            target_count = room.max_players
+        target_count = min(target_count, room.max_players)
+        
         current_count = len(room.players)
-        if current_count >= target_count or current_count >= 12:
+        if current_count >= target_count:
             return 0
         
         added_count = 0
-        while current_count < target_count and current_count < 12:
+        while current_count < target_count:
             success = await self.add_ai_player(room_id)
             if success:
                 added_count += 1
@@ -256,6 +242,32 @@ class WerewolfService:
         
         return added_count
     
+    async def set_role_preset(self, room_id: str, preset_id: str) -> Dict:
+        """选择房间板子（仅等待阶段），同时调整房间人数上限"""
+        room = await self.get_room(room_id, check_timeout=False)
+        if not room:
+            return {"error": "房间不存在"}
+        if room.phase != GamePhase.WAITING:
+            return {"error": "游戏已开始，不能修改板子"}
+        
+        if preset_id == AUTO_PRESET_ID:
+            max_players = config.WEREWOLF_MAX_PLAYERS
+        else:
+            preset = role_preset_registry.get(preset_id)
+            if not preset:
+                return {"error": "板子不存在"}
+            if preset.size > config.WEREWOLF_MAX_PLAYERS:
+                return {"error": f"板子人数超过房间上限 {config.WEREWOLF_MAX_PLAYERS} 人"}
+            max_players = preset.size
+        if len(room.players) > max_players:
+            return {"error": f"当前玩家 {len(room.players)} 人，超过板子人数 {max_players} 人"}
+        
+        room.role_preset = preset_id
+        room.max_players = max_players
+        await game_event_log.save_room(room_id, room.to_dict())
+        logger.info(f"【板子选择】房间 {room_id} - 板子: {preset_id}，人数上限: {max_players}")
+        return {"success": True, "role_preset": preset_id, "max_players": max_players}
+    
     async def start_game(self, room_id: str) -> bool:
         """开始游戏"""
         try:
@@ -263,12 +275,12 @@ class WerewolfService:
             logger.info(f"【游戏开始】房间 {room_id}")
             logger.info(f"{'='*60}")
             
-            room_data = await redis_service.get_room_data(room_id)
+            room_data = await game_event_log.load(room_id)
             if not room_data:
                 logger.error(f"错误: 房间 {room_id} 不存在")
                 return False
             
-            room = GameRoom(**room_data)
+            room = RoomState.from_dict(room_data)
             logger.info(f"房间 {room_id} - 玩家数量: {len(room.players)}")
             
             # 更新所有非AI玩家且username为"玩家"的名称，根据他们在房间中的位置设置为"玩家1"、"玩家2"等
@@ -277,25 +289,17 @@ class WerewolfService:
                     p.username = f"玩家{i + 1}"
                     logger.info(f"【更新玩家名称】玩家 {p.user_id} 名称更新为: {p.username}")
             
-            if len(room.players) < 4:  # 至少4人
+            if len(room.players) < MIN_PLAYERS:  # 至少4人
                 logger.error(f"错误: 房间 {room_id} 玩家数量不足，当前: {len(room.players)}")
                 return False
             
-            # 分配身份（使用12人标准配置，如果人数不足则按比例分配）
-            if len(room.players) == 12:
-                roles = self.ROLES.copy()
-            else:
-                # 按比例分配角色
-                roles = []
-                num_wolves = max(1, len(room.players) // 3)
-                num_gods = max(1, len(room.players) // 3)
-                num_villagers = len(room.players) - num_wolves - num_gods
-                
-                roles.extend([PlayerRole.WOLF] * num_wolves)
-                roles.extend([PlayerRole.SEER, PlayerRole.WITCH, PlayerRole.HUNTER, PlayerRole.GUARD][:num_gods])
-                roles.extend([PlayerRole.VILLAGER] * num_villagers)
-                roles = roles[:len(room.players)]
-            
+            # 分配身份（使用房间选择的板子，未选择时按人数自动平衡）
+            preset = role_preset_registry.resolve(room.role_preset, len(room.players))
+            if preset is None:
+                logger.error(f"错误: 房间 {room_id} 玩家数量 {len(room.players)} 与板子 {room.role_preset} 不符")
+                return False
+            logger.info(f"房间 {room_id} - 使用板子: {preset.name}")
+            roles = preset.build_roles()
             random.shuffle(roles)
             
             logger.info(f"开始分配身份 - 房间 {room_id}")
@@ -330,14 +334,13 @@ class WerewolfService:
             await self._set_phase_time(room)
             
             # 发送身份信息（私有消息）
-            import json
             for player in room.players:
                 role_name = self._get_role_name(player.role)
                 role_desc = self._get_role_description(player.role)
                 
                 # 构建身份消息
                 if player.role == PlayerRole.WOLF:
-                    wolves = [p.username for p in room.players if p.role == PlayerRole.WOLF and p.user_id != player.user_id]
+                    wolves = [p.username for p in room.wolves if p.user_id != player.user_id]
                     if wolves:
                         identity_msg = {
                             "type": "identity",
@@ -358,7 +361,7 @@ class WerewolfService:
                     }
                 
                 # 保存到 Redis
-                await redis_service.add_private_message(room_id, player.user_id, identity_msg)
+                await game_event_log.add_private_message(room_id, player.user_id, identity_msg)
                 
                 # 立即通过 WebSocket 发送私有消息（如果回调函数已设置）
                 if self.send_private_message_callback:
@@ -366,7 +369,7 @@ class WerewolfService:
                         await self.send_private_message_callback(
                             room_id, 
                             player.user_id, 
-                            json.dumps({
+                            encode_frame({
                                 "type": "private_message",
                                 "content": identity_msg
                             })
@@ -374,15 +377,16 @@ class WerewolfService:
                     except Exception as e:
                         logger.warning(f"发送私有消息失败 (房间 {room_id}, 用户 {player.user_id}): {e}")
             
-            # 保存房间状态
-            await redis_service.set_room_data(room_id, room.model_dump())
+            # 保存房间状态，并登记为进行中的房间（归属进程宕机后由其他进程接管）
+            await game_event_log.save_room(room_id, room.to_dict())
+            await redis_service.add_active_room(room_id)
+            await room_router.claim(room_id)
             
             # AI主持人宣布开始
             await self._ai_announce(room_id, "游戏开始！身份已分配，请查看你的身份信息。")
             
             # 等待一下，确保消息已发送
-            import asyncio
-            await asyncio.sleep(0.3)
+            await tracer.sleep(0.3, "announce", room_id)
             
             # 不在这里进入夜晚阶段，而是在后台任务中处理
             # 这样可以让 start_game 快速返回，避免超时
@@ -392,126 +396,401 @@ class WerewolfService:
             logger.error(f"开始游戏失败 (房间 {room_id}): {e}", exc_info=True)
             return False
     
-    async def get_room(self, room_id: str, check_timeout: bool = True) -> Optional[GameRoom]:
+    async def get_room(self, room_id: str, check_timeout: bool = True) -> Optional[RoomState]:
         """获取房间信息
         
         Args:
             room_id: 房间ID
             check_timeout: 是否检查阶段超时，默认为True。设置为False可以避免递归调用
         """
-        room_data = await redis_service.get_room_data(room_id)
+        room_data = await game_event_log.load(room_id)
         if room_data:
-            room = GameRoom(**room_data)
+            room = RoomState.from_dict(room_data)
             # 检查阶段是否过期，如果过期则自动进入下一阶段
             if check_timeout:
                 await self._check_phase_timeout(room)
                 # 重新获取房间数据，因为 _check_phase_timeout 可能已经更新了房间状态
-                room_data = await redis_service.get_room_data(room_id)
+                room_data = await game_event_log.load(room_id)
                 if room_data:
-                    return GameRoom(**room_data)
+                    return RoomState.from_dict(room_data)
             return room
         return None
     
-    async def _set_phase_time(self, room: GameRoom):
+    async def _set_phase_time(self, room: RoomState):
         """设置阶段开始时间和持续时间"""
         room.phase_start_time = time.time()
         room.phase_duration = self.PHASE_DURATIONS.get(room.phase)
         room.can_speak = self.PHASE_CAN_SPEAK.get(room.phase, False)
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
     
-    async def _check_phase_timeout(self, room: GameRoom):
-        """检查阶段是否超时，如果超时则自动进入下一阶段"""
-        if room.phase_start_time is None or room.phase_duration is None:
+    def _ai_call_budget(self, room: RoomState) -> float:
+        """当前阶段还能留给一次大模型调用的时间（秒）：在阶段截止前预留 AI_DEADLINE_MARGIN，且不超过 AI_CALL_TIMEOUT"""
+        budget = config.AI_CALL_TIMEOUT
+        if room.phase_start_time is not None and room.phase_duration is not None:
+            remaining = room.phase_start_time + room.phase_duration - time.time() - config.AI_DEADLINE_MARGIN
+            budget = min(budget, remaining)
+        return max(0.0, budget)
+    
+    async def _check_phase_timeout(self, room: RoomState):
+        """阶段超时兜底：阶段已过期但房间没有运行中的状态机驱动时（如驱动异常退出），从对应状态恢复"""
+        if not self._is_phase_expired(room) or not room_router.is_local(room.room_id):
+            return
+        driver = self._drivers.get(room.room_id)
+        if driver and driver.alive():
+            return
+        step = self.PHASE_RESUME_STEPS.get(room.phase)
+        if step is None:
             return
+        resume = self._elimination_resume(room) if room.phase == GamePhase.ELIMINATION else "discussion"
+        logger.warning(f"【状态机】房间 {room.room_id} - 阶段 {room.phase.value} 已超时且没有驱动，从状态 {step} 恢复")
+        self.start_phase_machine(room.room_id, step, {"resume": resume})
+    
+    @staticmethod
+    def _elimination_resume(room: RoomState) -> str:
+        """淘汰阶段（等待猎人开枪）之后去哪里：被投票出局的猎人之后进入夜晚，夜里死亡的猎人之后回到白天讨论"""
+        hunters = [p for p in room.players if p.role == PlayerRole.HUNTER and not p.alive]
+        pending = [p for p in hunters if not p.hunter_shot_used] or hunters
+        return "night" if any(p.died_by == "vote" for p in pending) else "discussion"
+    
+    # ==================== 阶段状态机 ====================
+    
+    def _build_phase_machine(self) -> PhaseMachine:
+        """狼人杀阶段状态表
         
-        elapsed = time.time() - room.phase_start_time
-        if elapsed >= room.phase_duration:
-            # 阶段超时，根据当前阶段进入下一阶段
-            if room.phase == GamePhase.DAY:
-                # 白天阶段超时，进入投票阶段
-                # 重要：在进入投票阶段时，必须确保不会更新任何玩家的死亡状态
-                # 只有投票阶段结束后（通过_process_voting_result）才会更新死亡状态
-                
-                # 重新获取最新的房间数据，确保状态一致性
-                room_data = await redis_service.get_room_data(room.room_id)
-                if room_data:
-                    room = GameRoom(**room_data)
-                
-                # 关键修复：在投票阶段开始时，明确保护所有存活玩家的alive状态
-                # 记录进入投票阶段前的存活状态，确保不会在投票阶段开始时错误地更新死亡状态
-                # 注意：这里不应该修改任何玩家的alive状态，只应该重置投票状态
-                
-                # 设置投票阶段
-                room.phase = GamePhase.VOTING
-                
-                # 重置所有玩家的投票状态（只重置存活玩家的投票状态）
-                # 重要：这里只重置投票状态，不修改alive状态
-                for p in room.players:
-                    if p.alive:
-                        p.voted = False
-                        p.vote_target = None
-                    # 注意：已死亡的玩家不应该有投票状态，但为了安全，也重置
-                    else:
-                        p.voted = False
-                        p.vote_target = None
-                
-                # 安全检查：确保所有存活玩家都可以投票
-                alive_players = [p for p in room.players if p.alive]
-                logger.info(f"【投票阶段开始】房间 {room.room_id} - 存活玩家数: {len(alive_players)}")
-                for p in alive_players:
-                    logger.info(f"  - {p.username} (ID: {p.user_id}, 角色: {self._get_role_name(p.role) if p.role else '未知'}, alive: {p.alive})")
-                
-                # 再次确认：在投票阶段开始时，不应该有任何玩家的alive状态被修改
-                # 如果从Redis获取的数据中包含了错误的死亡状态，我们需要修复它
-                # 但是，我们不应该在投票阶段开始时修改任何玩家的alive状态
-                # 因为只有投票阶段结束后才会更新死亡状态
-                
-                # 保存房间状态（不更新任何死亡状态）
-                await self._set_phase_time(room)
-                
-                # 广播房间状态更新（确保不会更新任何死亡状态）
-                if self.broadcast_callback:
-                    import json
-                    await self.broadcast_callback(json.dumps({
-                        "type": "room_update",
-                        "room": room.model_dump()
-                    }), f"werewolf_{room.room_id}")
-                
-                await self._ai_announce(room.room_id, "讨论时间结束，进入投票阶段。")
-                # 触发AI玩家自动投票
-                await self._trigger_ai_voting(room)
-            elif room.phase == GamePhase.VOTING:
-                # 投票阶段超时，处理投票结果
-                # 重新获取最新的房间数据，确保状态一致性
-                room_data = await redis_service.get_room_data(room.room_id)
-                if room_data:
-                    current_room = GameRoom(**room_data)
-                    # 确保当前仍处于投票阶段
-                    if current_room.phase == GamePhase.VOTING:
-                        await self._process_voting_result(current_room)
-            elif room.phase == GamePhase.NIGHT:
-                # 夜晚阶段超时，结算夜晚结果并进入白天阶段
-                # 重新获取最新的房间状态，确保状态一致性
-                room_data = await redis_service.get_room_data(room.room_id)
-                if room_data:
-                    current_room = GameRoom(**room_data)
-                    await self._process_night_result(current_room)
-            elif room.phase == GamePhase.IDENTITY_ASSIGN:
-                # 身份分配阶段超时，进入夜晚或白天
-                if room.night_count == 0:
-                    room.phase = GamePhase.NIGHT
-                    room.night_count = 1
-                else:
-                    room.phase = GamePhase.DAY
-                    room.day_count = 1
-                await self._set_phase_time(room)
-            # 注意：不需要在这里统一保存，因为每个分支都已经保存了状态
-            # DAY -> VOTING: _set_phase_time 已保存
-            # VOTING: _process_voting_result 已保存
-            # NIGHT: _process_night_result -> _start_day_phase -> _set_phase_time 已保存
-            # IDENTITY_ASSIGN: _set_phase_time 已保存
-    
-    def _is_phase_expired(self, room: GameRoom) -> bool:
+        night -> night_guard -> night_wolf -> night_seer -> night_witch -> night_settle -> night_result
+        -> day -> settle -> (hunter -> settle) -> discussion -> voting -> vote_result -> settle -> night
+        settle 为检查点：待开枪的猎人优先，其次判断游戏结束，最后回到白天讨论或进入夜晚。
+        """
+        night_roles = ("guard", "wolf", "seer", "witch")
+        night_steps = [f"night_{role}" for role in night_roles]
+        
+        states = [
+            PhaseState("night", GamePhase.NIGHT, on_enter=self._enter_night),
+            *[PhaseState(step, GamePhase.NIGHT,
+                         on_enter=self._night_role_entry(role),
+                         on_exit=self._night_role_exit(role),
+                         on_resume=self._night_role_resume(role),
+                         timeout=self.NIGHT_ROLE_TIMEOUT)
+              for role, step in zip(night_roles, night_steps)],
+            PhaseState("night_settle", GamePhase.NIGHT, on_enter=self._enter_night_settle, timeout=self._phase_remaining),
+            PhaseState("night_result", GamePhase.NIGHT, on_enter=self._enter_night_result),
+            PhaseState("day", GamePhase.DAY, on_enter=self._enter_day),
+            PhaseState("settle"),
+            PhaseState("hunter", GamePhase.ELIMINATION, on_enter=self._enter_hunter, on_resume=self._resume_hunter,
+                       timeout=self._phase_remaining),
+            PhaseState("discussion", GamePhase.DAY, on_enter=self._enter_discussion, timeout=self._phase_remaining),
+            PhaseState("voting", GamePhase.VOTING, on_enter=self._enter_voting, on_resume=self._resume_voting,
+                       timeout=self._phase_remaining),
+            PhaseState("vote_result", GamePhase.VOTING, on_enter=self._enter_vote_result),
+            PhaseState("game_over", GamePhase.GAME_OVER, on_enter=self._enter_game_over, terminal=True),
+        ]
+        
+        transitions = [Transition("night", night_steps[0])]
+        for role, step, next_step in zip(night_roles, night_steps, night_steps[1:] + ["night_settle"]):
+            transitions.append(Transition(step, next_step, guard=lambda ctx, role=role: self._night_sub_phase_done(ctx.room, role)))
+            transitions.append(Transition(step, next_step, on_timeout=True))
+        transitions += [
+            Transition("night_settle", "night_result", guard=lambda ctx: self._night_actions_complete(ctx.room)),
+            Transition("night_settle", "night_result", on_timeout=True),
+            Transition("night_result", "day"),
+            Transition("day", "settle"),
+            Transition("vote_result", "settle"),
+            Transition("hunter", "settle", guard=self._hunter_resolved),
+            Transition("hunter", "settle", on_timeout=True),
+            Transition("settle", "hunter", guard=lambda ctx: ctx.data.get("pending_hunter") is not None),
+            Transition("settle", "game_over", guard=lambda ctx: self._game_winner(ctx.room) is not None),
+            Transition("settle", "night", guard=lambda ctx: ctx.data.get("resume") == "night"),
+            Transition("settle", "discussion"),
+            Transition("discussion", "voting", on_timeout=True),
+            Transition("voting", "vote_result", on_timeout=True),
+        ]
+        return PhaseMachine(states, transitions)
+    
+    def start_phase_machine(self, room_id: str, step: str = "night", data: Optional[Dict] = None,
+                            resume_entered: bool = False, deadline: Optional[float] = None) -> RoomDriver:
+        """启动房间的状态机驱动，已有驱动在运行时直接返回
+        
+        Args:
+            resume_entered: 从检查点恢复且该状态的进入动作已完成
+            deadline: 检查点中该状态的超时时间（time.time()）
+        """
+        driver = self._drivers.get(room_id)
+        if driver and driver.alive():
+            return driver
+        driver = RoomDriver(self.phase_machine, room_id, step,
+                            lambda rid: self.get_room(rid, check_timeout=False), data,
+                            checkpoint=self._save_machine_state,
+                            resume_entered=resume_entered, deadline=deadline,
+                            on_step=lambda ctx: task_registry.enter_step(ctx.room_id, ctx.step))
+        self._drivers[room_id] = driver
+        driver.start()
+        
+        def _cleanup(_task):
+            if self._drivers.get(room_id) is driver:
+                del self._drivers[room_id]
+            # 游戏结束、房间迁出或进程关闭：取消该房间仍在运行的后台任务
+            speech_scheduler.cancel(room_id)
+            speculation.discard_room(room_id)
+            ai_contexts.forget(room_id)
+            task_registry.cancel_room(room_id)
+            # 导出本进程记录的时间线
+            tracer.finish(room_id)
+        driver.task.add_done_callback(_cleanup)
+        return driver
+    
+    async def _save_machine_state(self, ctx: MachineContext, entered: bool):
+        """写入状态机检查点，进程重启或房间被其他进程接管后据此恢复"""
+        await redis_service.set_room_machine_state(ctx.room_id, {
+            "step": ctx.step,
+            "entered": entered,
+            "deadline": ctx.deadline if entered else None,
+            "data": ctx.data,
+            "worker": room_router.worker_id,
+            "updated_at": time.time(),
+        })
+    
+    async def resume_room(self, room_id: str):
+        """恢复进行中的房间
+        
+        优先从状态机检查点恢复到中断时的状态（沿用原超时时间）；
+        没有检查点时（旧版本遗留的房间），等当前阶段到期后从对应状态恢复驱动。
+        """
+        import asyncio
+        room = await self.get_room(room_id, check_timeout=False)
+        if not room or room.phase == GamePhase.GAME_OVER:
+            await redis_service.remove_active_room(room_id)
+            await redis_service.delete_room_machine_state(room_id)
+            await room_router.release(room_id)
+            game_event_log.forget(room_id)
+            return
+        driver = self._drivers.get(room_id)
+        if (driver and driver.alive()) or room_id in self._resume_timers:
+            return
+        # 其他进程可能在此期间写过房间，事件日志从完整快照重新开始
+        game_event_log.forget(room_id)
+        ai_contexts.forget(room_id)
+        
+        checkpoint = await redis_service.get_room_machine_state(room_id)
+        if isinstance(checkpoint, dict) and checkpoint.get("step") in self.phase_machine.states:
+            step = checkpoint["step"]
+            entered = bool(checkpoint.get("entered"))
+            deadline = checkpoint.get("deadline")
+            remaining = f"，剩余 {max(0.0, deadline - time.time()):.1f} 秒" if entered and deadline else ""
+            logger.info(f"【状态机】房间 {room_id} - 从检查点恢复：状态 {step}（{'进入动作已完成' if entered else '重新执行进入动作'}{remaining}）")
+            self.start_phase_machine(room_id, step, checkpoint.get("data") or {},
+                                     resume_entered=entered, deadline=deadline)
+            return
+        
+        remaining = 0.0
+        if room.phase_start_time is not None and room.phase_duration is not None:
+            remaining = max(0.0, room.phase_start_time + room.phase_duration - time.time())
+        logger.info(f"【状态机】房间 {room_id} - 接管，阶段 {room.phase.value} 剩余 {remaining:.1f} 秒后恢复驱动")
+        
+        async def _resume_later():
+            try:
+                await asyncio.sleep(remaining)
+                room = await self.get_room(room_id, check_timeout=False)
+                if room:
+                    await self._check_phase_timeout(room)
+            finally:
+                self._resume_timers.pop(room_id, None)
+        self._resume_timers[room_id] = asyncio.create_task(_resume_later())
+    
+    async def resume_active_rooms(self) -> int:
+        """启动时恢复所有由本进程负责的进行中房间，返回恢复的房间数"""
+        resumed = 0
+        for room_id in await redis_service.get_active_rooms():
+            if await room_router.resolve(room_id):
+                continue  # 由其他工作进程负责
+            try:
+                await self.resume_room(room_id)
+                resumed += 1
+            except Exception as e:
+                logger.error(f"【状态机】恢复房间 {room_id} 失败: {e}", exc_info=True)
+        return resumed
+    
+    async def stop_all_rooms(self):
+        """进程关闭：停止所有本地驱动，保留检查点供重启或其他进程恢复"""
+        import asyncio
+        tasks = [d.task for d in self._drivers.values() if d.alive()]
+        tasks += list(self._resume_timers.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await task_registry.cancel_all()
+        self._drivers.clear()
+        self._resume_timers.clear()
+    
+    async def release_room(self, room_id: str):
+        """房间归属转移到其他进程：停止本地驱动"""
+        timer = self._resume_timers.pop(room_id, None)
+        if timer:
+            timer.cancel()
+        game_event_log.forget(room_id)
+        driver = self._drivers.pop(room_id, None)
+        if driver and driver.alive():
+            driver.task.cancel()
+            logger.warning(f"【状态机】房间 {room_id} - 归属已转移，停止本地驱动（状态 {driver.step}）")
+    
+    def rooms_by_phase(self) -> Dict:
+        """本进程驱动中的房间数（按当前阶段），供监控指标采集"""
+        counts: Dict = {}
+        for driver in self._drivers.values():
+            if not driver.alive():
+                continue
+            room = driver.ctx.room
+            phase = (room.phase.value if room else "unknown",)
+            counts[phase] = counts.get(phase, 0) + 1
+        return counts
+    
+    def _wake_driver(self, room_id: str):
+        """玩家行动改变了房间状态，唤醒驱动重新评估转移"""
+        driver = self._drivers.get(room_id)
+        if driver:
+            driver.wake()
+    
+    def _phase_remaining(self, ctx: MachineContext) -> Optional[float]:
+        """当前房间阶段剩余时间（秒）"""
+        room = ctx.room
+        if room.phase_start_time is None or room.phase_duration is None:
+            return None
+        return max(0.0, room.phase_start_time + room.phase_duration - time.time())
+    
+    async def _enter_night(self, ctx: MachineContext):
+        await self._start_night_phase(ctx.room)
+    
+    def _night_role_entry(self, role: str):
+        process = {
+            "guard": self._process_guard_phase,
+            "wolf": self._process_wolf_phase,
+            "seer": self._process_seer_phase,
+            "witch": self._process_witch_phase,
+        }[role]
+        
+        async def enter(ctx: MachineContext):
+            await process(ctx.room)
+            # 等待1秒，让玩家看到该阶段的提示
+            await tracer.sleep(1, "popup", ctx.room_id)
+            # 触发AI玩家自动行动
+            await self._trigger_ai_night_actions(ctx.room, role)
+        return enter
+    
+    def _night_role_resume(self, role: str):
+        async def resume(ctx: MachineContext):
+            # 中断前触发的AI行动随进程一起丢失，未完成时重新触发
+            if not self._night_sub_phase_done(ctx.room, role):
+                await self._trigger_ai_night_actions(ctx.room, role)
+        return resume
+    
+    def _night_role_exit(self, role: str):
+        role_name = {"guard": "守卫", "wolf": "狼人", "seer": "预言家", "witch": "女巫"}[role]
+        
+        async def exit_(ctx: MachineContext):
+            if self._night_sub_phase_done(ctx.room, role):
+                logger.info(f"【{role_name}阶段完成】房间 {ctx.room_id}")
+                await self._ai_announce(ctx.room_id, f"{role_name}已完成操作。")
+                await tracer.sleep(1, "popup", ctx.room_id)  # 等待1秒，让玩家看到提示
+        return exit_
+    
+    async def _enter_night_settle(self, ctx: MachineContext):
+        # 所有夜晚子阶段都处理完了，将current_night_phase设置为None
+        ctx.room.current_night_phase = None
+        await game_event_log.save_room(ctx.room_id, ctx.room.to_dict())
+    
+    async def _enter_night_result(self, ctx: MachineContext):
+        deaths, death_reasons = await self._process_night_result(ctx.room)
+        ctx.data["deaths"] = deaths
+        ctx.data["death_reasons"] = death_reasons
+        # 死亡名单已定：公布死讯期间在后台生成遗言和开场发言
+        ctx.data["opening_speakers"] = await self._speculate_day(ctx.room, deaths, death_reasons)
+    
+    async def _enter_day(self, ctx: MachineContext):
+        deaths = ctx.data.pop("deaths", [])
+        death_reasons = ctx.data.pop("death_reasons", {})
+        ctx.data["pending_hunter"] = await self._start_day_phase(ctx.room, deaths, death_reasons)
+        ctx.data["resume"] = "discussion"
+        ctx.data["discussion_prompt"] = "请开始发言讨论。"
+    
+    async def _enter_hunter(self, ctx: MachineContext):
+        hunter = ctx.room.get_player(ctx.data.pop("pending_hunter", None))
+        ctx.data["hunter"] = hunter.user_id if hunter else None
+        ctx.data["discussion_prompt"] = "请继续发言讨论。"
+        if hunter:
+            await self._trigger_hunter_shot(ctx.room, hunter)
+    
+    async def _resume_hunter(self, ctx: MachineContext):
+        hunter = ctx.room.get_player(ctx.data.get("hunter"))
+        if hunter and not hunter.hunter_shot_used and ctx.room.phase == GamePhase.ELIMINATION:
+            await self._trigger_hunter_shot(ctx.room, hunter)
+    
+    def _hunter_resolved(self, ctx: MachineContext) -> bool:
+        """猎人已开枪，或没有进入等待开枪的淘汰阶段"""
+        hunter = ctx.room.get_player(ctx.data.get("hunter"))
+        return hunter is None or hunter.hunter_shot_used or ctx.room.phase != GamePhase.ELIMINATION
+    
+    async def _enter_discussion(self, ctx: MachineContext):
+        room = ctx.room
+        if room.phase != GamePhase.DAY:
+            # 从淘汰阶段回到白天，重新计时
+            room.phase = GamePhase.DAY
+            await self._set_phase_time(room)
+            if self.broadcast_callback:
+                await self.broadcast_callback(encode_frame({
+                    "type": "room_update",
+                    "room": room.to_dict()
+                }), f"werewolf_{room.room_id}")
+        await self._ai_announce(room.room_id, ctx.data.pop("discussion_prompt", "请开始发言讨论。"))
+        # 每天第一次进入讨论时由部分AI开场发言
+        opening_speakers = ctx.data.pop("opening_speakers", None)
+        if opening_speakers:
+            await speech_scheduler.open_day(room.room_id, opening_speakers)
+    
+    async def _enter_voting(self, ctx: MachineContext):
+        await self._start_voting_phase(ctx.room)
+    
+    async def _resume_voting(self, ctx: MachineContext):
+        # 重新触发尚未投票的AI玩家
+        await self._trigger_ai_voting(ctx.room)
+    
+    async def _enter_vote_result(self, ctx: MachineContext):
+        ctx.data["pending_hunter"] = await self._process_voting_result(ctx.room)
+        ctx.data["resume"] = "night"
+    
+    async def _enter_game_over(self, ctx: MachineContext):
+        await self._finish_game(ctx.room, self._game_winner(ctx.room))
+    
+    async def _start_voting_phase(self, room: RoomState):
+        """白天讨论结束，进入投票阶段"""
+        # 重要：在进入投票阶段时，必须确保不会更新任何玩家的死亡状态
+        # 只有投票阶段结束后（通过_process_voting_result）才会更新死亡状态
+        room.phase = GamePhase.VOTING
+        
+        # 重置所有玩家的投票状态（只重置投票状态，不修改alive状态）
+        for p in room.players:
+            p.voted = False
+            p.vote_target = None
+        
+        alive_players = room.alive
+        logger.info(f"【投票阶段开始】房间 {room.room_id} - 存活玩家数: {len(alive_players)}")
+        for p in alive_players:
+            logger.info(f"  - {p.username} (ID: {p.user_id}, 角色: {self._get_role_name(p.role) if p.role else '未知'}, alive: {p.alive})")
+        
+        # 保存房间状态（不更新任何死亡状态）
+        await self._set_phase_time(room)
+        
+        # 广播房间状态更新
+        if self.broadcast_callback:
+            await self.broadcast_callback(encode_frame({
+                "type": "room_update",
+                "room": room.to_dict()
+            }), f"werewolf_{room.room_id}")
+        
+        await self._ai_announce(room.room_id, "讨论时间结束，进入投票阶段。")
+        # 触发AI玩家自动投票
+        await self._trigger_ai_voting(room)
+    
+    def _is_phase_expired(self, room: RoomState) -> bool:
         """检查当前阶段是否已过期"""
         if room.phase_start_time is None or room.phase_duration is None:
             return False
@@ -527,7 +806,7 @@ class WerewolfService:
             logger.warning(f"【玩家行动】房间 {room_id} 不存在")
             return {"error": "房间不存在"}
         
-        player = next((p for p in room.players if p.user_id == user_id), None)
+        player = room.get_player(user_id)
         if not player:
             logger.warning(f"【玩家行动】房间 {room_id} - 玩家ID {user_id} 不存在")
             return {"error": "玩家不存在"}
@@ -563,7 +842,7 @@ class WerewolfService:
         logger.warning(f"【玩家行动】房间 {room_id} - 当前阶段 {room.phase} 不允许操作 {action_type}")
         return {"error": "当前阶段不允许此操作"}
     
-    async def _handle_night_action(self, room: GameRoom, player: Player, action_type: str, action_data: Dict) -> Dict:
+    async def _handle_night_action(self, room: RoomState, player: PlayerState, action_type: str, action_data: Dict) -> Dict:
         """处理夜晚行动"""
         target = action_data.get("target")
         witch_action = action_data.get("witch_action")
@@ -595,45 +874,39 @@ class WerewolfService:
         elif result.get("error"):
             logger.warning(f"【夜晚行动失败】房间 {room.room_id} - 玩家 {player.username} 行动失败: {result.get('error', '')}")
         
-        # 检查是否所有夜晚行动都完成了
+        # 唤醒状态机检查夜晚行动是否完成
         if result.get("success"):
-            await self._check_night_actions_complete(room)
+            self._wake_driver(room.room_id)
         
         return result
     
-    async def _check_night_actions_complete(self, room: GameRoom):
-        """检查夜晚行动是否全部完成，如果完成则结算"""
-        # 重新获取最新的房间状态，确保状态一致性
-        room_data = await redis_service.get_room_data(room.room_id)
-        if not room_data:
-            return
-        current_room = GameRoom(**room_data)
-        
-        # 确保当前阶段是夜晚，并且已经处理过所有子阶段
+    def _night_actions_complete(self, current_room: RoomState) -> bool:
+        """检查夜晚行动是否全部完成"""
+        # 确保已经处理过所有子阶段
         # 如果current_night_phase不是None，说明还在处理某个子阶段，不应该结算
         if current_room.current_night_phase is not None:
-            return  # 还在处理某个夜晚子阶段，等待完成
+            return False  # 还在处理某个夜晚子阶段，等待完成
         
         # 检查守卫
-        guard = next((p for p in current_room.players if p.role == PlayerRole.GUARD and p.alive), None)
+        guard = current_room.first_alive(PlayerRole.GUARD)
         if guard and "guard" not in current_room.night_actions:
-            return  # 守卫还未行动
+            return False  # 守卫还未行动
         
         # 检查狼人（需要所有狼人都投票）
-        wolves = [p for p in current_room.players if p.role == PlayerRole.WOLF and p.alive]
+        wolves = current_room.wolves
         if wolves:
             if "wolf" not in current_room.night_actions or len(current_room.night_actions["wolf"].get("votes", {})) < len(wolves):
-                return  # 狼人还未全部投票
+                return False  # 狼人还未全部投票
         
         # 检查预言家
-        seer = next((p for p in current_room.players if p.role == PlayerRole.SEER and p.alive), None)
+        seer = current_room.first_alive(PlayerRole.SEER)
         if seer and "seer" not in current_room.night_actions:
-            return  # 预言家还未行动
+            return False  # 预言家还未行动
         
         # 检查女巫（女巫可以选择不使用任何药水，所以只要 witch 在 night_actions 中就算完成）
-        witch = next((p for p in current_room.players if p.role == PlayerRole.WITCH and p.alive), None)
+        witch = current_room.first_alive(PlayerRole.WITCH)
         if witch and "witch" not in current_room.night_actions:
-            return  # 女巫还未行动
+            return False  # 女巫还未行动
         # 如果女巫存在，检查是否有行动记录（包括"none"）
         if witch and "witch" in current_room.night_actions:
             witch_action = current_room.night_actions["witch"]
@@ -641,12 +914,11 @@ class WerewolfService:
             if (not witch_action.get("antidote_used") and 
                 not witch_action.get("poison_used") and 
                 witch_action.get("action") != "none"):
-                return  # 女巫还未行动
+                return False  # 女巫还未行动
         
-        # 所有行动都完成了，结算夜晚结果
-        await self._process_night_result(current_room)
+        return True
     
-    async def _handle_day_action(self, room: GameRoom, player: Player, action_type: str, action_data: Dict):
+    async def _handle_day_action(self, room: RoomState, player: PlayerState, action_type: str, action_data: Dict):
         """处理白天发言"""
         if action_type == "speech" or action_type == "message":
             # 检查玩家是否存活
@@ -670,7 +942,7 @@ class WerewolfService:
                 "content": content,
                 "timestamp": str(uuid.uuid4())
             }
-            await redis_service.add_room_message(room.room_id, message)
+            await game_event_log.add_room_message(room.room_id, message)
             
             # 触发AI玩家自动回复（不在这里等待，让它在后台运行）
             if room.phase == GamePhase.DAY:
@@ -681,7 +953,7 @@ class WerewolfService:
             return {"success": True}
         return {"error": "无效的白天行动类型"}
     
-    async def _handle_voting(self, room: GameRoom, player: Player, target: Optional[str]):
+    async def _handle_voting(self, room: RoomState, player: PlayerState, target: Optional[str]):
         """处理投票"""
         # 检查玩家是否存活
         if not player.alive:
@@ -693,7 +965,7 @@ class WerewolfService:
             return {"error": "请选择投票目标"}
         
         # 检查目标玩家是否存在且存活
-        target_player = next((p for p in room.players if p.user_id == target), None)
+        target_player = room.get_player(target)
         if not target_player:
             logger.warning(f"【投票】房间 {room.room_id} - 目标玩家不存在: {target}")
             return {"error": "目标玩家不存在"}
@@ -706,7 +978,7 @@ class WerewolfService:
         
         logger.info(f"【投票】房间 {room.room_id} - 玩家 {player.username} (ID: {player.user_id}, 角色: {self._get_role_name(player.role) if player.role else '未知'}) 投票给: {target_player.username} (ID: {target})")
         
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 注意：不在所有人投票后立即处理投票结果
         # 投票结果只应该在投票阶段结束时处理（通过超时机制）
@@ -715,25 +987,6 @@ class WerewolfService:
         
         return {"success": True}
     
-    async def _check_game_over(self, room: GameRoom):
-        """检查游戏是否结束"""
-        alive_players = [p for p in room.players if p.alive]
-        wolves = [p for p in alive_players if p.role == PlayerRole.WOLF]
-        villagers = [p for p in alive_players if p.role != PlayerRole.WOLF]
-        
-        if len(wolves) == 0:
-            room.winner = "villagers"
-            room.phase = GamePhase.GAME_OVER
-            await self._set_phase_time(room)
-            await self._ai_announce(room.room_id, "游戏结束！好人阵营获胜！")
-        elif len(wolves) >= len(villagers):
-            room.winner = "wolves"
-            room.phase = GamePhase.GAME_OVER
-            await self._set_phase_time(room)
-            await self._ai_announce(room.room_id, "游戏结束！狼人阵营获胜！")
-        
-        await redis_service.set_room_data(room.room_id, room.model_dump())
-    
     async def _ai_announce(self, room_id: str, message: str, phase_popup: Optional[str] = None, broadcast_callback=None):
         """AI主持人宣布
         
@@ -744,7 +997,7 @@ class WerewolfService:
             broadcast_callback: 可选的广播回调函数，用于通过WebSocket广播消息
         """
         # 检查是否最近发送过相同的消息（防止重复发送）
-        recent_messages = await redis_service.get_room_messages(room_id)
+        recent_messages = await redis_service.get_room_messages(room_id, offset=-3)
         if recent_messages:
             # 检查最近3条消息中是否有相同的内容
             for recent_msg in recent_messages[-3:]:
@@ -764,92 +1017,74 @@ class WerewolfService:
         if phase_popup:
             msg["phase_popup"] = phase_popup
         
-        await redis_service.add_room_message(room_id, msg)
+        await game_event_log.add_room_message(room_id, msg)
         
         # 如果有广播回调（优先使用传入的，否则使用类级别的）
         callback = broadcast_callback or self.broadcast_callback
         if callback:
-            import json
-            await callback(json.dumps({
+            await callback(encode_frame({
                 "type": "public_message",
                 "content": msg
             }), f"werewolf_{room_id}")
     
-    async def _wait_for_phase_completion(self, room: GameRoom, phase: str, timeout: int = 30):
-        """等待阶段完成
+    def _night_sub_phase_done(self, current_room: RoomState, phase: str) -> bool:
+        """检查夜晚子阶段是否完成
         
         Args:
-            room: 游戏房间
+            current_room: 游戏房间
             phase: 阶段名称 ("guard", "wolf", "seer", "witch")
-            timeout: 超时时间（秒）
         """
-        import asyncio
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            # 重新获取房间状态
-            room_data = await redis_service.get_room_data(room.room_id)
-            if not room_data:
-                break
-            current_room = GameRoom(**room_data)
-            
-            # 检查阶段是否完成
-            if phase == "guard":
-                guard = next((p for p in current_room.players if p.role == PlayerRole.GUARD and p.alive), None)
-                if not guard or "guard" in current_room.night_actions:
-                    return
-            elif phase == "wolf":
-                wolves = [p for p in current_room.players if p.role == PlayerRole.WOLF and p.alive]
-                if not wolves or ("wolf" in current_room.night_actions and 
-                                 len(current_room.night_actions["wolf"].get("votes", {})) >= len(wolves)):
-                    return
-            elif phase == "seer":
-                seer = next((p for p in current_room.players if p.role == PlayerRole.SEER and p.alive), None)
-                if not seer or "seer" in current_room.night_actions:
-                    return
-            elif phase == "witch":
-                witch = next((p for p in current_room.players if p.role == PlayerRole.WITCH and p.alive), None)
-                if not witch:
-                    return
-                if "witch" in current_room.night_actions:
-                    witch_action = current_room.night_actions["witch"]
-                    if (witch_action.get("antidote_used") or 
-                        witch_action.get("poison_used") or 
-                        witch_action.get("action") == "none"):
-                        return
-            
-            await asyncio.sleep(0.5)  # 每0.5秒检查一次
+        if phase == "guard":
+            guard = current_room.first_alive(PlayerRole.GUARD)
+            return not guard or "guard" in current_room.night_actions
+        elif phase == "wolf":
+            wolves = current_room.wolves
+            return not wolves or ("wolf" in current_room.night_actions and
+                                  len(current_room.night_actions["wolf"].get("votes", {})) >= len(wolves))
+        elif phase == "seer":
+            seer = current_room.first_alive(PlayerRole.SEER)
+            return not seer or "seer" in current_room.night_actions
+        elif phase == "witch":
+            witch = current_room.first_alive(PlayerRole.WITCH)
+            if not witch:
+                return True
+            if "witch" in current_room.night_actions:
+                witch_action = current_room.night_actions["witch"]
+                return bool(witch_action.get("antidote_used") or
+                            witch_action.get("poison_used") or
+                            witch_action.get("action") == "none")
+        return False
     
-    async def _trigger_ai_night_actions(self, room: GameRoom, phase: str):
+    async def _trigger_ai_night_actions(self, room: RoomState, phase: str):
         """触发AI玩家自动行动
         
         Args:
             room: 游戏房间
             phase: 阶段名称 ("guard", "wolf", "seer", "witch")
         """
-        import asyncio
         
         if phase == "guard":
-            guard = next((p for p in room.players if p.role == PlayerRole.GUARD and p.alive), None)
+            guard = room.first_alive(PlayerRole.GUARD)
             if guard and guard.is_ai:
                 # AI守卫自动选择守护目标
-                await asyncio.sleep(1)  # 延迟1秒，模拟思考
-                alive_players = [p for p in room.players if p.alive]
+                await tracer.sleep(1, "ai_think", room.room_id)  # 延迟1秒，模拟思考
                 # 排除上一晚守护的目标
                 cannot_guard = guard.last_guard_target
-                available_targets = [p for p in alive_players if p.user_id != cannot_guard]
-                if available_targets:
-                    target = random.choice(available_targets)
-                    await self._handle_guard_action(room, guard, target.user_id)
+                available_targets = [p.user_id for p in room.alive if p.user_id != cannot_guard]
+                bot = (await ai_contexts.get(room)).bot
+                target = bot.choose_guard(guard.user_id, available_targets, room.night_count)
+                if target:
+                    AI_DECISIONS.inc(action="guard", source="bot")
+                    await self._handle_guard_action(room, guard, target)
         
         elif phase == "wolf":
             # 获取所有狼人（包括AI和人类）
-            all_wolves = [p for p in room.players if p.role == PlayerRole.WOLF and p.alive]
+            all_wolves = room.wolves
             ai_wolves = [p for p in all_wolves if p.is_ai]
             human_wolves = [p for p in all_wolves if not p.is_ai]
             
             if ai_wolves:
-                await asyncio.sleep(2)  # 延迟2秒，等待人类狼人投票
+                await tracer.sleep(2, "wait_human", room.room_id)  # 延迟2秒，等待人类狼人投票
                 
                 # 检查是否有其他狼人已经投票
                 if "wolf" in room.night_actions and room.night_actions["wolf"].get("votes"):
@@ -868,58 +1103,77 @@ class WerewolfService:
                             if wolf.user_id not in votes:  # 只处理未投票的AI狼人
                                 await self._handle_wolf_action(room, wolf, most_voted_target)
                     else:
-                        # 如果还没有投票，AI狼人随机选择
-                        alive_players = [p for p in room.players if p.alive and p.role != PlayerRole.WOLF]
-                        if alive_players:
-                            target = random.choice(alive_players)
+                        # 如果还没有投票，由怀疑度矩阵选择目标
+                        target = await self._ai_wolf_kill_target(room)
+                        if target:
                             for wolf in ai_wolves:
-                                await self._handle_wolf_action(room, wolf, target.user_id)
+                                await self._handle_wolf_action(room, wolf, target)
                 else:
-                    # 如果还没有任何投票记录，AI狼人随机选择
-                    alive_players = [p for p in room.players if p.alive and p.role != PlayerRole.WOLF]
-                    if alive_players:
-                        target = random.choice(alive_players)
+                    # 如果还没有任何投票记录，由怀疑度矩阵选择目标
+                    target = await self._ai_wolf_kill_target(room)
+                    if target:
                         for wolf in ai_wolves:
-                            await self._handle_wolf_action(room, wolf, target.user_id)
+                            await self._handle_wolf_action(room, wolf, target)
         
         elif phase == "seer":
-            seer = next((p for p in room.players if p.role == PlayerRole.SEER and p.alive), None)
+            seer = room.first_alive(PlayerRole.SEER)
             if seer and seer.is_ai:
-                await asyncio.sleep(1)  # 延迟1秒，模拟思考
-                alive_players = [p for p in room.players if p.alive and p.user_id != seer.user_id]
-                if alive_players:
-                    target = random.choice(alive_players)
-                    await self._handle_seer_action(room, seer, target.user_id)
+                await tracer.sleep(1, "ai_think", room.room_id)  # 延迟1秒，模拟思考
+                candidates = [p.user_id for p in room.alive if p.user_id != seer.user_id]
+                bot = (await ai_contexts.get(room)).bot
+                target = bot.choose_seer_check(seer.user_id, candidates, room.night_count)
+                if target:
+                    AI_DECISIONS.inc(action="seer", source="bot")
+                    await self._handle_seer_action(room, seer, target)
         
         elif phase == "witch":
-            witch = next((p for p in room.players if p.role == PlayerRole.WITCH and p.alive), None)
+            witch = room.first_alive(PlayerRole.WITCH)
             if witch and witch.is_ai:
-                await asyncio.sleep(1)  # 延迟1秒，模拟思考
+                await tracer.sleep(1, "ai_think", room.room_id)  # 延迟1秒，模拟思考
                 # 获取狼人击杀目标
                 wolf_target = None
                 if "wolf" in room.night_actions and room.night_actions["wolf"].get("target"):
                     wolf_target = room.night_actions["wolf"]["target"]
                 
                 # 重新获取房间状态（可能已更新）
-                room_data = await redis_service.get_room_data(room.room_id)
+                room_data = await game_event_log.load(room.room_id)
                 if room_data:
-                    current_room = GameRoom(**room_data)
-                    current_witch = next((p for p in current_room.players if p.user_id == witch.user_id), None)
+                    current_room = RoomState.from_dict(room_data)
+                    current_witch = current_room.get_player(witch.user_id)
                     if current_witch:
                         # 获取狼人击杀目标
                         wolf_target = None
                         if "wolf" in current_room.night_actions and current_room.night_actions["wolf"].get("target"):
                             wolf_target = current_room.night_actions["wolf"]["target"]
                         
-                        # AI女巫策略：如果有解药且有人被刀，使用解药；否则不使用
+                        # AI女巫策略：如果有解药且有人被刀，使用解药；否则对足够可疑的人用毒药；都不满足时不使用
+                        poison_target = None
+                        if not current_witch.witch_poison_used:
+                            bot = (await ai_contexts.get(current_room)).bot
+                            poison_target = bot.choose_poison(
+                                current_witch.user_id,
+                                [p.user_id for p in current_room.alive if p.user_id != current_witch.user_id],
+                                current_room.night_count)
                         if wolf_target and not current_witch.witch_antidote_used:
                             # 检查首夜不能自救
                             if not (current_room.night_count == 1 and wolf_target == current_witch.user_id):
                                 await self._handle_witch_action(current_room, current_witch, {"action_type": "antidote"})
+                        elif poison_target:
+                            AI_DECISIONS.inc(action="witch_poison", source="bot")
+                            await self._handle_witch_action(current_room, current_witch,
+                                                            {"action_type": "poison", "target": poison_target})
                         else:
                             # 不使用任何药水
                             await self._handle_witch_action(current_room, current_witch, {"action_type": "none"})
     
+    async def _ai_wolf_kill_target(self, room: RoomState) -> Optional[str]:
+        """AI狼人的击杀目标（由怀疑度矩阵决定）"""
+        bot = (await ai_contexts.get(room)).bot
+        target = bot.choose_wolf_kill([p.user_id for p in room.alive], room.night_count)
+        if target:
+            AI_DECISIONS.inc(action="wolf", source="bot")
+        return target
+    
     def _get_role_name(self, role: PlayerRole) -> str:
         """获取角色名称"""
         names = {
@@ -944,136 +1198,115 @@ class WerewolfService:
         }
         return descriptions.get(role, "未知角色")
     
-    async def _trigger_ai_responses(self, room: GameRoom, broadcast_callback=None):
-        """触发AI玩家自动回复
-        
-        Args:
-            room: 游戏房间
-            broadcast_callback: 可选的回调函数，用于广播消息 (room_id, message) -> None
-        """
-        import asyncio
-        
-        # 获取存活的AI玩家
-        alive_ai_players = [p for p in room.players if p.is_ai and p.alive]
-        
-        if not alive_ai_players:
-            return
+    def schedule_ai_speech(self, room_id: str):
+        """白天有玩家发言：交给发言调度器（防抖、轮流发言、每日上限），而不是让所有AI同时回复"""
+        speech_scheduler.trigger(room_id)
+    
+    async def _ai_speak(self, room_id: str, user_id: str) -> bool:
+        """让一名AI玩家在白天讨论中发言一次（由发言调度器调用），返回是否已发言"""
+        # 重新获取房间数据（可能已更新）
+        current_room = await self.get_room(room_id, check_timeout=False)
+        if not current_room:
+            return False
+        current_ai_player = current_room.get_player(user_id)
+        if not current_ai_player or not current_ai_player.alive:
+            return False
         
-        # 为每个AI玩家创建异步任务（并行处理，但每个有随机延迟）
-        async def generate_ai_response(ai_player: Player, delay: float):
-            """为单个AI玩家生成回复"""
-            await asyncio.sleep(delay)
-            
-            # 重新获取房间数据（可能已更新）
-            room_data = await redis_service.get_room_data(room.room_id)
-            if not room_data:
-                return
-            current_room = GameRoom(**room_data)
-            current_ai_player = next((p for p in current_room.players if p.user_id == ai_player.user_id), None)
-            if not current_ai_player or not current_ai_player.alive:
-                return
-            
-            # 构建AI玩家的prompt
-            role_name = self._get_role_name(current_ai_player.role)
-            role_desc = self._get_role_description(current_ai_player.role)
-            
-            # 获取狼人队友（如果是狼人）
-            teammates = None
-            if current_ai_player.role == PlayerRole.WOLF:
-                teammates = [p.username for p in current_room.players 
-                           if p.role == PlayerRole.WOLF and p.user_id != current_ai_player.user_id and p.alive]
-            
-            # 构建存活玩家列表
-            alive_players_info = [{"username": p.username, "user_id": p.user_id} 
-                                for p in current_room.players if p.alive]
-            
-            # 获取最新的消息
-            latest_messages = await redis_service.get_room_messages(room.room_id)
-            
-            # 构建消息历史（只包含最近的消息）
-            messages_for_ai = []
-            for msg in latest_messages[-10:]:
-                if isinstance(msg, dict):
-                    messages_for_ai.append({
-                        "username": msg.get("username", "未知"),
-                        "content": msg.get("content", "")
-                    })
-            
-            # 构建prompt
-            system_prompt = AIService.build_werewolf_ai_prompt(
-                player_role=current_ai_player.role.value,
-                role_name=role_name,
-                role_desc=role_desc,
-                game_phase=current_room.phase.value,
-                day_count=current_room.day_count,
-                recent_messages=messages_for_ai,
-                alive_players=alive_players_info,
-                teammates=teammates
+        ctx = await ai_contexts.get(current_room)
+        
+        # 优先使用夜晚结算时预生成的开场发言
+        ai_response = await speculation.take(room_id, "speech", user_id, current_room.day_count, ctx.fingerprint(),
+                                             wait=self._ai_call_budget(current_room))
+        if ai_response is None:
+            ai_response = await self._generate_ai_speech(current_room, current_ai_player, ctx,
+                                                         self._ai_call_budget(current_room))
+        
+        # 添加AI玩家的发言
+        ai_message = {
+            "type": "speech",
+            "user_id": current_ai_player.user_id,
+            "username": current_ai_player.username,
+            "content": ai_response.strip(),
+            "timestamp": str(uuid.uuid4())
+        }
+        await game_event_log.add_room_message(room_id, ai_message)
+        if self.broadcast_callback:
+            await self.broadcast_callback(encode_frame({
+                "type": "public_message",
+                "content": ai_message
+            }), f"werewolf_{room_id}")
+        return True
+    
+    async def _generate_ai_speech(self, room: RoomState, ai_player: PlayerState, ctx: RoomAIContext,
+                                  timeout: float) -> str:
+        """生成AI玩家的白天发言（失败或来不及时返回默认回复）"""
+        # 公共部分和对话历史由房间上下文缓存，这里只拼接身份部分
+        teammates = ctx.teammates(ai_player.user_id) if ai_player.role == PlayerRole.WOLF else None
+        role_info = AIService.build_werewolf_role_info(
+            ai_player.role.value, self._get_role_name(ai_player.role), self._get_role_description(ai_player.role),
+            teammates, ctx.seer_results(ai_player.user_id))
+        system_prompt = ctx.prefix + AIService.build_werewolf_speech_suffix(role_info)
+        
+        # 调用AI生成回复
+        try:
+            ai_response = await AIService.generate_response(
+                messages=ctx.history,
+                system_prompt=system_prompt,
+                call_site="speech",
+                timeout=timeout
             )
-            
-            # 构建对话历史
-            conversation_history = []
-            for msg in messages_for_ai[-5:]:  # 最近5条消息作为上下文
-                conversation_history.append({
-                    "role": "user",
-                    "content": f"{msg['username']}说：{msg['content']}"
-                })
-            
-            # 调用AI生成回复
-            try:
-                ai_response = await AIService.generate_response(
-                    messages=conversation_history,
-                    system_prompt=system_prompt,
-                    temperature=0.8
-                )
-                
-                # 如果AI回复为空或太短，使用默认回复
-                if not ai_response or len(ai_response.strip()) < 2:
-                    ai_response = self._generate_default_ai_response(current_ai_player, current_room)
-                
-                # 添加AI玩家的发言
-                ai_message = {
-                    "type": "speech",
-                    "user_id": current_ai_player.user_id,
-                    "username": current_ai_player.username,
-                    "content": ai_response.strip(),
-                    "timestamp": str(uuid.uuid4())
-                }
-                await redis_service.add_room_message(room.room_id, ai_message)
-                
-                # 如果有广播回调，调用它
-                if broadcast_callback:
-                    await broadcast_callback(room.room_id, ai_message)
-                
-            except Exception as e:
-                logger.warning(f"AI玩家 {current_ai_player.username} 生成回复失败: {e}")
-                # 使用默认回复
-                default_response = self._generate_default_ai_response(current_ai_player, current_room)
-                ai_message = {
-                    "type": "speech",
-                    "user_id": current_ai_player.user_id,
-                    "username": current_ai_player.username,
-                    "content": default_response,
-                    "timestamp": str(uuid.uuid4())
-                }
-                await redis_service.add_room_message(room.room_id, ai_message)
-                
-                # 如果有广播回调，调用它
-                if broadcast_callback:
-                    await broadcast_callback(room.room_id, ai_message)
-        
-        # 创建所有AI玩家的任务
-        tasks = []
-        for ai_player in alive_ai_players:
-            delay = random.uniform(1.0, 3.0)  # 随机延迟1-3秒
-            tasks.append(generate_ai_response(ai_player, delay))
-        
-        # 并行执行所有任务（不等待完成，让它们在后台运行）
-        if tasks:
-            # 直接使用 gather，不等待完成，让它在后台运行
-            asyncio.gather(*tasks)
+            # 如果AI回复为空或太短，使用默认回复
+            if not ai_response or len(ai_response.strip()) < 2:
+                ai_response = self._generate_default_ai_response(ai_player, room)
+        except AIDeadlineExceeded as e:
+            logger.info(f"AI玩家 {ai_player.username} 发言来不及生成（{e}），使用默认回复")
+            ai_response = self._generate_default_ai_response(ai_player, room)
+        except Exception as e:
+            logger.warning(f"AI玩家 {ai_player.username} 生成回复失败: {e}")
+            # 使用默认回复
+            ai_response = self._generate_default_ai_response(ai_player, room)
+        return ai_response
     
-    def _generate_default_ai_response(self, ai_player: Player, room: GameRoom) -> str:
+    def _opening_speakers(self, room: RoomState, day: int) -> List[str]:
+        """当天开场发言的AI：按座位顺序，每天从不同的AI开始"""
+        ai_ids = [p.user_id for p in room.alive if p.is_ai]
+        if not ai_ids or config.AI_OPENING_SPEECHES <= 0:
+            return []
+        start = day % len(ai_ids)
+        return (ai_ids[start:] + ai_ids[:start])[:config.AI_OPENING_SPEECHES]
+    
+    async def _speculate_day(self, room: RoomState, deaths: List[str], death_reasons: Dict[str, str]) -> List[str]:
+        """夜晚死亡名单已定：提前生成死亡AI的遗言和白天开场发言，返回开场发言的AI"""
+        day = room.day_count + 1
+        speakers = self._opening_speakers(room, day)
+        if not config.AI_PREGENERATE:
+            return speakers
+        # 按白天开始后的样子构造输入（天数、阶段、主持人公布的死讯）
+        day_room = RoomState.from_dict(room.to_dict())
+        day_room.phase = GamePhase.DAY
+        day_room.day_count = day
+        day_ctx = (await ai_contexts.get(room)).fork()
+        day_ctx.sync_room(day_room)
+        fingerprint = day_ctx.fingerprint()
+        death_text = ", ".join(f"{p.username} {death_reasons.get(p.user_id, '未知原因')}"
+                               for p in (day_room.get_player(uid) for uid in deaths) if p)
+        day_ctx.add_message({
+            "type": "system",
+            "username": "AI主持人",
+            "content": f"第{day}天开始。\n" + (f"昨晚死亡：{death_text}" if death_text else "昨晚是平安夜，无人死亡。"),
+        })
+        for death_id in deaths:
+            dead_player = day_room.get_player(death_id)
+            if dead_player and dead_player.is_ai:
+                speculation.start(room.room_id, "last_words", death_id, day, fingerprint,
+                                  self._generate_ai_last_words(day_room, dead_player))
+        for user_id in speakers:
+            speculation.start(room.room_id, "speech", user_id, day, fingerprint,
+                              self._generate_ai_speech(day_room, day_room.get_player(user_id), day_ctx,
+                                                       config.AI_CALL_TIMEOUT))
+        return speakers
+    
+    def _generate_default_ai_response(self, ai_player: PlayerState, room: RoomState) -> str:
         """生成默认的AI回复（当AI服务失败时使用）"""
         responses = [
             "我在观察大家的发言...",
@@ -1097,32 +1330,30 @@ class WerewolfService:
         
         return random.choice(responses)
     
-    async def _trigger_ai_voting(self, room: GameRoom):
+    async def _trigger_ai_voting(self, room: RoomState):
         """触发AI玩家自动投票"""
-        import asyncio
-        
         # 获取存活的AI玩家
-        alive_ai_players = [p for p in room.players if p.is_ai and p.alive and not p.voted]
+        alive_ai_players = [p for p in room.alive if p.is_ai and not p.voted]
         
         if not alive_ai_players:
             return
         
         # 为每个AI玩家创建异步任务
-        async def ai_vote(ai_player: Player, delay: float):
+        async def ai_vote(ai_player: PlayerState, delay: float):
             """AI玩家投票"""
-            await asyncio.sleep(delay)
+            await tracer.sleep(delay, "ai_stagger", room.room_id)
             
             # 重新获取房间数据
-            room_data = await redis_service.get_room_data(room.room_id)
+            room_data = await game_event_log.load(room.room_id)
             if not room_data:
                 return
-            current_room = GameRoom(**room_data)
-            current_ai_player = next((p for p in current_room.players if p.user_id == ai_player.user_id), None)
+            current_room = RoomState.from_dict(room_data)
+            current_ai_player = current_room.get_player(ai_player.user_id)
             if not current_ai_player or not current_ai_player.alive or current_ai_player.voted:
                 return
             
             # 获取存活玩家（排除自己）
-            alive_players = [p for p in current_room.players if p.alive and p.user_id != current_ai_player.user_id]
+            alive_players = [p for p in current_room.alive if p.user_id != current_ai_player.user_id]
             if not alive_players:
                 return
             
@@ -1131,117 +1362,86 @@ class WerewolfService:
             if target:
                 await self._handle_voting(current_room, current_ai_player, target)
         
-        # 创建所有AI玩家的任务
-        tasks = []
+        # 每个AI玩家一个后台任务（投票阶段结束时未完成的会被取消）
         for ai_player in alive_ai_players:
             delay = random.uniform(1.0, 3.0)  # 随机延迟1-3秒
-            tasks.append(ai_vote(ai_player, delay))
-        
-        # 并行执行所有任务
-        if tasks:
-            asyncio.gather(*tasks)
+            task_registry.spawn(room.room_id, ai_vote(ai_player, delay), "ai_vote")
     
-    async def _ai_choose_vote_target(self, room: GameRoom, ai_player: Player, alive_players: List[Player]) -> Optional[str]:
-        """AI玩家选择投票目标"""
+    async def _ai_choose_vote_target(self, room: RoomState, ai_player: PlayerState, alive_players: List[PlayerState]) -> Optional[str]:
+        """AI玩家选择投票目标（AI_DECISION_MODE=bot 时由怀疑度矩阵决定，不调用大模型）"""
         try:
-            # 获取最近的发言
-            latest_messages = await redis_service.get_room_messages(room.room_id)
-            messages_for_ai = []
-            for msg in latest_messages[-10:]:
-                if isinstance(msg, dict):
-                    messages_for_ai.append({
-                        "username": msg.get("username", "未知"),
-                        "content": msg.get("content", "")
-                    })
+            ctx = await ai_contexts.get(room)
+            if config.AI_DECISION_MODE == "bot":
+                target = ctx.bot.choose_vote(ai_player.user_id, [p.user_id for p in alive_players], room.day_count)
+                if target:
+                    AI_DECISIONS.inc(action="vote", source="bot")
+                    logger.info(f"【AI投票】{ai_player.username} 按怀疑度投票，最怀疑：{', '.join(ctx.bot.suspects(ai_player.user_id))}")
+                    return target
             
             role_name = self._get_role_name(ai_player.role) if ai_player.role else "玩家"
             role_desc = self._get_role_description(ai_player.role) if ai_player.role else ""
-            
-            # 获取狼人队友（如果是狼人）
-            teammates = None
-            if ai_player.role == PlayerRole.WOLF:
-                teammates = [p.username for p in room.players 
-                           if p.role == PlayerRole.WOLF and p.user_id != ai_player.user_id and p.alive]
-            
-            # 构建存活玩家列表（如果是狼人，排除队友）
-            if ai_player.role == PlayerRole.WOLF:
-                # 排除狼人队友，只显示好人
-                non_teammate_players = [p for p in alive_players if p.role != PlayerRole.WOLF]
-                alive_players_info = [{"username": p.username, "user_id": p.user_id} 
-                                    for p in non_teammate_players]
-                # 如果只有队友可选（理论上不应该发生），使用策略投票
-                if not alive_players_info:
-                    return self._ai_strategic_vote(room, ai_player, alive_players)
-            else:
-                alive_players_info = [{"username": p.username, "user_id": p.user_id} 
-                                    for p in alive_players]
-            
-            # 构建投票prompt
-            if ai_player.role == PlayerRole.WOLF and teammates:
-                teammates_text = f"\n你的狼人队友：{', '.join(teammates)}\n重要：你绝对不能投票给队友，只能投票给好人。"
-            else:
-                teammates_text = ""
-            
-            prompt = f"""你正在参与一场狼人杀游戏的投票阶段。
-
-【你的身份】
-{role_name}
-{role_desc}{teammates_text}
-
-【游戏状态】
-当前是第{room.day_count}天投票阶段
-存活玩家：{', '.join([p['username'] for p in alive_players_info])}
-
-【最近发言】
-{chr(10).join([f"{msg['username']}：{msg['content']}" for msg in messages_for_ai[-5:]]) if messages_for_ai else "暂无发言"}
-
-【你的任务】
-你需要投票出局一名玩家。根据你的身份：
-1. 如果是狼人，必须投票给好人，绝对不能投票给队友
-2. 如果是好人，应该投票给可疑的狼人
-3. 根据发言和逻辑推理选择目标
-4. 只返回你要投票的玩家用户名，不要其他说明
-
-请选择你要投票的玩家用户名："""
-            
-            # 调用AI生成投票目标
+            is_wolf = ai_player.role == PlayerRole.WOLF
+            
+            # 可投票玩家（如果是狼人，排除队友），按座位号编号
+            seats = {p.user_id: str(i + 1) for i, p in enumerate(room.players)}
+            candidates = [p for p in alive_players if not (is_wolf and p.role == PlayerRole.WOLF)]
+            # 如果只有队友可选（理论上不应该发生），使用策略投票
+            if not candidates:
+                return self._ai_strategic_vote(room, ai_player, alive_players)
+            
+            # 公共部分（房间内所有AI相同）+ 身份和候选人
+            role_info = AIService.build_werewolf_role_info(
+                ai_player.role.value if ai_player.role else "", role_name, role_desc,
+                ctx.teammates(ai_player.user_id) if is_wolf else None, ctx.seer_results(ai_player.user_id))
+            prompt = ctx.prefix + AIService.build_werewolf_vote_suffix(
+                role_info, [(seats[p.user_id], p.username) for p in candidates], is_wolf)
+            
+            # 调用AI生成投票目标（只返回JSON编号）
             conversation_history = [{
                 "role": "user",
-                "content": "请选择你要投票的玩家。"
+                "content": "请选择你要投票的玩家，只输出JSON。"
             }]
             
             ai_response = await AIService.generate_response(
                 messages=conversation_history,
                 system_prompt=prompt,
-                temperature=0.7
+                call_site="vote",
+                timeout=self._ai_call_budget(room),
+                json_mode=True
             )
             
-            # 从AI回复中提取玩家名称
-            if ai_response:
-                ai_response = ai_response.strip()
-                # 尝试匹配玩家名称
-                for player in alive_players:
-                    if player.username in ai_response:
-                        # 如果是狼人，检查是否是队友，如果是队友则重新选择
-                        if ai_player.role == PlayerRole.WOLF and player.role == PlayerRole.WOLF:
-                            # AI狼人投票给队友，使用策略投票重新选择
-                            logger.info(f"【AI投票】{ai_player.username} (狼人) 尝试投票给队友 {player.username}，重新选择目标")
-                            return self._ai_strategic_vote(room, ai_player, alive_players)
-                        return player.user_id
+            # 只接受候选人的座位号（队友不在候选人中，不会被选中）
+            target = AIService.parse_werewolf_target(
+                ai_response, {int(seats[p.user_id]): p.user_id for p in candidates})
+            if target:
+                AI_DECISIONS.inc(action="vote", source="llm")
+                return target
             
             # 如果AI没有返回有效目标，使用策略投票
+            logger.info(f"AI玩家 {ai_player.username} 的投票回复无法解析（{(ai_response or '')[:50]}），使用策略投票")
             return self._ai_strategic_vote(room, ai_player, alive_players)
             
+        except AIDeadlineExceeded as e:
+            logger.info(f"AI玩家 {ai_player.username} 投票来不及生成（{e}），使用策略投票")
+            return self._ai_strategic_vote(room, ai_player, alive_players)
         except Exception as e:
             logger.warning(f"AI玩家 {ai_player.username} 选择投票目标失败: {e}")
             # 使用策略投票
             return self._ai_strategic_vote(room, ai_player, alive_players)
     
-    def _ai_strategic_vote(self, room: GameRoom, ai_player: Player, alive_players: List[Player]) -> Optional[str]:
+    def _ai_strategic_vote(self, room: RoomState, ai_player: PlayerState, alive_players: List[PlayerState]) -> Optional[str]:
         """AI玩家策略投票（当AI服务失败时使用）"""
         if not alive_players:
             return None
         
+        # 有房间上下文时按怀疑度矩阵投票
+        ctx = ai_contexts.peek(room.room_id)
+        if ctx and ctx.bot:
+            target = ctx.bot.choose_vote(ai_player.user_id, [p.user_id for p in alive_players], room.day_count)
+            if target:
+                AI_DECISIONS.inc(action="vote", source="fallback")
+                return target
+        
         # 狼人策略：优先投票给好人（非狼人），绝不投票给队友
         if ai_player.role == PlayerRole.WOLF:
             # 排除所有狼人队友
@@ -1255,19 +1455,14 @@ class WerewolfService:
         # 好人策略：随机投票（因为不知道谁是狼人）
         return random.choice(alive_players).user_id
     
-    async def _start_night_phase(self, room_id: str):
-        """开始夜晚阶段"""
-        import asyncio
+    async def _start_night_phase(self, room: RoomState):
+        """开始夜晚阶段（状态机 night 状态的进入动作）"""
         
-        # 强制刷新输出
+        room_id = room.room_id
         logger.info(f"\n{'='*60}")
         logger.info(f"【夜晚阶段开始】房间 {room_id}")
         logger.info(f"{'='*60}")
         
-        room = await self.get_room(room_id, check_timeout=False)
-        if not room:
-            logger.error(f"房间 {room_id} 不存在，无法开始夜晚阶段")
-            return
         logger.info(f"房间 {room_id} - 第 {room.night_count + 1} 夜开始")
         room.phase = GamePhase.NIGHT
         room.night_count += 1
@@ -1282,139 +1477,39 @@ class WerewolfService:
                 player.guarded = False
                 player.guard_target = None
         
-        # 先保存房间状态，确保night_count被正确保存
-        await redis_service.set_room_data(room_id, room.model_dump())
-        
+        # 保存房间状态（包括night_count和阶段时间）
         await self._set_phase_time(room)
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room_id}")
         
         # 发送夜晚开始提示和弹窗
         await self._ai_announce(room_id, f"第{room.night_count}夜开始，所有玩家请闭眼。", phase_popup="night_start")
         
         # 等待1.5秒，让玩家看到夜晚开始的弹窗（弹窗显示1.5秒后消失）
-        await asyncio.sleep(1.5)
-        
-        # 弹窗消失后，按顺序处理夜晚行动（引导消息会在_process_night_actions中发送）
-        await self._process_night_actions(room)
-    
-    async def _process_night_actions(self, room: GameRoom):
-        """按顺序处理夜晚行动：守卫 -> 狼人 -> 预言家 -> 女巫"""
-        import asyncio
-        
-        # 1. 守卫行动
-        await self._process_guard_phase(room)
-        # 等待1秒，让玩家看到守卫阶段的提示
-        await asyncio.sleep(1)
-        # 触发AI玩家自动行动
-        await self._trigger_ai_night_actions(room, "guard")
-        # 等待守卫行动完成（最多等待30秒）
-        await self._wait_for_phase_completion(room, "guard", timeout=30)
-        # 检查是否完成，如果完成则提示
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            current_room = GameRoom(**room_data)
-            guard = next((p for p in current_room.players if p.role == PlayerRole.GUARD and p.alive), None)
-            if not guard or "guard" in current_room.night_actions:
-                logger.info(f"【守卫阶段完成】房间 {room.room_id} - AI主持人: 守卫已完成操作。")
-                await self._ai_announce(room.room_id, "守卫已完成操作。")
-                await asyncio.sleep(1)  # 等待1秒，让玩家看到提示
-        
-        # 2. 狼人行动
-        await self._process_wolf_phase(room)
-        # 等待1秒，让玩家看到狼人阶段的提示
-        await asyncio.sleep(1)
-        # 触发AI玩家自动行动
-        await self._trigger_ai_night_actions(room, "wolf")
-        # 等待狼人行动完成（最多等待30秒）
-        await self._wait_for_phase_completion(room, "wolf", timeout=30)
-        # 检查是否完成，如果完成则提示
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            current_room = GameRoom(**room_data)
-            wolves = [p for p in current_room.players if p.role == PlayerRole.WOLF and p.alive]
-            if not wolves or ("wolf" in current_room.night_actions and 
-                             len(current_room.night_actions["wolf"].get("votes", {})) >= len(wolves)):
-                logger.info(f"【狼人阶段完成】房间 {room.room_id} - AI主持人: 狼人已完成操作。")
-                await self._ai_announce(room.room_id, "狼人已完成操作。")
-                await asyncio.sleep(1)  # 等待1秒，让玩家看到提示
-        
-        # 3. 预言家行动
-        await self._process_seer_phase(room)
-        # 等待1秒，让玩家看到预言家阶段的提示
-        await asyncio.sleep(1)
-        # 触发AI玩家自动行动
-        await self._trigger_ai_night_actions(room, "seer")
-        # 等待预言家行动完成（最多等待30秒）
-        await self._wait_for_phase_completion(room, "seer", timeout=30)
-        # 检查是否完成，如果完成则提示
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            current_room = GameRoom(**room_data)
-            seer = next((p for p in current_room.players if p.role == PlayerRole.SEER and p.alive), None)
-            if not seer or "seer" in current_room.night_actions:
-                logger.info(f"【预言家阶段完成】房间 {room.room_id}")
-                await self._ai_announce(room.room_id, "预言家已完成操作。")
-                await asyncio.sleep(1)  # 等待1秒，让玩家看到提示
-        
-        # 4. 女巫行动
-        await self._process_witch_phase(room)
-        # 等待1秒，让玩家看到女巫阶段的提示
-        await asyncio.sleep(1)
-        # 触发AI玩家自动行动
-        await self._trigger_ai_night_actions(room, "witch")
-        # 等待女巫行动完成（最多等待30秒）
-        await self._wait_for_phase_completion(room, "witch", timeout=30)
-        # 检查是否完成，如果完成则提示
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            current_room = GameRoom(**room_data)
-            witch = next((p for p in current_room.players if p.role == PlayerRole.WITCH and p.alive), None)
-            if not witch:
-                logger.info(f"【女巫阶段完成】房间 {room.room_id}")
-                await self._ai_announce(room.room_id, "女巫已完成操作。")
-            elif "witch" in current_room.night_actions:
-                witch_action = current_room.night_actions["witch"]
-                if (witch_action.get("antidote_used") or 
-                    witch_action.get("poison_used") or 
-                    witch_action.get("action") == "none"):
-                    logger.info(f"【女巫阶段完成】房间 {room.room_id}")
-                    await self._ai_announce(room.room_id, "女巫已完成操作。")
-            await asyncio.sleep(1)  # 等待1秒，让玩家看到提示
-        
-        # 所有夜晚子阶段都处理完了，将current_night_phase设置为None
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            final_room = GameRoom(**room_data)
-            final_room.current_night_phase = None
-            await redis_service.set_room_data(room.room_id, final_room.model_dump())
-        
-        # 检查是否所有行动都完成了，如果完成则结算
-        await self._check_night_actions_complete(room)
+        # 之后由状态机按顺序进入守卫 -> 狼人 -> 预言家 -> 女巫子阶段
+        await tracer.sleep(1.5, "popup", room.room_id)
     
-    async def _process_guard_phase(self, room: GameRoom):
+    async def _process_guard_phase(self, room: RoomState):
         """处理守卫阶段"""
-        guard = next((p for p in room.players if p.role == PlayerRole.GUARD and p.alive), None)
+        guard = room.first_alive(PlayerRole.GUARD)
         if not guard:
             logger.info(f"【守卫阶段】房间 {room.room_id} - 守卫已死亡或不存在，跳过")
             return
         
         logger.info(f"【守卫阶段开始】房间 {room.room_id} - 守卫 {guard.username} (ID: {guard.user_id})")
         room.current_night_phase = "guard"
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room.room_id}")
         
         # AI主持人公开提示
@@ -1422,14 +1517,14 @@ class WerewolfService:
         await self._ai_announce(room.room_id, "守卫请睁眼，选择你要守护的玩家。")
         
         # 发送私密消息给守卫
-        alive_players = [p for p in room.players if p.alive]
+        alive_players = room.alive
         player_list = "\n".join([f"{i+1}. {p.username}" for i, p in enumerate(alive_players)])
         
         # 获取上一晚守护目标（不能连续两晚守同一人）
         cannot_guard = guard.last_guard_target if guard.last_guard_target else None
         cannot_guard_name = None
         if cannot_guard:
-            cannot_guard_player = next((p for p in room.players if p.user_id == cannot_guard), None)
+            cannot_guard_player = room.get_player(cannot_guard)
             if cannot_guard_player:
                 cannot_guard_name = cannot_guard_player.username
         
@@ -1445,15 +1540,14 @@ class WerewolfService:
             "cannot_guard": cannot_guard
         }
         
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, guard.user_id, private_msg
         )
         
         # 通过WebSocket发送私有消息给守卫
         if self.send_private_message_callback:
-            import json
             await self.send_private_message_callback(
-                room.room_id, guard.user_id, json.dumps({
+                room.room_id, guard.user_id, encode_frame({
                     "type": "private_message",
                     "content": private_msg
                 })
@@ -1462,9 +1556,9 @@ class WerewolfService:
         # 等待守卫行动完成（通过检查 night_actions）
         # 注意：这里不等待，让玩家通过 player_action 提交行动
     
-    async def _process_wolf_phase(self, room: GameRoom):
+    async def _process_wolf_phase(self, room: RoomState):
         """处理狼人阶段"""
-        wolves = [p for p in room.players if p.role == PlayerRole.WOLF and p.alive]
+        wolves = room.wolves
         if not wolves:
             logger.info(f"【狼人阶段】房间 {room.room_id} - 狼人已全部死亡，跳过")
             return
@@ -1472,14 +1566,13 @@ class WerewolfService:
         wolf_names = [w.username for w in wolves]
         logger.info(f"【狼人阶段开始】房间 {room.room_id} - 存活狼人: {', '.join(wolf_names)} (共 {len(wolves)} 人)")
         room.current_night_phase = "wolf"
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room.room_id}")
         
         # AI主持人公开提示
@@ -1487,7 +1580,7 @@ class WerewolfService:
         await self._ai_announce(room.room_id, "守卫请闭眼。狼人请睁眼，共同选择要击杀的玩家。")
         
         # 获取所有存活玩家（排除狼人）
-        alive_players = [p for p in room.players if p.alive and p.role != PlayerRole.WOLF]
+        alive_players = [p for p in room.alive if p.role != PlayerRole.WOLF]
         player_list = "\n".join([f"{i+1}. {p.username}" for i, p in enumerate(alive_players)])
         
         # 发送私密消息给所有狼人
@@ -1505,44 +1598,42 @@ class WerewolfService:
                 "teammates": teammates
             }
             
-            await redis_service.add_private_message(
+            await game_event_log.add_private_message(
                 room.room_id, wolf.user_id, private_msg
             )
             
             # 通过WebSocket发送私有消息给狼人
             if self.send_private_message_callback:
-                import json
                 await self.send_private_message_callback(
-                    room.room_id, wolf.user_id, json.dumps({
+                    room.room_id, wolf.user_id, encode_frame({
                         "type": "private_message",
                         "content": private_msg
                     })
                 )
     
-    async def _process_seer_phase(self, room: GameRoom):
+    async def _process_seer_phase(self, room: RoomState):
         """处理预言家阶段"""
-        seer = next((p for p in room.players if p.role == PlayerRole.SEER and p.alive), None)
+        seer = room.first_alive(PlayerRole.SEER)
         if not seer:
             logger.info(f"【预言家阶段】房间 {room.room_id} - 预言家已死亡或不存在，跳过")
             return
         
         logger.info(f"【预言家阶段开始】房间 {room.room_id} - 预言家 {seer.username}")
         room.current_night_phase = "seer"
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room.room_id}")
         
         # AI主持人公开提示
         await self._ai_announce(room.room_id, "狼人请闭眼。预言家请睁眼，选择你要查验的玩家。")
         
         # 获取所有存活玩家（排除自己）
-        alive_players = [p for p in room.players if p.alive and p.user_id != seer.user_id]
+        alive_players = [p for p in room.alive if p.user_id != seer.user_id]
         player_list = "\n".join([f"{i+1}. {p.username}" for i, p in enumerate(alive_players)])
         
         # 发送私密消息给预言家
@@ -1553,37 +1644,35 @@ class WerewolfService:
             "players": [{"user_id": p.user_id, "username": p.username} for p in alive_players]
         }
         
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, seer.user_id, private_msg
         )
         
         # 通过WebSocket发送私有消息给预言家
         if self.send_private_message_callback:
-            import json
             await self.send_private_message_callback(
-                room.room_id, seer.user_id, json.dumps({
+                room.room_id, seer.user_id, encode_frame({
                     "type": "private_message",
                     "content": private_msg
                 })
             )
     
-    async def _process_witch_phase(self, room: GameRoom):
+    async def _process_witch_phase(self, room: RoomState):
         """处理女巫阶段"""
-        witch = next((p for p in room.players if p.role == PlayerRole.WITCH and p.alive), None)
+        witch = room.first_alive(PlayerRole.WITCH)
         if not witch:
             logger.info(f"【女巫阶段】房间 {room.room_id} - 女巫已死亡或不存在，跳过")
             return
         
         logger.info(f"【女巫阶段开始】房间 {room.room_id} - 女巫 {witch.username}")
         room.current_night_phase = "witch"
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room.room_id}")
         
         # AI主持人公开提示
@@ -1593,13 +1682,13 @@ class WerewolfService:
         wolf_target = None
         if "wolf" in room.night_actions and room.night_actions["wolf"].get("target"):
             wolf_target = room.night_actions["wolf"]["target"]
-            wolf_target_player = next((p for p in room.players if p.user_id == wolf_target), None)
+            wolf_target_player = room.get_player(wolf_target)
             wolf_target_name = wolf_target_player.username if wolf_target_player else None
         else:
             wolf_target_name = None
         
         # 获取所有存活玩家（用于毒药目标）
-        alive_players = [p for p in room.players if p.alive and p.user_id != witch.user_id]
+        alive_players = [p for p in room.alive if p.user_id != witch.user_id]
         player_list = "\n".join([f"{i+1}. {p.username}" for i, p in enumerate(alive_players)])
         
         # 构建消息
@@ -1636,15 +1725,14 @@ class WerewolfService:
             "is_first_night": is_first_night
         }
         
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, witch.user_id, private_msg
         )
         
         # 通过WebSocket发送私有消息给女巫
         if self.send_private_message_callback:
-            import json
             await self.send_private_message_callback(
-                room.room_id, witch.user_id, json.dumps({
+                room.room_id, witch.user_id, encode_frame({
                     "type": "private_message",
                     "content": private_msg
                 })
@@ -1653,7 +1741,7 @@ class WerewolfService:
         # 女巫行动完成后，AI主持人提示闭眼
         # 注意：这里不立即提示，等所有行动完成后再提示
     
-    async def _handle_guard_action(self, room: GameRoom, player: Player, target: Optional[str]) -> Dict:
+    async def _handle_guard_action(self, room: RoomState, player: PlayerState, target: Optional[str]) -> Dict:
         """处理守卫行动"""
         if player.role != PlayerRole.GUARD:
             return {"error": "你不是守卫"}
@@ -1661,7 +1749,7 @@ class WerewolfService:
         if not target:
             return {"error": "请选择守护目标"}
         
-        target_player = next((p for p in room.players if p.user_id == target and p.alive), None)
+        target_player = room.get_player(target, alive_only=True)
         if not target_player:
             return {"error": "目标玩家不存在或已死亡"}
         
@@ -1680,13 +1768,13 @@ class WerewolfService:
         player.guard_target = target
         player.last_guard_target = target
         
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 打印守卫行动日志（强制刷新输出）
         logger.info(f"【守卫行动】房间 {room.room_id} - 守卫 {player.username} 选择守护: {target_player.username} (ID: {target})")
         
         # 发送确认消息
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, player.user_id,
             {
                 "type": "action_confirmed",
@@ -1697,7 +1785,7 @@ class WerewolfService:
         
         return {"success": True, "message": f"你选择守护 {target_player.username}"}
     
-    async def _handle_wolf_action(self, room: GameRoom, player: Player, target: Optional[str]) -> Dict:
+    async def _handle_wolf_action(self, room: RoomState, player: PlayerState, target: Optional[str]) -> Dict:
         """处理狼人行动"""
         # 检查玩家是否存活
         if not player.alive:
@@ -1709,7 +1797,7 @@ class WerewolfService:
         if not target:
             return {"error": "请选择击杀目标"}
         
-        target_player = next((p for p in room.players if p.user_id == target and p.alive), None)
+        target_player = room.get_player(target, alive_only=True)
         if not target_player:
             return {"error": "目标玩家不存在或已死亡"}
         
@@ -1726,7 +1814,7 @@ class WerewolfService:
         logger.info(f"【狼人投票】房间 {room.room_id} - 狼人 {player.username} (ID: {player.user_id}) 投票击杀: {target_player.username} (ID: {target})")
         
         # 检查是否所有狼人都投票了
-        wolves = [p for p in room.players if p.role == PlayerRole.WOLF and p.alive]
+        wolves = room.wolves
         votes = room.night_actions["wolf"]["votes"]
         logger.info(f"【狼人投票进度】房间 {room.room_id} - 已投票: {len(votes)}/{len(wolves)}")
         
@@ -1747,8 +1835,8 @@ class WerewolfService:
                     most_voted_target = target
                 
                 # 异步触发AI狼人跟随投票（不阻塞当前请求）
-                import asyncio
-                asyncio.create_task(self._trigger_ai_wolves_follow_vote(room.room_id, most_voted_target, ai_wolves))
+                task_registry.spawn(room.room_id, self._trigger_ai_wolves_follow_vote(room.room_id, most_voted_target, ai_wolves),
+                                    "ai_wolf_follow")
         
         if len(votes) == len(wolves):
             # 统计投票
@@ -1762,15 +1850,15 @@ class WerewolfService:
             room.eliminated_tonight = final_target
             
             # 打印狼人投票完成日志（强制刷新输出）
-            final_target_player = next((p for p in room.players if p.user_id == final_target), None)
+            final_target_player = room.get_player(final_target)
             final_target_name = final_target_player.username if final_target_player else final_target
             logger.info(f"【狼人投票完成】房间 {room.room_id} - 所有狼人已投票，最终击杀目标: {final_target_name} (ID: {final_target})")
             logger.info(f"  投票详情: {vote_counts}")
         
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         target_name = target_player.username
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, player.user_id,
             {
                 "type": "action_confirmed",
@@ -1781,17 +1869,16 @@ class WerewolfService:
         
         return {"success": True, "message": f"你选择击杀 {target_name}"}
     
-    async def _trigger_ai_wolves_follow_vote(self, room_id: str, target: str, ai_wolves: List[Player]):
+    async def _trigger_ai_wolves_follow_vote(self, room_id: str, target: str, ai_wolves: List[PlayerState]):
         """触发AI狼人跟随投票"""
-        import asyncio
-        await asyncio.sleep(1)  # 延迟1秒，模拟思考
+        await tracer.sleep(1, "ai_think", room_id)  # 延迟1秒，模拟思考
         
         # 重新获取房间数据
-        room_data = await redis_service.get_room_data(room_id)
+        room_data = await game_event_log.load(room_id)
         if not room_data:
             return
         
-        room = GameRoom(**room_data)
+        room = RoomState.from_dict(room_data)
         
         # 检查是否还在狼人阶段
         if room.phase != GamePhase.NIGHT or room.current_night_phase != "wolf":
@@ -1802,7 +1889,7 @@ class WerewolfService:
             return
         
         votes = room.night_actions["wolf"].get("votes", {})
-        all_wolves = [p for p in room.players if p.role == PlayerRole.WOLF and p.alive]
+        all_wolves = room.wolves
         
         # 如果所有狼人都已投票，不需要再触发
         if len(votes) >= len(all_wolves):
@@ -1812,13 +1899,13 @@ class WerewolfService:
         for wolf in ai_wolves:
             if wolf.user_id not in votes:
                 # 重新获取玩家对象（因为room可能已更新）
-                current_wolf = next((p for p in room.players if p.user_id == wolf.user_id), None)
+                current_wolf = room.get_player(wolf.user_id)
                 if current_wolf and current_wolf.alive:
                     await self._handle_wolf_action(room, current_wolf, target)
                     # 重新获取房间数据，因为投票可能已经更新
-                    room_data = await redis_service.get_room_data(room_id)
+                    room_data = await game_event_log.load(room_id)
                     if room_data:
-                        room = GameRoom(**room_data)
+                        room = RoomState.from_dict(room_data)
     
     async def handle_wolf_chat(self, room_id: str, user_id: str, content: str) -> Dict:
         """处理狼人私聊消息"""
@@ -1826,7 +1913,7 @@ class WerewolfService:
         if not room:
             return {"error": "房间不存在"}
         
-        player = next((p for p in room.players if p.user_id == user_id), None)
+        player = room.get_player(user_id)
         if not player:
             return {"error": "玩家不存在"}
         
@@ -1848,7 +1935,7 @@ class WerewolfService:
             "timestamp": int(time.time() * 1000)
         }
     
-    async def _handle_seer_action(self, room: GameRoom, player: Player, target: Optional[str]) -> Dict:
+    async def _handle_seer_action(self, room: RoomState, player: PlayerState, target: Optional[str]) -> Dict:
         """处理预言家行动"""
         if player.role != PlayerRole.SEER:
             logger.warning(f"【预言家行动】房间 {room.room_id} - 玩家 {player.username} 不是预言家")
@@ -1858,7 +1945,7 @@ class WerewolfService:
             logger.warning(f"【预言家行动】房间 {room.room_id} - 玩家 {player.username} 未选择查验目标")
             return {"error": "请选择查验目标"}
         
-        target_player = next((p for p in room.players if p.user_id == target and p.alive), None)
+        target_player = room.get_player(target, alive_only=True)
         if not target_player:
             logger.warning(f"【预言家行动】房间 {room.room_id} - 目标玩家不存在或已死亡: {target}")
             return {"error": "目标玩家不存在或已死亡"}
@@ -1874,7 +1961,11 @@ class WerewolfService:
         # 强制刷新输出
         logger.info(f"【预言家行动】房间 {room.room_id} - 预言家 {player.username} 查验 {target_player.username}，结果: {result}")
         
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
+        if player.is_ai:
+            # AI预言家之后的发言和投票需要记得自己验过谁
+            (await ai_contexts.get(room)).record_seer_result(player.user_id, room.night_count,
+                                                             target_player.username, result)
         
         # 构建私密消息
         private_msg = {
@@ -1886,16 +1977,15 @@ class WerewolfService:
         }
         
         # 发送私密结果到Redis
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, player.user_id, private_msg
         )
         
         # 通过WebSocket实时发送私密消息
         if self.send_private_message_callback:
-            import json
             try:
                 await self.send_private_message_callback(
-                    room.room_id, player.user_id, json.dumps({
+                    room.room_id, player.user_id, encode_frame({
                         "type": "private_message",
                         "content": private_msg
                     })
@@ -1905,7 +1995,7 @@ class WerewolfService:
         
         return {"success": True, "message": f"你查验了 {target_player.username}，结果是：{result}"}
     
-    async def _handle_witch_action(self, room: GameRoom, player: Player, action_data: Dict) -> Dict:
+    async def _handle_witch_action(self, room: RoomState, player: PlayerState, action_data: Dict) -> Dict:
         """处理女巫行动"""
         if player.role != PlayerRole.WITCH:
             return {"error": "你不是女巫"}
@@ -1954,15 +2044,15 @@ class WerewolfService:
             player.witch_antidote_used = True
             player.saved_by_witch = True
             
-            saved_player = next((p for p in room.players if p.user_id == wolf_target), None)
+            saved_player = room.get_player(wolf_target)
             saved_name = saved_player.username if saved_player else "未知"
             
             # 打印女巫救人日志（强制刷新输出）
             logger.info(f"【女巫行动】房间 {room.room_id} - 女巫 {player.username} 使用解药救了 {saved_name}")
             
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+            await game_event_log.save_room(room.room_id, room.to_dict())
             
-            await redis_service.add_private_message(
+            await game_event_log.add_private_message(
                 room.room_id, player.user_id,
                 {
                     "type": "action_confirmed",
@@ -1981,7 +2071,7 @@ class WerewolfService:
             if not target:
                 return {"error": "请选择毒杀目标"}
             
-            target_player = next((p for p in room.players if p.user_id == target and p.alive), None)
+            target_player = room.get_player(target, alive_only=True)
             if not target_player:
                 return {"error": "目标玩家不存在或已死亡"}
             
@@ -1993,9 +2083,9 @@ class WerewolfService:
             # 打印女巫毒人日志（强制刷新输出）
             logger.info(f"【女巫行动】房间 {room.room_id} - 女巫 {player.username} 使用毒药毒杀了 {target_player.username}")
             
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+            await game_event_log.save_room(room.room_id, room.to_dict())
             
-            await redis_service.add_private_message(
+            await game_event_log.add_private_message(
                 room.room_id, player.user_id,
                 {
                     "type": "action_confirmed",
@@ -2013,9 +2103,9 @@ class WerewolfService:
             # 打印女巫不使用药水日志（强制刷新输出）
             logger.info(f"【女巫行动】房间 {room.room_id} - 女巫 {player.username} 选择不使用任何药水")
             
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+            await game_event_log.save_room(room.room_id, room.to_dict())
             
-            await redis_service.add_private_message(
+            await game_event_log.add_private_message(
                 room.room_id, player.user_id,
                 {
                     "type": "action_confirmed",
@@ -2029,16 +2119,8 @@ class WerewolfService:
         else:
             return {"error": "无效的行动类型"}
     
-    async def _process_night_result(self, room: GameRoom):
-        """结算夜晚结果"""
-        import asyncio
-        
-        # 防止重复调用
-        if room.room_id in self.processing_night_result:
-            logger.warning(f"【夜晚结算】房间 {room.room_id} 正在处理中，跳过重复调用")
-            return
-        
-        self.processing_night_result.add(room.room_id)
+    async def _process_night_result(self, room: RoomState) -> Tuple[List[str], Dict[str, str]]:
+        """结算夜晚结果，返回 (死亡玩家ID列表, 死亡原因)"""
         
         try:
             # 强制刷新输出
@@ -2049,7 +2131,7 @@ class WerewolfService:
             # AI主持人提示夜晚结束
             await self._ai_announce(room.room_id, "女巫请闭眼。所有玩家请闭眼。", phase_popup="night_end")
             # 短暂等待，让玩家看到夜晚结束的弹窗（减少等待时间，避免界面卡住）
-            await asyncio.sleep(1.5)
+            await tracer.sleep(1.5, "popup", room.room_id)
             
             deaths = []
             death_reasons = {}
@@ -2076,7 +2158,7 @@ class WerewolfService:
                         logger.info(f"【狼人击杀】从投票记录中计算目标: {wolf_target}")
             
             if wolf_target:
-                wolf_target_player = next((p for p in room.players if p.user_id == wolf_target), None)
+                wolf_target_player = room.get_player(wolf_target)
                 if wolf_target_player:
                     role_name = self._get_role_name(wolf_target_player.role) if wolf_target_player.role else "未知"
                     logger.info(f"【狼人击杀】目标: {wolf_target_player.username} ({role_name}) (ID: {wolf_target})")
@@ -2085,7 +2167,7 @@ class WerewolfService:
                         votes = room.night_actions["wolf"]["votes"]
                         vote_counts = {}
                         for vote_target in votes.values():
-                            vote_player = next((p for p in room.players if p.user_id == vote_target), None)
+                            vote_player = room.get_player(vote_target)
                             if vote_player:
                                 vote_name = f"{vote_player.username} ({self._get_role_name(vote_player.role) if vote_player.role else '未知'})"
                             else:
@@ -2102,8 +2184,8 @@ class WerewolfService:
             guard_player = None
             if "guard" in room.night_actions and room.night_actions["guard"].get("target"):
                 guard_target = room.night_actions["guard"]["target"]
-                guard_target_player = next((p for p in room.players if p.user_id == guard_target), None)
-                guard_player = next((p for p in room.players if p.role == PlayerRole.GUARD and p.alive), None)
+                guard_target_player = room.get_player(guard_target)
+                guard_player = room.first_alive(PlayerRole.GUARD)
                 if guard_target_player:
                     target_role = self._get_role_name(guard_target_player.role) if guard_target_player.role else "未知"
                     guard_name = f"{guard_player.username} ({self._get_role_name(guard_player.role) if guard_player else '未知'})" if guard_player else "未知"
@@ -2111,7 +2193,7 @@ class WerewolfService:
                 else:
                     logger.warning(f"【守卫保护】目标ID存在但玩家不存在: {guard_target}")
             else:
-                guard_player = next((p for p in room.players if p.role == PlayerRole.GUARD and p.alive), None)
+                guard_player = room.first_alive(PlayerRole.GUARD)
                 if guard_player:
                     logger.info(f"【守卫保护】守卫 {guard_player.username} 今晚未使用技能")
                 else:
@@ -2120,7 +2202,7 @@ class WerewolfService:
             # 获取女巫行动
             witch_saved = None
             witch_poisoned = None
-            witch_player = next((p for p in room.players if p.role == PlayerRole.WITCH and p.alive), None)
+            witch_player = room.first_alive(PlayerRole.WITCH)
             if "witch" in room.night_actions:
                 # 优先从 saved_target 获取，如果没有则从 saved_tonight 获取
                 if room.night_actions["witch"].get("saved_target"):
@@ -2132,7 +2214,7 @@ class WerewolfService:
                     logger.info(f"【女巫救人】从 saved_tonight 获取被救目标: {witch_saved}")
                 
                 if witch_saved:
-                    saved_player = next((p for p in room.players if p.user_id == witch_saved), None)
+                    saved_player = room.get_player(witch_saved)
                     if saved_player:
                         saved_role = self._get_role_name(saved_player.role) if saved_player.role else "未知"
                         witch_name = f"{witch_player.username} ({self._get_role_name(witch_player.role) if witch_player else '未知'})" if witch_player else "未知"
@@ -2144,7 +2226,7 @@ class WerewolfService:
                 
                 if room.night_actions["witch"].get("poison_target"):
                     witch_poisoned = room.night_actions["witch"]["poison_target"]
-                    poisoned_target_player = next((p for p in room.players if p.user_id == witch_poisoned), None)
+                    poisoned_target_player = room.get_player(witch_poisoned)
                     if poisoned_target_player:
                         poisoned_role = self._get_role_name(poisoned_target_player.role) if poisoned_target_player.role else "未知"
                         witch_name = f"{witch_player.username} ({self._get_role_name(witch_player.role) if witch_player else '未知'})" if witch_player else "未知"
@@ -2161,7 +2243,7 @@ class WerewolfService:
             
             # 处理被刀者
             if wolf_target:
-                wolf_target_player = next((p for p in room.players if p.user_id == wolf_target), None)
+                wolf_target_player = room.get_player(wolf_target)
                 if wolf_target_player and wolf_target_player.alive:
                     # 安全检查：如果被刀者是狼人，记录警告（理论上狼人不会刀自己，但可能是bug）
                     if wolf_target_player.role == PlayerRole.WOLF:
@@ -2197,7 +2279,7 @@ class WerewolfService:
             
             # 处理被毒者（毒药无视守卫，直接死亡）
             if witch_poisoned:
-                poisoned_player = next((p for p in room.players if p.user_id == witch_poisoned), None)
+                poisoned_player = room.get_player(witch_poisoned)
                 if poisoned_player and poisoned_player.alive:
                     # 检查是否已经在死亡列表中（避免重复）
                     if poisoned_player.user_id not in deaths:
@@ -2216,7 +2298,7 @@ class WerewolfService:
             logger.info(f"\n【夜晚结算结果】")
             if deaths:
                 for death_id in deaths:
-                    dead_player = next((p for p in room.players if p.user_id == death_id), None)
+                    dead_player = room.get_player(death_id)
                     if dead_player:
                         reason = death_reasons.get(death_id, "未知原因")
                         role_name = self._get_role_name(dead_player.role) if dead_player.role else "未知"
@@ -2230,7 +2312,7 @@ class WerewolfService:
             # 最终安全检查：确保所有在死亡列表中的玩家确实被标记为死亡
             logger.info(f"\n【夜晚结算最终检查】")
             for death_id in deaths:
-                dead_player = next((p for p in room.players if p.user_id == death_id), None)
+                dead_player = room.get_player(death_id)
                 if dead_player:
                     if dead_player.alive:
                         logger.error(f"  【错误】玩家 {dead_player.username} (ID: {death_id}) 在死亡列表中但alive=True！")
@@ -2244,15 +2326,15 @@ class WerewolfService:
             logger.info(f"{'='*60}\n")
             
             # 保存房间状态（确保死亡状态被正确保存）
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+            await game_event_log.save_room(room.room_id, room.to_dict())
             
             # 再次验证死亡状态是否已正确保存
-            room_data_check = await redis_service.get_room_data(room.room_id)
+            room_data_check = await game_event_log.load(room.room_id)
             if room_data_check:
-                check_room = GameRoom(**room_data_check)
+                check_room = RoomState.from_dict(room_data_check)
                 # 先检查是否有玩家被错误地添加到死亡列表
                 for death_id in list(deaths):  # 使用list()创建副本，以便在循环中修改
-                    dead_player_check = next((p for p in check_room.players if p.user_id == death_id), None)
+                    dead_player_check = check_room.get_player(death_id)
                     if dead_player_check:
                         if dead_player_check.alive:
                             # 这是一个严重的错误：玩家在死亡列表中但alive=True
@@ -2272,7 +2354,7 @@ class WerewolfService:
                             if dead_player_check.alive:
                                 logger.warning(f"【警告】玩家 {dead_player_check.username} (ID: {death_id}) 的死亡状态未正确保存，强制更新")
                                 dead_player_check.alive = False
-                                await redis_service.set_room_data(room.room_id, check_room.model_dump())
+                                await game_event_log.save_room(room.room_id, check_room.to_dict())
                 
                 # 额外检查：确保没有不在deaths列表中的玩家被错误地标记为死亡
                 for player in check_room.players:
@@ -2280,8 +2362,8 @@ class WerewolfService:
                         # 如果玩家被标记为死亡但不在deaths列表中，记录警告
                         logger.info(f"【信息】玩家 {player.username} (ID: {player.user_id}) 已死亡（之前夜晚），死亡原因: {player.died_by}")
             
-            # 进入白天阶段，公布死亡信息
-            await self._start_day_phase(room, deaths, death_reasons)
+            # 由状态机进入白天阶段，公布死亡信息
+            return deaths, death_reasons
         
         except Exception as e:
             # 捕获所有异常，确保日志能正常输出
@@ -2289,17 +2371,9 @@ class WerewolfService:
             logger.error(f"【夜晚结算异常】房间 {room.room_id} - 错误详情: {type(e).__name__}: {str(e)}")
             # 重新抛出异常，让上层处理
             raise
-        finally:
-            # 移除处理标志（无论成功还是失败都要移除）
-            self.processing_night_result.discard(room.room_id)
-    
-    async def _start_day_phase(self, room: GameRoom, deaths: List[str], death_reasons: Dict[str, str]):
-        """开始白天阶段"""
-        # 重新获取最新的房间数据，确保使用最新的状态（包括死亡状态）
-        room_data = await redis_service.get_room_data(room.room_id)
-        if room_data:
-            room = GameRoom(**room_data)
-        
+    
+    async def _start_day_phase(self, room: RoomState, deaths: List[str], death_reasons: Dict[str, str]) -> Optional[str]:
+        """开始白天阶段，返回需要开枪的猎人ID"""
         # 打印明显的白天阶段开始日志
         logger.info(f"\n{'='*60}")
         logger.info(f"【白天阶段开始】房间 {room.room_id} - 第 {room.day_count + 1} 天")
@@ -2334,10 +2408,9 @@ class WerewolfService:
         
         # 广播房间状态更新
         if self.broadcast_callback:
-            import json
-            await self.broadcast_callback(json.dumps({
+            await self.broadcast_callback(encode_frame({
                 "type": "room_update",
-                "room": room.model_dump()
+                "room": room.to_dict()
             }), f"werewolf_{room.room_id}")
         
         # 显示白天到来弹窗
@@ -2348,7 +2421,7 @@ class WerewolfService:
             death_messages = []
             hunter_deaths = []  # 记录需要开枪的猎人
             for death_id in deaths:
-                dead_player = next((p for p in room.players if p.user_id == death_id), None)
+                dead_player = room.get_player(death_id)
                 if dead_player:
                     reason = death_reasons.get(death_id, "未知原因")
                     death_messages.append(f"{dead_player.username} {reason}")
@@ -2360,40 +2433,37 @@ class WerewolfService:
             
             # 处理夜晚死亡的玩家的遗言
             for death_id in deaths:
-                dead_player = next((p for p in room.players if p.user_id == death_id), None)
+                dead_player = room.get_player(death_id)
                 if dead_player:
                     await self._handle_last_words(room, dead_player)
             
-            # 如果有猎人死亡且可以开枪，触发开枪（在公布死讯后立即）
+            # 如果有猎人死亡且可以开枪，由状态机在公布死讯后立即进入开枪环节
             if hunter_deaths:
                 # 如果有多个猎人同时死亡（理论上不太可能），只处理第一个
-                await self._trigger_hunter_shot(room, hunter_deaths[0])
-                # 如果触发了猎人开枪，等待开枪完成后再继续
-                return
+                return hunter_deaths[0].user_id
         else:
             await self._ai_announce(room.room_id, f"第{room.day_count}天开始。\n昨晚是平安夜，无人死亡。")
         
         # 打印存活玩家列表
-        alive_players = [p.username for p in room.players if p.alive]
+        alive_players = [p.username for p in room.alive]
         await self._ai_announce(room.room_id, f"当前存活玩家：{', '.join(alive_players)}")
-        
-        # 检查游戏是否结束
-        await self._check_game_over(room)
-        
-        if room.phase != GamePhase.GAME_OVER:
-            await self._ai_announce(room.room_id, "请开始发言讨论。")
+        return None
     
-    async def _handle_last_words(self, room: GameRoom, dead_player: Player):
+    async def _handle_last_words(self, room: RoomState, dead_player: PlayerState):
         """处理玩家遗言（触发遗言流程）"""
-        import asyncio
         
         if dead_player.is_ai:
             # AI玩家自动生成遗言
-            await asyncio.sleep(1)  # 延迟1秒，模拟思考
-            last_words = await self._generate_ai_last_words(room, dead_player)
+            await tracer.sleep(1, "ai_think", room.room_id)  # 延迟1秒，模拟思考
+            # 夜晚死亡的AI在结算时已预生成遗言
+            ctx = await ai_contexts.get(room)
+            last_words = await speculation.take(room.room_id, "last_words", dead_player.user_id, room.day_count,
+                                                ctx.fingerprint(), wait=config.AI_CALL_TIMEOUT)
+            if last_words is None:
+                last_words = await self._generate_ai_last_words(room, dead_player)
             # 公布遗言
             await self._ai_announce(room.room_id, f"【遗言】{dead_player.username}：{last_words}")
-            await asyncio.sleep(0.5)  # 短暂等待，让玩家看到遗言
+            await tracer.sleep(0.5, "popup", room.room_id)  # 短暂等待，让玩家看到遗言
         else:
             # 人类玩家，发送私有消息提示输入遗言
             role_name = self._get_role_name(dead_player.role) if dead_player.role else "玩家"
@@ -2403,21 +2473,20 @@ class WerewolfService:
                 "role": role_name
             }
             
-            await redis_service.add_private_message(
+            await game_event_log.add_private_message(
                 room.room_id, dead_player.user_id, private_msg
             )
             
             # 通过WebSocket发送私有消息给玩家
             if self.send_private_message_callback:
-                import json
                 await self.send_private_message_callback(
-                    room.room_id, dead_player.user_id, json.dumps({
+                    room.room_id, dead_player.user_id, encode_frame({
                         "type": "private_message",
                         "content": private_msg
                     })
                 )
     
-    async def _handle_last_words_action(self, room: GameRoom, player: Player, action_data: Dict) -> Dict:
+    async def _handle_last_words_action(self, room: RoomState, player: PlayerState, action_data: Dict) -> Dict:
         """处理玩家提交的遗言"""
         if player.alive:
             return {"error": "你还活着，不需要发表遗言"}
@@ -2432,7 +2501,7 @@ class WerewolfService:
         
         return {"success": True, "message": "遗言已发表"}
     
-    async def _generate_ai_last_words(self, room: GameRoom, dead_player: Player) -> str:
+    async def _generate_ai_last_words(self, room: RoomState, dead_player: PlayerState) -> str:
         """生成AI玩家遗言"""
         try:
             role_name = self._get_role_name(dead_player.role) if dead_player.role else "玩家"
@@ -2440,10 +2509,10 @@ class WerewolfService:
             
             # 获取存活玩家列表
             alive_players_info = [{"username": p.username, "user_id": p.user_id} 
-                                for p in room.players if p.alive]
+                                for p in room.alive]
             
             # 获取最近的发言
-            latest_messages = await redis_service.get_room_messages(room.room_id)
+            latest_messages = await redis_service.get_room_messages(room.room_id, offset=-10)
             messages_for_ai = []
             for msg in latest_messages[-10:]:
                 if isinstance(msg, dict):
@@ -2452,6 +2521,16 @@ class WerewolfService:
                         "content": msg.get("content", "")
                     })
             
+            # 对局记录和预言家自己的查验结果
+            memory_text = ""
+            ctx = ai_contexts.peek(room.room_id)
+            if ctx:
+                memory_text = ctx.memory.render(config.AI_MEMORY_TOKENS)
+                seer_results = ctx.seer_results(dead_player.user_id)
+                if seer_results:
+                    role_desc += f"\n你的查验结果：{seer_results}"
+            memory_section = f"\n【局势记录】\n{memory_text}\n" if memory_text else ""
+            
             # 构建遗言prompt
             prompt = f"""你正在参与一场狼人杀游戏，但你不幸被投票出局了。
 
@@ -2462,7 +2541,7 @@ class WerewolfService:
 【游戏状态】
 当前是第{room.day_count}天
 存活玩家：{', '.join([p['username'] for p in alive_players_info])}
-
+{memory_section}
 【最近发言】
 {chr(10).join([f"{msg['username']}：{msg['content']}" for msg in messages_for_ai[-5:]]) if messages_for_ai else "暂无发言"}
 
@@ -2483,10 +2562,12 @@ class WerewolfService:
                 "content": "请发表你的遗言。"
             }]
             
+            # 遗言在结算动作中生成，此时房间记录的往往是刚结束的阶段，只限制单次调用时长（结算动作本身有耗时上限）
             last_words = await AIService.generate_response(
                 messages=conversation_history,
                 system_prompt=prompt,
-                temperature=0.8
+                call_site="last_words",
+                timeout=config.AI_CALL_TIMEOUT
             )
             
             if not last_words or len(last_words.strip()) < 2:
@@ -2510,12 +2591,12 @@ class WerewolfService:
             else:
                 return f"我是{role_name}，游戏继续。"
     
-    async def _trigger_hunter_shot(self, room: GameRoom, hunter: Player):
+    async def _trigger_hunter_shot(self, room: RoomState, hunter: PlayerState):
         """触发猎人开枪"""
         if hunter.hunter_shot_used:
             return
         
-        alive_players = [p for p in room.players if p.alive and p.user_id != hunter.user_id]
+        alive_players = [p for p in room.alive if p.user_id != hunter.user_id]
         if not alive_players:
             return
         
@@ -2528,15 +2609,14 @@ class WerewolfService:
             "players": [{"user_id": p.user_id, "username": p.username} for p in alive_players]
         }
         
-        await redis_service.add_private_message(
+        await game_event_log.add_private_message(
             room.room_id, hunter.user_id, private_msg
         )
         
         # 通过WebSocket发送私有消息给猎人
         if self.send_private_message_callback:
-            import json
             await self.send_private_message_callback(
-                room.room_id, hunter.user_id, json.dumps({
+                room.room_id, hunter.user_id, encode_frame({
                     "type": "private_message",
                     "content": private_msg
                 })
@@ -2545,29 +2625,30 @@ class WerewolfService:
         # 设置阶段为淘汰阶段，等待猎人开枪
         room.phase = GamePhase.ELIMINATION
         await self._set_phase_time(room)
-        await redis_service.set_room_data(room.room_id, room.model_dump())
+        await game_event_log.save_room(room.room_id, room.to_dict())
         
         # 如果是AI猎人，自动选择目标并开枪
         if hunter.is_ai:
-            import asyncio
-            await asyncio.sleep(1)  # 延迟1秒，模拟思考
+            await tracer.sleep(1, "ai_think", room.room_id)  # 延迟1秒，模拟思考
             
             # 重新获取房间数据
-            room_data = await redis_service.get_room_data(room.room_id)
+            room_data = await game_event_log.load(room.room_id)
             if not room_data:
                 return
-            current_room = GameRoom(**room_data)
-            current_hunter = next((p for p in current_room.players if p.user_id == hunter.user_id), None)
+            current_room = RoomState.from_dict(room_data)
+            current_hunter = current_room.get_player(hunter.user_id)
             if not current_hunter or current_hunter.hunter_shot_used:
                 return
             
-            # AI猎人随机选择目标
-            current_alive_players = [p for p in current_room.players if p.alive and p.user_id != current_hunter.user_id]
-            if current_alive_players:
-                target = random.choice(current_alive_players)
-                await self._handle_elimination_action(current_room, current_hunter, "hunter_shot", {"target": target.user_id})
+            # AI猎人带走自己最怀疑的玩家
+            candidates = [p.user_id for p in current_room.alive if p.user_id != current_hunter.user_id]
+            bot = (await ai_contexts.get(current_room)).bot
+            target = bot.choose_hunter_shot(current_hunter.user_id, candidates, current_room.day_count)
+            if target:
+                AI_DECISIONS.inc(action="hunter_shot", source="bot")
+                await self._handle_elimination_action(current_room, current_hunter, "hunter_shot", {"target": target})
     
-    async def _handle_elimination_action(self, room: GameRoom, player: Player, action_type: str, action_data: Dict) -> Dict:
+    async def _handle_elimination_action(self, room: RoomState, player: PlayerState, action_type: str, action_data: Dict) -> Dict:
         """处理淘汰阶段的行动（主要是猎人开枪）"""
         if action_type == "hunter_shot":
             if player.role != PlayerRole.HUNTER:
@@ -2583,7 +2664,7 @@ class WerewolfService:
             if not target:
                 return {"error": "请选择开枪目标"}
             
-            target_player = next((p for p in room.players if p.user_id == target and p.alive), None)
+            target_player = room.get_player(target, alive_only=True)
             if not target_player:
                 return {"error": "目标玩家不存在或已死亡"}
             
@@ -2592,29 +2673,22 @@ class WerewolfService:
             target_player.died_by = 'hunter'
             player.hunter_shot_used = True
             
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+            await game_event_log.save_room(room.room_id, room.to_dict())
             
             await self._ai_announce(room.room_id, f"{player.username} 开枪带走了 {target_player.username}！")
             
             # 处理被猎人带走的玩家的遗言
             await self._handle_last_words(room, target_player)
             
-            # 检查游戏是否结束
-            await self._check_game_over(room)
-            
-            # 如果游戏未结束，返回白天阶段继续讨论
-            if room.phase != GamePhase.GAME_OVER:
-                room.phase = GamePhase.DAY
-                await self._set_phase_time(room)
-                await redis_service.set_room_data(room.room_id, room.model_dump())
-                await self._ai_announce(room.room_id, "请继续发言讨论。")
+            # 由状态机判断游戏是否结束，或回到白天/进入夜晚
+            self._wake_driver(room.room_id)
             
             return {"success": True, "message": f"你开枪带走了 {target_player.username}"}
         
         return {"error": "无效的淘汰阶段行动"}
     
-    async def _process_voting_result(self, room: GameRoom):
-        """处理投票结果
+    async def _process_voting_result(self, current_room: RoomState) -> Optional[str]:
+        """处理投票结果，返回需要开枪的猎人ID
         
         注意：此函数只能在投票阶段结束时调用，不能在投票阶段进行中调用
         否则会导致玩家在投票阶段就被标记为死亡
@@ -2624,36 +2698,26 @@ class WerewolfService:
         2. 投票阶段已经结束（通过超时机制）
         3. 所有玩家都有机会投票
         """
-        import asyncio
-        
         # 确保当前处于投票阶段，如果不是则直接返回
-        if room.phase != GamePhase.VOTING:
-            logger.warning(f"【警告】_process_voting_result 被调用，但当前阶段不是投票阶段: {room.phase}")
-            return
-        
-        # 重新获取最新的房间数据，确保状态一致性
-        room_data = await redis_service.get_room_data(room.room_id)
-        if not room_data:
-            return
-        current_room = GameRoom(**room_data)
+        if current_room.phase != GamePhase.VOTING:
+            logger.warning(f"【警告】_process_voting_result 被调用，但当前阶段不是投票阶段: {current_room.phase}")
+            return None
         
         # 统计投票（只统计存活玩家的投票）
         votes = {}
-        for player in current_room.players:
-            if player.alive and player.vote_target:
+        for player in current_room.alive:
+            if player.vote_target:
                 votes[player.vote_target] = votes.get(player.vote_target, 0) + 1
         
+        # 记入AI的对局记录，之后几天的发言和投票仍能参考谁投了谁
+        ballots = [(player.username, target.username) for player in current_room.alive
+                   for target in [current_room.get_player(player.vote_target)] if target]
+        (await ai_contexts.get(current_room)).record_votes(current_room.day_count, ballots)
+        
         if not votes:
             # 无人投票，直接进入下一夜
             await self._ai_announce(current_room.room_id, "无人投票，进入下一夜。")
-            await self._check_game_over(current_room)
-            # 重新获取房间状态
-            room_data = await redis_service.get_room_data(current_room.room_id)
-            if room_data:
-                final_room = GameRoom(**room_data)
-                if final_room.phase != GamePhase.GAME_OVER:
-                    await self._start_night_phase(current_room.room_id)
-            return
+            return None
         
         # 找出最高票数
         max_votes = max(votes.values())
@@ -2662,40 +2726,25 @@ class WerewolfService:
         
         # 处理平票
         if len(top_voted) > 1:
-            # 平票，无人被处决
-            top_voted_names = [next((p.username for p in current_room.players if p.user_id == uid), uid) for uid in top_voted]
+            # 平票，无人被处决，跳过死亡和遗言环节，直接进入夜晚
+            top_voted_names = [(current_room.by_id[uid].username if uid in current_room.by_id else uid) for uid in top_voted]
             await self._ai_announce(current_room.room_id, f"投票平票（{', '.join(top_voted_names)}各得{max_votes}票），无人出局。")
-            # 跳过死亡和遗言环节，直接进入夜晚
-            await self._check_game_over(current_room)
-            # 重新获取房间状态
-            room_data = await redis_service.get_room_data(current_room.room_id)
-            if room_data:
-                final_room = GameRoom(**room_data)
-                if final_room.phase != GamePhase.GAME_OVER:
-                    await self._start_night_phase(current_room.room_id)
-            return
+            return None
         
         # 有唯一最高票者，被处决
         eliminated_id = top_voted[0]
-        eliminated_player = next((p for p in current_room.players if p.user_id == eliminated_id), None)
+        eliminated_player = current_room.get_player(eliminated_id)
         if not eliminated_player:
-            await self._check_game_over(current_room)
-            # 重新获取房间状态
-            room_data = await redis_service.get_room_data(current_room.room_id)
-            if room_data:
-                final_room = GameRoom(**room_data)
-                if final_room.phase != GamePhase.GAME_OVER:
-                    await self._start_night_phase(current_room.room_id)
-            return
+            return None
         
-        # 标记死亡（使用current_room而不是room，确保使用最新状态）
+        # 标记死亡
         eliminated_player.alive = False
         eliminated_player.died_by = 'vote'
         
         # 构建详细的投票结果信息
         vote_details = []
         for user_id, vote_count in sorted(votes.items(), key=lambda x: x[1], reverse=True):
-            voted_player = next((p for p in current_room.players if p.user_id == user_id), None)
+            voted_player = current_room.get_player(user_id)
             if voted_player:
                 vote_details.append(f"{voted_player.username}({vote_count}票)")
         
@@ -2707,107 +2756,92 @@ class WerewolfService:
         logger.info(f"【投票结果】房间 {current_room.room_id} - {eliminated_player.username} (ID: {eliminated_id}) 被投票出局，得票: {max_votes}")
         logger.info(f"  详细投票统计: {vote_details}")
         
-        # 保存房间状态（使用current_room）
-        await redis_service.set_room_data(current_room.room_id, current_room.model_dump())
+        # 保存房间状态
+        await game_event_log.save_room(current_room.room_id, current_room.to_dict())
         
         # 处理遗言
         await self._handle_last_words(current_room, eliminated_player)
         
         # 检查是否是猎人且未中毒，可以开枪
         if eliminated_player.role == PlayerRole.HUNTER and not eliminated_player.poisoned_by_witch:
-            await self._trigger_hunter_shot(current_room, eliminated_player)
-            # 如果触发了猎人开枪，等待开枪完成，不继续进入下一夜
-            return
-        
-        # 检查游戏是否结束
-        await self._check_game_over(current_room)
-        
-        # 重新获取房间状态
-        room_data = await redis_service.get_room_data(current_room.room_id)
-        if room_data:
-            final_room = GameRoom(**room_data)
-            # 如果游戏未结束且不在淘汰阶段（等待猎人开枪），进入下一夜
-            if final_room.phase != GamePhase.GAME_OVER and final_room.phase != GamePhase.ELIMINATION:
-                await self._start_night_phase(current_room.room_id)
-    
-    async def _check_game_over(self, room: GameRoom):
-        """检查游戏是否结束（屠边规则）"""
-        alive_players = [p for p in room.players if p.alive]
-        wolves = [p for p in alive_players if p.role == PlayerRole.WOLF]
-        gods = [p for p in alive_players if p.role in [PlayerRole.SEER, PlayerRole.WITCH, PlayerRole.HUNTER, PlayerRole.GUARD]]
-        villagers = [p for p in alive_players if p.role == PlayerRole.VILLAGER]
-        all_good = [p for p in alive_players if p.role != PlayerRole.WOLF]
-        
-        game_ended = False
-        winner = None
+            return eliminated_player.user_id
+        return None
+    
+    def _game_winner(self, room: RoomState) -> Optional[str]:
+        """判断游戏是否结束（屠边规则），返回获胜阵营"""
+        alive_by_role = room.alive_by_role
+        gods = [p for role in (PlayerRole.SEER, PlayerRole.WITCH, PlayerRole.HUNTER, PlayerRole.GUARD)
+                for p in alive_by_role.get(role, [])]
+        villagers = alive_by_role.get(PlayerRole.VILLAGER, [])
         
         # 狼人胜利条件：所有神职死亡 或 所有平民死亡
         if len(gods) == 0 or len(villagers) == 0:
-            room.winner = "wolves"
-            room.phase = GamePhase.GAME_OVER
-            await self._set_phase_time(room)
-            await self._ai_announce(room.room_id, "游戏结束！狼人阵营获胜！")
-            game_ended = True
-            winner = "wolves"
+            return "wolves"
         # 好人胜利条件：所有狼人死亡
-        elif len(wolves) == 0:
-            room.winner = "villagers"
-            room.phase = GamePhase.GAME_OVER
-            await self._set_phase_time(room)
+        if len(room.wolves) == 0:
+            return "villagers"
+        return None
+    
+    async def _finish_game(self, room: RoomState, winner: str):
+        """游戏结束：公布结果，更新用户胜利统计并检查角色解锁"""
+        room.winner = winner
+        room.phase = GamePhase.GAME_OVER
+        await self._set_phase_time(room)
+        if winner == "wolves":
+            await self._ai_announce(room.room_id, "游戏结束！狼人阵营获胜！")
+        else:
             await self._ai_announce(room.room_id, "游戏结束！好人阵营获胜！")
-            game_ended = True
-            winner = "villagers"
         
-        # 如果游戏结束，更新用户胜利统计并检查角色解锁
-        if game_ended and winner:
-            # 存储每个用户解锁的角色信息 {user_id: [unlocked_characters]}
-            unlocked_characters_by_user = {}
+        # 存储每个用户解锁的角色信息 {user_id: [unlocked_characters]}
+        unlocked_characters_by_user = {}
+        
+        # 遍历所有真实玩家（非AI）
+        for player in room.players:
+            if player.is_ai:
+                continue
             
-            # 遍历所有真实玩家（非AI）
-            for player in room.players:
-                if player.is_ai:
-                    continue
+            user_id = player.user_id
+            user_data = await redis_service.get_user_data(user_id) or {}
+            
+            # 判断玩家是否获胜
+            player_won = False
+            if winner == "wolves" and player.role == PlayerRole.WOLF:
+                player_won = True
+            elif winner == "villagers" and player.role != PlayerRole.WOLF:
+                player_won = True
+            
+            if player_won:
+                # 更新胜利统计
+                if player.role == PlayerRole.WOLF:
+                    wolf_wins = user_data.get("wolf_wins", 0)
+                    user_data["wolf_wins"] = wolf_wins + 1
+                    logger.info(f"【胜利统计】用户 {user_id} 作为狼人获胜，当前狼人胜利次数: {wolf_wins + 1}")
+                else:
+                    villager_wins = user_data.get("villager_wins", 0)
+                    user_data["villager_wins"] = villager_wins + 1
+                    logger.info(f"【胜利统计】用户 {user_id} 作为平民获胜，当前平民胜利次数: {villager_wins + 1}")
                 
-                user_id = player.user_id
-                user_data = await redis_service.get_user_data(user_id) or {}
+                # 更新总胜利次数
+                werewolf_wins = user_data.get("werewolf_wins", 0)
+                user_data["werewolf_wins"] = werewolf_wins + 1
                 
-                # 判断玩家是否获胜
-                player_won = False
-                if winner == "wolves" and player.role == PlayerRole.WOLF:
-                    player_won = True
-                elif winner == "villagers" and player.role != PlayerRole.WOLF:
-                    player_won = True
+                # 保存用户数据
+                await redis_service.set_user_data(user_id, user_data)
                 
-                if player_won:
-                    # 更新胜利统计
-                    if player.role == PlayerRole.WOLF:
-                        wolf_wins = user_data.get("wolf_wins", 0)
-                        user_data["wolf_wins"] = wolf_wins + 1
-                        logger.info(f"【胜利统计】用户 {user_id} 作为狼人获胜，当前狼人胜利次数: {wolf_wins + 1}")
-                    else:
-                        villager_wins = user_data.get("villager_wins", 0)
-                        user_data["villager_wins"] = villager_wins + 1
-                        logger.info(f"【胜利统计】用户 {user_id} 作为平民获胜，当前平民胜利次数: {villager_wins + 1}")
-                    
-                    # 更新总胜利次数
-                    werewolf_wins = user_data.get("werewolf_wins", 0)
-                    user_data["werewolf_wins"] = werewolf_wins + 1
-                    
-                    # 保存用户数据
-                    await redis_service.set_user_data(user_id, user_data)
-                    
-                    # 检查并解锁符合条件的角色
-                    unlocked_characters = await character_service.check_and_unlock_characters(user_id)
-                    if unlocked_characters:
-                        unlocked_characters_by_user[user_id] = unlocked_characters
-                        logger.info(f"【角色解锁】用户 {user_id} 解锁了 {len(unlocked_characters)} 个角色: {[c['name'] for c in unlocked_characters]}")
-            
-            # 将解锁的角色信息存储到房间数据中
-            room_data = room.model_dump()
-            room_data["unlocked_characters"] = unlocked_characters_by_user
-            await redis_service.set_room_data(room.room_id, room_data)
-        else:
-            await redis_service.set_room_data(room.room_id, room.model_dump())
+                # 检查并解锁符合条件的角色
+                unlocked_characters = await character_service.check_and_unlock_characters(user_id)
+                if unlocked_characters:
+                    unlocked_characters_by_user[user_id] = unlocked_characters
+                    logger.info(f"【角色解锁】用户 {user_id} 解锁了 {len(unlocked_characters)} 个角色: {[c['name'] for c in unlocked_characters]}")
+        
+        # 解锁的角色信息单独存储，不放进房间快照
+        await game_event_log.save_room(room.room_id, room.to_dict())
+        await redis_service.set_room_unlocked_characters(room.room_id, unlocked_characters_by_user)
+        await redis_service.remove_active_room(room.room_id)
+        await redis_service.delete_room_machine_state(room.room_id)
+        await room_router.release(room.room_id)
+        game_event_log.forget(room.room_id)
 
 werewolf_service = WerewolfService()
+ROOMS_BY_PHASE.set_collect(werewolf_service.rooms_by_phase)
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""狼人杀板子平衡性模拟
+
+用 NumPy 批量模拟机器人对局（规则与 WerewolfService 的夜晚/投票结算一致），
+统计各板子、各人数下狼人和好人的胜率，用于调整角色配置：
+  - 默认模拟所有注册的板子，以及 4~12 人的自动配置
+  - --clue: 好人从发言中识别狼人的能力（0 表示好人完全靠猜，越大好人越强）
+
+用法: python simulate_balance.py [--games 1000000] [--sizes 6,9,12] [--presets standard_12] [--clue 0.3] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from services.role_presets import role_preset_registry, auto_balance, MIN_PLAYERS
+from services.balance_simulator import simulate_preset, DEFAULT_CLUE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="狼人杀板子平衡性模拟")
+    parser.add_argument("--games", type=int, default=1_000_000, help="每个板子模拟的局数")
+    parser.add_argument("--batch", type=int, default=100_000, help="每批同时模拟的局数（影响内存占用）")
+    parser.add_argument("--sizes", default=None, help="自动配置的人数列表，逗号分隔（默认 4~12）")
+    parser.add_argument("--presets", default=None, help="注册板子ID列表，逗号分隔（默认全部，传空字符串表示不模拟）")
+    parser.add_argument("--clue", type=float, default=DEFAULT_CLUE, help="好人识别狼人的能力")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（固定后结果可复现）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else list(range(MIN_PLAYERS, 13))
+    presets = [auto_balance(size) for size in sizes]
+    if args.presets is None:
+        presets += role_preset_registry.list_presets()
+    else:
+        for preset_id in filter(None, args.presets.split(",")):
+            preset = role_preset_registry.get(preset_id)
+            if preset is None:
+                print(f"未知板子: {preset_id}", file=sys.stderr)
+                return 1
+            presets.append(preset)
+
+    results = []
+    if not args.json:
+        print("=" * 84)
+        print(f"{'板子':<14}{'人数':>4}{'狼人胜率':>16}{'好人胜率':>8}{'平均天数':>8}{'局/秒':>10}  配置")
+        print("-" * 84)
+    for preset in presets:
+        start = time.perf_counter()
+        result = simulate_preset(preset, args.games, args.batch, args.seed, clue=args.clue)
+        elapsed = time.perf_counter() - start
+        results.append(result.to_dict())
+        if not args.json:
+            roles = " ".join(f"{role.value}{count}" for role, count in preset.counts.items())
+            print(f"{preset.preset_id:<16}{result.size:>6}{result.wolf_rate:>12.2%}±{result.margin:.2%}"
+                  f"{result.villager_rate:>12.2%}{result.avg_days:>12.2f}{result.games / elapsed:>13,.0f}  {roles}")
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print("=" * 84)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
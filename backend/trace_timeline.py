@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""狼人杀阶段时间线汇总工具
+
+读取服务端导出的房间时间线（Chrome Trace Event 格式，TRACE_DIR 下的 room_{id}.json，
+或 GET /api/werewolf/room/{room_id}/trace 的返回内容），输出：
+  - 每个房间的状态时间线，以及每个状态内的时间去向
+  - 所有房间汇总：各状态耗时、时间去向（大模型/节奏等待/等待玩家/等待计时/动作计算/引擎开销）、
+    节奏等待按原因、大模型调用按场景
+
+时间去向按优先级归属，同一时刻只算一类：大模型 > 节奏等待 > 等待玩家 > 等待计时 > 动作计算 > 引擎开销。
+
+用法: python trace_timeline.py traces/ [room_x.json ...] [--summary-only]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 时间去向类别（按归属优先级从高到低）
+BUCKETS = [
+    ("ai", "大模型"),
+    ("sleep", "节奏等待"),
+    ("wait_players", "等待玩家"),
+    ("wait_timer", "等待计时"),
+    ("action", "动作计算"),
+]
+ENGINE = ("engine", "引擎开销")
+LABELS = dict(BUCKETS + [ENGINE])
+
+
+def load_traces(paths):
+    files = []
+    for path in paths:
+        p = Path(path)
+        files.extend(sorted(p.glob("*.json")) if p.is_dir() else [p])
+    traces = []
+    for f in files:
+        with open(f, encoding="utf-8") as fp:
+            data = json.load(fp)
+        spans = [e for e in data.get("traceEvents", []) if e.get("ph") == "X"]
+        if spans:
+            traces.append((data.get("otherData", {}), spans))
+    return traces
+
+
+def _bucket(span):
+    cat = span.get("cat")
+    if cat == "wait":
+        return "wait_timer" if span.get("args", {}).get("waiting_on") == "timer" else "wait_players"
+    return cat if cat in LABELS else None
+
+
+def attribute(start, end, children):
+    """把 [start, end) 内的每一段时间归到优先级最高的覆盖类别，返回 {类别: 秒}"""
+    intervals = []
+    for span in children:
+        bucket = _bucket(span)
+        s, e = max(start, span["ts"]), min(end, span["ts"] + span["dur"])
+        if bucket and e > s:
+            intervals.append((s, e, bucket))
+    points = sorted({start, end, *(s for s, _, _ in intervals), *(e for _, e, _ in intervals)})
+    order = {key: i for i, (key, _) in enumerate(BUCKETS)}
+    result = {}
+    for a, b in zip(points, points[1:]):
+        mid = (a + b) / 2
+        covering = [bucket for s, e, bucket in intervals if s <= mid < e]
+        bucket = min(covering, key=order.get) if covering else ENGINE[0]
+        result[bucket] = result.get(bucket, 0) + (b - a)
+    return {k: v / 1e6 for k, v in result.items()}
+
+
+def _format_breakdown(breakdown):
+    parts = []
+    for key, label in BUCKETS + [ENGINE]:
+        seconds = breakdown.get(key, 0)
+        if seconds >= 0.05:
+            parts.append(f"{label} {seconds:.1f}s")
+    return " | ".join(parts)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="狼人杀阶段时间线汇总工具")
+    parser.add_argument("paths", nargs="+", help="时间线文件或目录")
+    parser.add_argument("--summary-only", action="store_true", help="只输出汇总，不打印每个房间的时间线")
+    args = parser.parse_args()
+
+    traces = load_traces(args.paths)
+    if not traces:
+        print("没有找到时间线数据")
+        return 1
+
+    step_totals = {}  # {状态: [次数, 秒]}
+    totals = {}  # {时间去向: 秒}
+    sleep_reasons = {}  # {原因: [次数, 秒]}
+    ai_sites = {}  # {场景: [耗时...]}
+    game_seconds = 0.0
+
+    for meta, spans in traces:
+        spans.sort(key=lambda e: e["ts"])
+        phases = [e for e in spans if e.get("cat") == "phase"]
+        children = [e for e in spans if e.get("cat") != "phase"]
+        if not phases:
+            continue
+        origin = phases[0]["ts"]
+        room_seconds = (phases[-1]["ts"] + phases[-1]["dur"] - origin) / 1e6
+        game_seconds += room_seconds
+        if not args.summary_only:
+            print("=" * 78)
+            print(f"房间 {meta.get('room_id', '?')}（{meta.get('worker', '?')}）- {len(phases)} 个状态，共 {room_seconds:.1f}s")
+            print("-" * 78)
+
+        for phase in phases:
+            phase_args = phase.get("args", {})
+            start, end = phase["ts"], phase["ts"] + phase["dur"]
+            breakdown = attribute(start, end, children)
+            for key, seconds in breakdown.items():
+                totals[key] = totals.get(key, 0) + seconds
+            stat = step_totals.setdefault(phase["name"], [0, 0.0])
+            stat[0] += 1
+            stat[1] += phase["dur"] / 1e6
+            if not args.summary_only:
+                day = f"第{phase_args.get('day')}天/第{phase_args.get('night')}夜" if phase_args.get("day") is not None else ""
+                timeout = " 超时" if phase_args.get("timed_out") else ""
+                print(f"[+{(start - origin) / 1e6:7.1f}s] {phase['name']:<14}{phase['dur'] / 1e6:7.1f}s  {day}{timeout}")
+                detail = _format_breakdown(breakdown)
+                if detail:
+                    print(f"{'':>26}{detail}")
+
+        for span in children:
+            if span.get("cat") == "sleep":
+                stat = sleep_reasons.setdefault(span["name"], [0, 0.0])
+                stat[0] += 1
+                stat[1] += span["dur"] / 1e6
+            elif span.get("cat") == "ai":
+                ai_sites.setdefault(span["name"], []).append(span["dur"] / 1e6)
+
+    print("=" * 78)
+    print(f"汇总：{len(traces)} 个房间，状态时间合计 {game_seconds:.1f}s")
+    print("-" * 78)
+    print(f"{'状态':<16}{'次数':>6}{'合计(s)':>10}{'平均(s)':>10}{'占比':>8}")
+    for step, (count, seconds) in sorted(step_totals.items(), key=lambda kv: -kv[1][1]):
+        share = seconds / game_seconds if game_seconds else 0
+        print(f"{step:<16}{count:>6}{seconds:>10.1f}{seconds / count:>10.2f}{share:>8.1%}")
+    print("-" * 78)
+    print("时间去向：")
+    attributed = sum(totals.values())
+    for key, label in BUCKETS + [ENGINE]:
+        seconds = totals.get(key, 0)
+        share = seconds / attributed if attributed else 0
+        print(f"  {label:<10}{seconds:>10.1f}s{share:>8.1%}")
+    if sleep_reasons:
+        print("-" * 78)
+        print("节奏等待（按原因，含与其他跨度重叠的部分）：")
+        for reason, (count, seconds) in sorted(sleep_reasons.items(), key=lambda kv: -kv[1][1]):
+            print(f"  {reason:<14}{count:>6} 次{seconds:>10.1f}s")
+    if ai_sites:
+        print("-" * 78)
+        print("大模型调用（按场景）：")
+        for site, durations in sorted(ai_sites.items(), key=lambda kv: -sum(kv[1])):
+            print(f"  {site:<14}{len(durations):>6} 次  合计 {sum(durations):>8.1f}s  "
+                  f"平均 {sum(durations) / len(durations):.2f}s  p95 {_percentile(durations, 0.95):.2f}s")
+    print("=" * 78)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,8 +28,15 @@ export const joinWerewolfRoom = (roomId, userId, username) =>
 export const startWerewolfGame = (roomId) => api.post(`/werewolf/room/${roomId}/start`, null, { timeout: 30000 }) // 30秒超时，因为现在使用后台任务，应该很快返回
 export const getWerewolfRoom = (roomId) => api.get(`/werewolf/room/${roomId}`)
 export const addAIPlayer = (roomId) => api.post(`/werewolf/room/${roomId}/add-ai`)
-export const autoFillAIPlayers = (roomId, targetCount = 7) => 
-  api.post(`/werewolf/room/${roomId}/auto-fill-ai`, null, { params: { target_count: targetCount } })
+export const getWerewolfMessages = (roomId, offset = 0, limit = 50) =>
+  api.get(`/werewolf/room/${roomId}/messages`, { params: { offset, limit } })
+export const getWerewolfPrivateMessages = (roomId, userId, offset = 0, limit = 50) =>
+  api.get(`/werewolf/room/${roomId}/private/${userId}`, { params: { offset, limit } })
+export const autoFillAIPlayers = (roomId, targetCount = null) => 
+  api.post(`/werewolf/room/${roomId}/auto-fill-ai`, null, { params: targetCount ? { target_count: targetCount } : {} })
+export const getWerewolfPresets = () => api.get('/werewolf/presets')
+export const setWerewolfPreset = (roomId, presetId) =>
+  api.post(`/werewolf/room/${roomId}/preset`, null, { params: { preset_id: presetId } })
 
 // 真心话大冒险
 export const generateTruthOrDare = (gameResult, playerCount = 2) => 